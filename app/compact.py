@@ -0,0 +1,255 @@
+"""
+InMemoryStore 的紧凑事件表示：存储里不留 pydantic Event，只在 API 边界（get/list）按需还原。
+
+- StringTable   : 字典编码（str -> int code），category / severity / source / fingerprint 这类大量重复的串只存一份
+- EventCodec    : Event <-> (category, severity, source, fingerprint, blob) 的编解码；
+                  其余字段（title / raw / entities / labels / evidence / extra）序列化成 JSON，
+                  用带预置字典（zdict）的 zlib 压缩成一个 bytes（raw.payload 里重复的 host/msg/title 压缩后几乎不占）
+- EventColumns  : 一个时间分片里的事件，按列存（array 存整数列，list 存 id / blob），event_id -> 行号；
+                  覆盖写留墓碑，分片整体过期时一起释放
+"""
+from __future__ import annotations
+
+import json
+import sys
+import threading
+import zlib
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.models import Event
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US = timedelta(microseconds=1)
+
+# 预置字典：事件 JSON 里反复出现的 key / 片段（放在后面的更常用）
+_ZDICT = (
+    b'"entities":[]"labels":[]"evidence":{"logs":[],"metrics":[]}"severity_hint":"INFO"'
+    b'"parsed":{}"tags":[]"kind":"syslog""mask_stats":{"IP":"ingest":"tail_ingest""masked":true'
+    b'"timestamp":"fields":"program":"rsyslog""source":"category":"SYSLOG""fingerprint":"syslog|'
+    b'"meta":{"payload":{"host":"msg":"title":"message":"raw":{'
+)
+
+# 单独成列（字典编码）的字段；其余进 blob
+_COLUMN_FIELDS = {"event_id", "ts", "category", "severity_hint", "source", "fingerprint"}
+
+
+class StringTable:
+    """只增不减的字符串字典：code(s) -> int，get(code) -> s。
+
+    多线程安全：命中不加锁（dict.get / list 下标都是原子的），只有新串分配 code 时加锁（再查一次）。
+    """
+
+    __slots__ = ("_codes", "_strings", "_lock")
+
+    def __init__(self) -> None:
+        self._codes: Dict[str, int] = {}
+        self._strings: List[str] = []
+        self._lock = threading.Lock()
+
+    def code(self, s: str) -> int:
+        c = self._codes.get(s)
+        if c is None:
+            with self._lock:
+                c = self._codes.get(s)
+                if c is None:
+                    # 先 append 再登记 code：别的线程拿到 code 时串一定已经在表里
+                    self._strings.append(sys.intern(s))
+                    c = self._codes[s] = len(self._strings) - 1
+        return c
+
+    def get(self, code: int) -> str:
+        return self._strings[code]
+
+    def strings(self) -> List[str]:
+        """快照用：当前所有串的拷贝（下标 = code）。"""
+        return list(self._strings)
+
+    def restore(self, strings: List[str]) -> None:
+        self._strings = [sys.intern(s) for s in strings]
+        self._codes = {s: i for i, s in enumerate(self._strings)}
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+    def approx_bytes(self) -> int:
+        return sys.getsizeof(self._codes) + sys.getsizeof(self._strings) + sum(sys.getsizeof(s) for s in self._strings)
+
+
+# (category, severity, source, fingerprint, blob)；fingerprint 列 0 = None
+Packed = Tuple[int, int, int, int, bytes]
+
+
+class EventCodec:
+    def __init__(self) -> None:
+        self.categories = StringTable()
+        self.severities = StringTable()
+        self.sources = StringTable()       # source 子对象的 JSON
+        self.fingerprints = StringTable()  # 列里存 code + 1，0 = None（"" 和 None 要区分开）
+
+    # ---------- encode ----------
+    def pack(self, e: Event) -> Packed:
+        blob = _compress(e.model_dump_json(exclude_defaults=True, exclude=_COLUMN_FIELDS).encode("utf-8"))
+        return (
+            self.categories.code(e.category),
+            self.severities.code(e.severity_hint),
+            self.sources.code(e.source.model_dump_json()),
+            0 if e.fingerprint is None else self.fingerprints.code(e.fingerprint) + 1,
+            blob,
+        )
+
+    # ---------- decode ----------
+    def unpack(self, event_id: str, ts: str, packed: Packed, **overrides: Any) -> Event:
+        cat, sev, src, fp, blob = packed
+        d: Dict[str, Any] = json.loads(zlib.decompressobj(zdict=_ZDICT).decompress(blob))
+        d["event_id"] = event_id
+        d["ts"] = ts
+        d["category"] = self.categories.get(cat)
+        d["severity_hint"] = self.severities.get(sev)
+        d["source"] = json.loads(self.sources.get(src))
+        if fp:
+            d["fingerprint"] = self.fingerprints.get(fp - 1)
+        d.update(overrides)
+        return Event.model_validate(d)
+
+    def tables(self) -> Tuple[StringTable, StringTable, StringTable, StringTable]:
+        return self.categories, self.severities, self.sources, self.fingerprints
+
+    def approx_bytes(self) -> int:
+        return sum(t.approx_bytes() for t in self.tables())
+
+
+def ts_micros(ts: str, epoch: float) -> Tuple[int, bool]:
+    """-> (UTC 微秒, 原样 ts 能否由它还原)；不能还原的调用方自己另存原串。"""
+    try:
+        dt = datetime.fromisoformat(ts.strip().replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        us = (dt - _EPOCH) // _US
+    except Exception:
+        return int(epoch * 1_000_000), False
+    return us, iso_from_micros(us) == ts
+
+
+def iso_from_micros(us: int) -> str:
+    return (_EPOCH + us * _US).isoformat()
+
+
+def _compress(data: bytes) -> bytes:
+    c = zlib.compressobj(6, zdict=_ZDICT)
+    return c.compress(data) + c.flush()
+
+
+class EventColumns:
+    """一个分片的列存：行号 = 追加顺序；event_id -> 行号；删除 = 墓碑（ids[row] = None）。"""
+
+    __slots__ = ("codec", "rows", "ids", "ts_us", "cat", "sev", "src", "fp", "blobs", "raw_ts", "live")
+
+    def __init__(self, codec: EventCodec):
+        self.codec = codec
+        self.rows: Dict[str, int] = {}
+        self.ids: List[Optional[str]] = []
+        self.ts_us = array("q")
+        self.cat = array("I")
+        self.sev = array("I")
+        self.src = array("I")
+        self.fp = array("I")
+        self.blobs: List[Optional[bytes]] = []
+        self.raw_ts: Dict[int, str] = {}  # 行号 -> 原样 ts（少数无法还原的）
+        self.live = 0
+
+    def put(self, e: Event, ts_epoch: float) -> None:
+        self.put_packed(e.event_id, e.ts, ts_epoch, self.codec.pack(e))
+
+    def put_packed(self, event_id: str, ts: str, ts_epoch: float, packed: Packed) -> None:
+        """packed = 调用方已经编码好的（InMemoryStore 在锁外编码，锁内只追加列）。"""
+        self.remove(event_id)
+        us, exact = ts_micros(ts, ts_epoch)
+        cat, sev, src, fp, blob = packed
+        row = len(self.ids)
+        self.rows[event_id] = row
+        self.ids.append(event_id)
+        self.ts_us.append(us)
+        self.cat.append(cat)
+        self.sev.append(sev)
+        self.src.append(src)
+        self.fp.append(fp)
+        self.blobs.append(blob)
+        if not exact:
+            self.raw_ts[row] = ts
+        self.live += 1
+
+    def remove(self, event_id: str) -> bool:
+        row = self.rows.pop(event_id, None)
+        if row is None:
+            return False
+        self.ids[row] = None
+        self.blobs[row] = None
+        self.raw_ts.pop(row, None)
+        self.live -= 1
+        return True
+
+    def __contains__(self, event_id: str) -> bool:
+        return event_id in self.rows
+
+    def __len__(self) -> int:
+        return self.live
+
+    def get(self, event_id: str) -> Optional[Event]:
+        row = self.rows.get(event_id)
+        return None if row is None else self.materialize(row)
+
+    def snapshot(self, row: int) -> Tuple[str, str, Packed]:
+        """(event_id, ts, packed)：只拷引用，解码（unpack）可以放到锁外做。"""
+        ts = self.raw_ts.get(row) or iso_from_micros(self.ts_us[row])
+        return self.ids[row], ts, (self.cat[row], self.sev[row], self.src[row], self.fp[row], self.blobs[row])
+
+    def materialize(self, row: int) -> Event:
+        return self.codec.unpack(*self.snapshot(row))
+
+    def iter_rows(self) -> Iterator[Tuple[int, float]]:
+        """活着的 (行号, ts epoch 秒)。"""
+        for row, eid in enumerate(self.ids):
+            if eid is not None:
+                yield row, self.ts_us[row] / 1_000_000
+
+    def ids_live(self) -> Iterator[str]:
+        return iter(self.rows)
+
+    # ---------- snapshot（app/store_journal.py） ----------
+    def state(self) -> Tuple[Any, ...]:
+        """只含活着的行（墓碑顺便压掉）；整数列用 array.tobytes()，都是拷贝，调用方可以在锁外序列化。"""
+        live = [row for row, eid in enumerate(self.ids) if eid is not None]
+        if len(live) == len(self.ids):
+            cols = (self.ts_us, self.cat, self.sev, self.src, self.fp)
+            return (
+                list(self.ids), *(c.tobytes() for c in cols), list(self.blobs), list(self.raw_ts.items()),
+            )
+        remap = {row: i for i, row in enumerate(live)}
+        return (
+            [self.ids[r] for r in live],
+            *(array(c.typecode, (c[r] for r in live)).tobytes() for c in (self.ts_us, self.cat, self.sev, self.src, self.fp)),
+            [self.blobs[r] for r in live],
+            [(remap[r], ts) for r, ts in self.raw_ts.items() if r in remap],
+        )
+
+    @classmethod
+    def from_state(cls, codec: EventCodec, state: Tuple[Any, ...]) -> "EventColumns":
+        ids, ts_us, cat, sev, src, fp, blobs, raw_ts = state
+        cols = cls(codec)
+        cols.ids = list(ids)
+        cols.rows = {eid: row for row, eid in enumerate(cols.ids)}
+        for name, data in zip(("ts_us", "cat", "sev", "src", "fp"), (ts_us, cat, sev, src, fp)):
+            getattr(cols, name).frombytes(data)
+        cols.blobs = list(blobs)
+        cols.raw_ts = dict(raw_ts)
+        cols.live = len(cols.ids)
+        return cols
+
+    def approx_bytes(self) -> int:
+        size = sum(sys.getsizeof(c) for c in (self.rows, self.ids, self.ts_us, self.cat, self.sev, self.src, self.fp, self.blobs))
+        size += sum(sys.getsizeof(i) for i in self.ids if i is not None)
+        size += sum(sys.getsizeof(b) for b in self.blobs if b is not None)
+        size += sum(sys.getsizeof(t) for t in self.raw_ts.values())
+        return size
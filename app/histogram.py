@@ -0,0 +1,104 @@
+"""
+每个聚合（fingerprint）的出现次数直方图：固定大小的环形计数器，按事件时间分桶。
+
+- 分钟环：最近 MINUTE_SLOTS 分钟，每分钟一个计数
+- 小时环：最近 HOUR_SLOTS 小时，每小时一个计数
+- 两个环放在同一个 array('I') 里；每个环只记一个 head（见过的最新桶号），槽位 b % n 在 (head - n, head] 之内才有效。
+  head 往前走时把跨过的槽清零（最多 n 个），所以 add() 摊还 O(1)，不用给每个槽记时间戳
+- 比环窗口还旧的事件（乱序很久才到）只进 count，不进直方图
+
+用途：按速率打分（最近 5 分钟 / 1 小时有多少次，而不是总共多少次）、Web UI 的 sparkline。
+"""
+from __future__ import annotations
+
+import struct
+from array import array
+from typing import Any, Dict, List, Optional
+
+MINUTE_SLOTS = 60
+HOUR_SLOTS = 48
+
+# (偏移, 槽数, 桶宽秒数)
+_RINGS = ((0, MINUTE_SLOTS, 60), (MINUTE_SLOTS, HOUR_SLOTS, 3600))
+_HEADS = struct.Struct("<qq")
+_ZEROS = tuple(array("I", bytes(4 * size)) for _, size, _ in _RINGS)
+
+
+class OccurrenceHistogram:
+    __slots__ = ("counts", "heads")
+
+    def __init__(self) -> None:
+        self.counts = array("I", bytes(4 * (MINUTE_SLOTS + HOUR_SLOTS)))
+        self.heads = [-1, -1]  # 每个环见过的最新桶号；-1 = 还没有
+
+    def add(self, epoch: float, n: int = 1) -> None:
+        counts = self.counts
+        for i, (off, size, width) in enumerate(_RINGS):
+            b = int(epoch // width)
+            head = self.heads[i]
+            if b > head:
+                if head < 0:
+                    pass  # 新建的环本来就全是 0
+                elif b - head >= size:
+                    counts[off:off + size] = _ZEROS[i]  # 跨过整圈：整段清零，不逐槽
+                else:
+                    for k in range(head + 1, b + 1):
+                        counts[off + k % size] = 0
+                self.heads[i] = b
+            elif b <= head - size:
+                continue
+            counts[off + b % size] += n
+
+    def _ring(self, i: int, now: float, buckets: int) -> List[int]:
+        """第 i 个环里，截止到 now 所在桶的最近 buckets 个桶（旧 -> 新）。"""
+        off, size, width = _RINGS[i]
+        head = self.heads[i]
+        nb = int(now // width)
+        return [
+            self.counts[off + b % size] if head - size < b <= head else 0
+            for b in range(nb - buckets + 1, nb + 1)
+        ]
+
+    def count_since(self, seconds: float, now: float) -> int:
+        """最近 seconds 秒（按整桶算）里的次数；<= 1 小时用分钟环，更长用小时环。"""
+        if seconds <= MINUTE_SLOTS * 60:
+            return sum(self._ring(0, now, max(1, min(MINUTE_SLOTS, -(-int(seconds) // 60)))))
+        return sum(self._ring(1, now, max(1, min(HOUR_SLOTS, -(-int(seconds) // 3600)))))
+
+    def series(self, now: float) -> Dict[str, List[int]]:
+        return {"minute": self._ring(0, now, MINUTE_SLOTS), "hour": self._ring(1, now, HOUR_SLOTS)}
+
+    # ---------- 序列化（SqliteStore 存 BLOB） ----------
+    def to_bytes(self) -> bytes:
+        return _HEADS.pack(*self.heads) + self.counts.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "OccurrenceHistogram":
+        # 不走 __init__（那里要先建一个全 0 的数组）：snapshot 恢复时每个聚合都要解一次
+        h = cls.__new__(cls)
+        h.heads = list(_HEADS.unpack_from(data))
+        h.counts = array("I", data[_HEADS.size:])
+        return h
+
+
+def seeded(first_epoch: float, first_count: int = 1) -> OccurrenceHistogram:
+    """第二次出现时才建直方图（只出现过一次的 fingerprint 不占空间）：先补上第一次。"""
+    h = OccurrenceHistogram()
+    h.add(first_epoch, first_count)
+    return h
+
+
+def recent_counts(hist: Optional[OccurrenceHistogram], first_epoch: float, now: float) -> Dict[str, int]:
+    """聚合视图 aggregate 里带的速率字段：last_5m / last_60m。hist 为 None = 只出现过一次（在 first_epoch）。"""
+    if hist is None:
+        hist = seeded(first_epoch)
+    return {"last_5m": hist.count_since(300, now), "last_60m": hist.count_since(3600, now)}
+
+
+def series_payload(hist: Optional[OccurrenceHistogram], first_epoch: float, now: float) -> Dict[str, Any]:
+    if hist is None:
+        hist = seeded(first_epoch)
+    out: Dict[str, Any] = hist.series(now)
+    out["minute_slots"] = MINUTE_SLOTS
+    out["hour_slots"] = HOUR_SLOTS
+    return out
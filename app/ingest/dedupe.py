@@ -0,0 +1,126 @@
+# app/ingest/dedupe.py
+"""
+重试去重：ingester 给每条记录带一个稳定的 record_key（文件 inode + 轮转代号 + 行起始 offset），
+API 用固定内存、按时间窗口滚动的 Bloom filter 判断「这条是不是已经收过」。
+
+- 两代 filter：current + previous。current 用满 window_s 秒（或插入数达到 capacity）就滚动，
+  previous 被丢弃、current 变成 previous —— 一个 key 最多被记住 2*window_s 秒；
+  写入速率不超过 capacity / window_s（默认 1e6 / 900 ≈ 1.1k 条/秒）时至少记住 window_s 秒。
+  超过这个速率会因为容量提前滚动，保证窗口缩短到约 capacity / 速率 秒（计入 stats["capacity_rotations"]，
+  持续出现说明 INGEST_DEDUPE_CAPACITY 该调大）
+- 内存固定：2 * m bits，m 由 capacity / fp_rate 算出；不保存任何 ID 集合
+- 判定 O(k)，k 为哈希次数（默认参数下 ~17）
+- 代价：误判率 ≈ fp_rate（极少数新记录会被当成重复丢掉）；不会漏判保证窗口内的真实重复
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+
+class RotatingBloomFilter:
+    def __init__(
+        self,
+        capacity: int = 1_000_000,
+        fp_rate: float = 1e-5,
+        window_s: float = 900.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.capacity = max(1, int(capacity))
+        self.fp_rate = min(max(fp_rate, 1e-12), 0.5)
+        self.window_s = float(window_s)
+        self._clock = clock
+
+        self.m = max(64, int(math.ceil(-self.capacity * math.log(self.fp_rate) / (math.log(2) ** 2))))
+        self.k = max(1, int(round(self.m / self.capacity * math.log(2))))
+        nbytes = (self.m + 7) // 8
+        self._current = bytearray(nbytes)
+        self._previous = bytearray(nbytes)
+        self._current_count = 0
+        self._started = clock()
+        self._lock = threading.Lock()
+
+        self.stats: Dict[str, int] = {"checked": 0, "duplicates": 0, "added": 0, "rotations": 0, "capacity_rotations": 0}
+
+    # ---------- internals ----------
+    def _positions(self, key: str) -> List[int]:
+        # double hashing：h1 + i*h2（Kirsch–Mitzenmacher）
+        d = hashlib.blake2b(key.encode("utf-8", errors="replace"), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        m = self.m
+        return [(h1 + i * h2) % m for i in range(self.k)]
+
+    @staticmethod
+    def _has(bits: bytearray, pos: List[int]) -> bool:
+        for p in pos:
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    def _maybe_rotate(self) -> None:
+        now = self._clock()
+        if now - self._started < self.window_s and self._current_count < self.capacity:
+            return
+        # 超过两个窗口没写入：previous 也已过期，一起清掉
+        expired_both = now - self._started >= 2 * self.window_s
+        self._previous = bytearray(len(self._current)) if expired_both else self._current
+        self._current = bytearray(len(self._previous))
+        self._current_count = 0
+        if now - self._started < self.window_s:
+            self.stats["capacity_rotations"] += 1  # 窗口没用满就装满了：这一代记住的时间短于 window_s
+        self._started = now
+        self.stats["rotations"] += 1
+
+    def _add(self, pos: List[int]) -> None:
+        bits = self._current
+        for p in pos:
+            bits[p >> 3] |= 1 << (p & 7)
+        self._current_count += 1
+        self.stats["added"] += 1
+
+    # ---------- public ----------
+    def contains(self, key: str) -> bool:
+        pos = self._positions(key)
+        with self._lock:
+            self._maybe_rotate()
+            self.stats["checked"] += 1
+            hit = self._has(self._current, pos) or self._has(self._previous, pos)
+            if hit:
+                self.stats["duplicates"] += 1
+            return hit
+
+    def add(self, key: str) -> None:
+        pos = self._positions(key)
+        with self._lock:
+            self._maybe_rotate()
+            self._add(pos)
+
+    def seen_or_add(self, key: str) -> bool:
+        """原子地「判重 + 登记」：已见过返回 True，否则登记并返回 False。"""
+        pos = self._positions(key)
+        with self._lock:
+            self._maybe_rotate()
+            self.stats["checked"] += 1
+            if self._has(self._current, pos) or self._has(self._previous, pos):
+                self.stats["duplicates"] += 1
+                return True
+            self._add(pos)
+            return False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self.stats)
+            out.update({
+                "capacity": self.capacity,
+                "fp_rate": self.fp_rate,
+                "window_s": self.window_s,
+                "bits": self.m,
+                "hashes": self.k,
+                "memory_bytes": len(self._current) + len(self._previous),
+                "current_fill": self._current_count,
+            })
+        return out
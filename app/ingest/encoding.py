@@ -0,0 +1,185 @@
+# app/ingest/encoding.py
+"""
+ingest 接口的压缩请求体：Content-Encoding: gzip / deflate。
+
+ASGI 中间件，在 receive() 上做流式解压，路由代码（req.json() / req.body() / req.stream()、
+FastAPI 的 body 模型解析）看到的都是解压后的明文，不需要逐个接口改。
+
+- 流式：每次最多吐出 chunk 字节明文，输入没消费完的部分留到下一次 receive()，内存不随压缩比放大
+- 上限：解压后总字节数超过 max_bytes（/stream 接口用 stream_max_bytes）直接 413，防 zip bomb
+- deflate：按 RFC 是 zlib 格式，兼容部分客户端发的 raw deflate（首块解不开时自动切换）
+- gzip 多 member 拼接（cat a.gz b.gz）也能解
+- 不支持的编码 415；坏数据/截断 400
+- 统计：按编码（identity/gzip/deflate/unsupported）记 请求数、线上字节、解压后字节、解压耗时、错误数
+"""
+from __future__ import annotations
+
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+SUPPORTED = ("gzip", "x-gzip", "deflate")
+
+
+class WireStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_enc: Dict[str, Dict[str, float]] = {}
+
+    def add(self, enc: str, **delta: float) -> None:
+        with self._lock:
+            row = self._by_enc.setdefault(enc, {
+                "requests": 0, "wire_bytes": 0, "body_bytes": 0,
+                "decompress_ms": 0.0, "errors": 0, "too_large": 0,
+            })
+            for k, v in delta.items():
+                row[k] += v
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {}
+            for enc, row in self._by_enc.items():
+                r = dict(row)
+                r["decompress_ms"] = round(r["decompress_ms"], 2)
+                r["ratio"] = round(r["body_bytes"] / r["wire_bytes"], 2) if r["wire_bytes"] else None
+                out[enc] = r
+        return out
+
+
+class _Inflater:
+    def __init__(self, receive, enc: str, max_bytes: int, chunk: int, stats: WireStats):
+        self._receive = receive
+        self.enc = "gzip" if enc == "x-gzip" else enc
+        self.max_bytes = max_bytes
+        self.chunk = chunk
+        self.stats = stats
+
+        self._raw = False                 # deflate 回退到 raw 模式
+        self._d = self._new()
+        self._buf = b""                   # 还没喂给解压器的输入
+        self._upstream_done = False
+        self._done = False
+        self._total = 0
+        self._wire = 0
+
+    def _new(self):
+        if self.enc == "gzip":
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        return zlib.decompressobj(-zlib.MAX_WBITS if self._raw else zlib.MAX_WBITS)
+
+    def _fail(self, status: int, detail: str, counter: str = "errors"):
+        self.stats.add(self.enc, **{counter: 1})
+        self._done = True
+        raise HTTPException(status_code=status, detail=detail)
+
+    def _inflate(self) -> bytes:
+        t0 = time.perf_counter()
+        src = self._buf
+        try:
+            out = self._d.decompress(src, self.chunk)
+        except zlib.error as ex:
+            if self.enc == "deflate" and not self._raw and self._total == 0:
+                self._raw = True
+                self._d = self._new()
+                out = self._d.decompress(src, self.chunk) if src else b""
+            else:
+                self._fail(400, f"invalid {self.enc} body: {ex}")
+        d = self._d
+        self._buf = d.unconsumed_tail
+        if d.eof and d.unused_data:
+            # 多 member gzip：剩下的输入交给新的解压器
+            self._buf = d.unused_data + self._buf
+            self._d = self._new()
+        self.stats.add(self.enc, decompress_ms=(time.perf_counter() - t0) * 1000.0, body_bytes=len(out))
+        return out
+
+    async def receive(self) -> Dict[str, Any]:
+        if self._done:
+            return await self._receive()
+        while True:
+            if not self._buf:
+                if self._upstream_done:
+                    if self._wire and not self._d.eof:
+                        self._fail(400, f"truncated {self.enc} body")
+                    self._done = True
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                msg = await self._receive()
+                if msg["type"] != "http.request":
+                    return msg
+                self._buf = msg.get("body", b"")
+                self._upstream_done = not msg.get("more_body", False)
+                self._wire += len(self._buf)
+                self.stats.add(self.enc, wire_bytes=len(self._buf))
+                if not self._buf:
+                    continue
+            try:
+                out = self._inflate()
+            except zlib.error as ex:
+                self._fail(400, f"invalid {self.enc} body: {ex}")
+            if not out:
+                continue
+            self._total += len(out)
+            if self._total > self.max_bytes:
+                self._fail(413, f"decompressed body exceeds {self.max_bytes} bytes", "too_large")
+            return {"type": "http.request", "body": out, "more_body": True}
+
+
+class DecompressMiddleware:
+    def __init__(
+        self,
+        app,
+        *,
+        prefixes: Iterable[str],
+        max_bytes: int = 64 * 1024 * 1024,
+        stream_max_bytes: int = 4 * 1024 * 1024 * 1024,
+        chunk: int = 1024 * 1024,
+        stats: Optional[WireStats] = None,
+    ):
+        self.app = app
+        self.prefixes = tuple(prefixes)
+        self.max_bytes = max_bytes
+        self.stream_max_bytes = stream_max_bytes
+        self.chunk = chunk
+        self.stats = stats if stats is not None else WireStats()
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("POST", "PUT")
+            or not scope["path"].startswith(self.prefixes)
+        ):
+            return await self.app(scope, receive, send)
+
+        enc = ""
+        for k, v in scope["headers"]:
+            if k == b"content-encoding":
+                enc = v.decode("latin-1").strip().lower()
+                break
+
+        if enc in ("", "identity"):
+            self.stats.add("identity", requests=1)
+
+            async def counted():
+                msg = await receive()
+                if msg["type"] == "http.request":
+                    n = len(msg.get("body", b""))
+                    self.stats.add("identity", wire_bytes=n, body_bytes=n)
+                return msg
+
+            return await self.app(scope, counted, send)
+
+        if enc not in SUPPORTED:
+            self.stats.add("unsupported", requests=1, errors=1)
+            resp = JSONResponse(status_code=415, content={"detail": f"unsupported Content-Encoding: {enc}"})
+            return await resp(scope, receive, send)
+
+        cap = self.stream_max_bytes if scope["path"].endswith("/stream") else self.max_bytes
+        inflater = _Inflater(receive, enc, cap, self.chunk, self.stats)
+        self.stats.add(inflater.enc, requests=1)
+        # 下游看到的是明文：去掉 content-encoding / content-length
+        headers = [(k, v) for k, v in scope["headers"] if k not in (b"content-encoding", b"content-length")]
+        return await self.app(dict(scope, headers=headers), inflater.receive, send)
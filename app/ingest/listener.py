@@ -0,0 +1,481 @@
+# app/ingest/listener.py
+"""
+进程内 syslog 接收器（asyncio，UDP + TCP）。
+
+    设备 --syslog--> SyslogListener --records--> sink(records)
+
+- UDP：一个 datagram = 一条消息
+- TCP：RFC6587 octet-counting（"123 <PRI>..."）或按 LF 分帧（non-transparent framing）
+- 头部解析直接在 bytes 上做（RFC5424 / RFC3164），只有真正要出进程的字段才 decode
+
+records 的结构与 /api/ingest/syslog 的 payload 一致（timestamp/host/program/msg/meta），
+所以 sink 可以直接复用 API 的 脱敏 -> parse_syslog -> store.upsert_events 流水线。
+
+丢弃计数（stats）：
+  - dropped_pending : 应用层待处理缓冲已满（> max_pending）时丢弃的条数；
+                      异步 sink 同时在跑的批次达到 max_inflight 时不再 flush，新消息先留在缓冲里，
+                      下游（例如 sidecar 的 HTTP sink）持续跟不上时最终在这里计数丢弃，内存不会无限增长
+  - dropped_sink    : sink 明确拒收的条数（例如下游 ingest 队列已满）
+  - parse_errors    : 无法解析成消息的帧（空帧/超长帧/非法 octet count）
+  - kernel_drops    : Linux 下 /proc/net/udp[6] 里该端口 socket 的 drops 列（内核收包缓冲溢出）
+吞吐主要受 sink 里脱敏/解析的开销限制；头部解析本身是纯 bytes 切片。
+单核各级吞吐（只解析 / listener 收包攒批 / 加上脱敏建 Event / 加上写 store）：python -m tools.bench_listener
+
+用法：
+  1) API 进程内：设置 SYSLOG_UDP_LISTEN=0.0.0.0:5514 / SYSLOG_TCP_LISTEN=0.0.0.0:5514（见 app/main.py）
+  2) sidecar：python -m app.ingest.listener --udp 0.0.0.0:5514 --api http://127.0.0.1:8000/api/ingest/syslog/batch
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import socket
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+Record = Dict[str, Any]
+Sink = Callable[[List[Record]], Union[Optional[int], Awaitable[Optional[int]]]]
+
+MAX_FRAME = 64 * 1024
+
+_SEVERITY = ("emerg", "alert", "crit", "err", "warning", "notice", "info", "debug")
+
+
+def _utc_now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _parse_addr(s: str) -> Tuple[str, int]:
+    host, _, port = s.rpartition(":")
+    return (host or "0.0.0.0"), int(port)
+
+
+def _d(b: bytes) -> str:
+    return b.decode("utf-8", errors="replace")
+
+
+# =========================================================
+# header parsing (bytes)
+# =========================================================
+
+def _split_pri(data: bytes) -> Tuple[Optional[int], bytes]:
+    # <PRI> 最多 3 位数字
+    if data[:1] != b"<":
+        return None, data
+    end = data.find(b">", 1, 5)
+    if end < 0 or not data[1:end].isdigit():
+        return None, data
+    return int(data[1:end]), data[end + 1:]
+
+
+def _skip_sd(rest: bytes) -> Tuple[bytes, bytes]:
+    """RFC5424 STRUCTURED-DATA：'-' 或若干 [id k="v" ...]（值里可有空格/转义的 ] 和 "）。"""
+    if rest[:1] == b"-":
+        return b"-", rest[2:] if rest[1:2] == b" " else rest[1:]
+    i = 0
+    n = len(rest)
+    while i < n and rest[i:i + 1] == b"[":
+        in_quote = False
+        i += 1
+        while i < n:
+            c = rest[i:i + 1]
+            if c == b"\\":
+                i += 2
+                continue
+            if c == b'"':
+                in_quote = not in_quote
+            elif c == b"]" and not in_quote:
+                i += 1
+                break
+            i += 1
+    sd = rest[:i]
+    rest = rest[i:]
+    if rest[:1] == b" ":
+        rest = rest[1:]
+    return sd, rest
+
+
+def _parse_5424(body: bytes) -> Optional[Record]:
+    # VERSION SP TIMESTAMP SP HOSTNAME SP APP-NAME SP PROCID SP MSGID SP SD [SP MSG]
+    parts = body.split(b" ", 6)
+    if len(parts) < 7:
+        return None
+    _ver, ts, host, app, procid, msgid, rest = parts
+    sd, msg = _skip_sd(rest)
+    if msg[:3] == b"\xef\xbb\xbf":  # BOM
+        msg = msg[3:]
+    rec: Record = {
+        "timestamp": _d(ts) if ts != b"-" else _utc_now_iso(),
+        "host": _d(host) if host != b"-" else "unknown",
+        "program": _d(app) if app != b"-" else "syslog",
+        "msg": _d(msg),
+    }
+    if procid != b"-":
+        rec["procid"] = _d(procid)
+    if msgid != b"-":
+        rec["msgid"] = _d(msgid)
+    if sd != b"-":
+        rec["structured_data"] = _d(sd)
+    return rec
+
+
+def _is_tag(tag: bytes) -> bool:
+    # 普通 TAG：字母数字 . _ - /；"%%10L2MGNT/5/..." 这类厂商助记符不拆，整段留在 msg 里
+    return bool(tag) and tag[:1] != b"%" and tag.replace(b"-", b"").replace(b"_", b"").replace(b".", b"").replace(b"/", b"").isalnum()
+
+
+def _parse_3164(body: bytes) -> Record:
+    # Mmm dd hh:mm:ss[:ms] [YYYY] HOST TAG[pid]: MSG
+    # RFC3164 没有年份/时区，timestamp 统一用接收时间（与 tail_ingest 行为一致）
+    rest = body
+    if len(body) >= 16 and body[3:4] == b" " and body[6:7] == b" " and body[9:10] == b":":
+        rest = body[15:]
+        if rest[:1] == b":":  # H3C 毫秒 ":336"
+            sp = rest.find(b" ")
+            rest = rest[sp:] if sp > 0 else b""
+        rest = rest.lstrip(b" ")
+        if len(rest) > 5 and rest[:4].isdigit() and rest[4:5] == b" ":
+            rest = rest[5:]
+
+    host = b"unknown"
+    sp = rest.find(b" ")
+    if sp > 0:
+        host, rest = rest[:sp], rest[sp + 1:].lstrip(b" ")
+
+    program = b"syslog"
+    colon = rest.find(b":")
+    if 0 < colon <= 64:
+        tag = rest[:colon]
+        br = tag.find(b"[")
+        if br > 0:
+            tag = tag[:br]
+        if _is_tag(tag):
+            program = tag
+            rest = rest[colon + 1:].lstrip(b" ")
+
+    return {"timestamp": _utc_now_iso(), "host": _d(host), "program": _d(program), "msg": _d(rest)}
+
+
+def parse_frame(data: bytes) -> Optional[Record]:
+    """
+    一帧 syslog（不含 TCP 分帧）-> record；无法识别时返回 None。
+    record 额外带 meta.facility / meta.severity（有 PRI 时）。
+    """
+    data = data.rstrip(b"\r\n\x00")
+    if not data:
+        return None
+
+    pri, body = _split_pri(data)
+
+    rec: Optional[Record] = None
+    if pri is not None and body[:2] == b"1 ":
+        rec = _parse_5424(body)
+    if rec is None:
+        rec = _parse_3164(body)
+
+    meta: Dict[str, Any] = {"ingest": "listener"}
+    if pri is not None:
+        meta["facility"] = pri >> 3
+        meta["severity"] = _SEVERITY[pri & 7]
+    rec["meta"] = meta
+    return rec
+
+
+# =========================================================
+# kernel drop counter (Linux)
+# =========================================================
+
+def _udp_kernel_drops(port: int) -> Optional[int]:
+    total = None
+    hex_port = f"{port:04X}"
+    for path in ("/proc/net/udp", "/proc/net/udp6"):
+        try:
+            with open(path, "r", encoding="ascii") as f:
+                next(f, None)
+                for line in f:
+                    cols = line.split()
+                    if len(cols) >= 13 and cols[1].endswith(":" + hex_port):
+                        total = (total or 0) + int(cols[-1])
+        except Exception:
+            continue
+    return total
+
+
+# =========================================================
+# listener
+# =========================================================
+
+class SyslogListener:
+    """
+    收包 -> 解析 -> 攒批 -> sink(records)。
+
+    sink 可以是普通函数或协程函数；返回 int 时表示实际接收的条数（其余计入 dropped_sink）。
+    flush_interval 秒内收到的消息合并成一批交给 sink（满 flush_size 条立即 flush）。
+    协程 sink 最多 max_inflight 个批次同时在跑；满了就等其中一个完成再 flush（积压受 max_pending 约束）。
+    """
+
+    def __init__(
+        self,
+        sink: Sink,
+        *,
+        max_pending: int = 10000,
+        flush_size: int = 500,
+        flush_interval: float = 0.005,
+        rcvbuf: int = 0,
+        max_inflight: int = 4,
+    ):
+        self.sink = sink
+        self.max_inflight = max(1, max_inflight)
+        self.max_pending = max_pending
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.rcvbuf = rcvbuf
+
+        self.stats: Dict[str, int] = {
+            "received": 0,
+            "bytes": 0,
+            "delivered": 0,
+            "batches": 0,
+            "parse_errors": 0,
+            "dropped_pending": 0,
+            "dropped_sink": 0,
+        }
+
+        self._pending: List[Record] = []
+        self._flush_scheduled = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._udp_transport: Optional[asyncio.DatagramTransport] = None
+        self._tcp_server: Optional[asyncio.AbstractServer] = None
+        self._udp_port: Optional[int] = None
+        self._tasks: set = set()
+
+    # ---------- lifecycle ----------
+    async def start(self, udp: Optional[str] = None, tcp: Optional[str] = None) -> None:
+        self._loop = asyncio.get_running_loop()
+        if udp:
+            host, port = _parse_addr(udp)
+            self._udp_transport, _ = await self._loop.create_datagram_endpoint(
+                lambda: _UDPProtocol(self), local_addr=(host, port)
+            )
+            sock = self._udp_transport.get_extra_info("socket")
+            if sock is not None:
+                if self.rcvbuf:
+                    try:
+                        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+                    except OSError:
+                        pass
+                self._udp_port = sock.getsockname()[1]
+            print(f"[syslog_listener] udp listening on {udp}")
+        if tcp:
+            host, port = _parse_addr(tcp)
+            self._tcp_server = await self._loop.create_server(lambda: _TCPProtocol(self), host, port)
+            print(f"[syslog_listener] tcp listening on {tcp}")
+
+    async def stop(self) -> None:
+        if self._udp_transport is not None:
+            self._udp_transport.close()
+            self._udp_transport = None
+        if self._tcp_server is not None:
+            self._tcp_server.close()
+            await self._tcp_server.wait_closed()
+            self._tcp_server = None
+        # 缓冲里可能还有因为 max_inflight 没发出去的：发完、等完为止
+        self._flush()
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+            self._flush()
+
+    def snapshot(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = dict(self.stats)
+        out["pending"] = len(self._pending)
+        out["inflight"] = len(self._tasks)
+        if self._udp_port is not None:
+            out["kernel_drops"] = _udp_kernel_drops(self._udp_port)
+        return out
+
+    # ---------- data path ----------
+    def feed(self, frame: bytes) -> None:
+        self.stats["received"] += 1
+        self.stats["bytes"] += len(frame)
+
+        if len(self._pending) >= self.max_pending:
+            self.stats["dropped_pending"] += 1
+            return
+
+        rec = parse_frame(frame) if len(frame) <= MAX_FRAME else None
+        if rec is None:
+            self.stats["parse_errors"] += 1
+            return
+
+        self._pending.append(rec)
+        if len(self._pending) >= self.flush_size:
+            self._flush()
+        elif not self._flush_scheduled and self._loop is not None:
+            self._flush_scheduled = True
+            self._loop.call_later(self.flush_interval, self._flush)
+
+    def _flush(self) -> None:
+        self._flush_scheduled = False
+        if not self._pending or len(self._tasks) >= self.max_inflight:
+            # 满了：留在缓冲里，等某个 sink 批次完成时（_on_sink_done）再 flush
+            return
+        batch, self._pending = self._pending, []
+        self.stats["batches"] += 1
+        try:
+            res = self.sink(batch)
+        except Exception as ex:
+            self.stats["dropped_sink"] += len(batch)
+            print(f"[syslog_listener] sink error: {ex}")
+            return
+
+        if inspect.isawaitable(res):
+            task = asyncio.ensure_future(res)
+            self._tasks.add(task)
+            task.add_done_callback(lambda t, n=len(batch): self._on_sink_done(t, n))
+            return
+        self._account(res, len(batch))
+
+    def _on_sink_done(self, task: asyncio.Future, n: int) -> None:
+        self._tasks.discard(task)
+        if task.cancelled() or task.exception() is not None:
+            self.stats["dropped_sink"] += n
+        else:
+            self._account(task.result(), n)
+        if self._pending and not self._flush_scheduled:
+            self._flush()
+
+    def _account(self, accepted: Optional[int], n: int) -> None:
+        ok = n if accepted is None else max(0, min(int(accepted), n))
+        self.stats["delivered"] += ok
+        self.stats["dropped_sink"] += n - ok
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+    def __init__(self, listener: SyslogListener):
+        self.listener = listener
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.listener.feed(data)
+
+
+class _TCPProtocol(asyncio.Protocol):
+    """RFC6587：首字节是数字 => octet-counting；否则按 LF 分帧。"""
+
+    def __init__(self, listener: SyslogListener):
+        self.listener = listener
+        self._buf = bytearray()
+        self._transport: Optional[asyncio.Transport] = None
+
+    def connection_made(self, transport) -> None:
+        self._transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        buf = self._buf
+        buf += data
+        while buf:
+            if buf[:1].isdigit():
+                sp = buf.find(b" ", 0, 10)
+                if sp < 0:
+                    if len(buf) >= 10:
+                        self._bad_frame()
+                    return
+                if not buf[:sp].isdigit():
+                    self._bad_frame()
+                    return
+                n = int(buf[:sp])
+                if n > MAX_FRAME:
+                    self._bad_frame()
+                    return
+                if len(buf) < sp + 1 + n:
+                    return
+                frame = bytes(buf[sp + 1:sp + 1 + n])
+                del buf[:sp + 1 + n]
+            else:
+                nl = buf.find(b"\n")
+                if nl < 0:
+                    if len(buf) > MAX_FRAME:
+                        self._bad_frame()
+                    return
+                frame = bytes(buf[:nl])
+                del buf[:nl + 1]
+            if frame.strip():
+                self.listener.feed(frame)
+
+    def _bad_frame(self) -> None:
+        # 分帧已经错位，无法恢复：丢弃缓冲并断开
+        self.listener.stats["parse_errors"] += 1
+        self._buf.clear()
+        if self._transport is not None:
+            self._transport.close()
+
+    def eof_received(self):
+        if self._buf.strip():
+            self.listener.feed(bytes(self._buf))
+        self._buf.clear()
+        return False
+
+
+# =========================================================
+# sidecar：收到的记录转发到 /api/ingest/syslog/batch
+# =========================================================
+
+def _http_sink(api_url: str, timeout: float) -> Sink:
+    import requests
+
+    session = requests.Session()
+
+    def post(records: List[Record]) -> int:
+        r = session.post(
+            api_url,
+            headers={"Content-Type": "application/json"},
+            data=json.dumps(records, ensure_ascii=False),
+            timeout=timeout,
+        )
+        r.raise_for_status()
+        return int(r.json().get("accepted", len(records)))
+
+    async def sink(records: List[Record]) -> int:
+        return await asyncio.to_thread(post, records)
+
+    return sink
+
+
+async def _run_sidecar(args: argparse.Namespace) -> None:
+    listener = SyslogListener(
+        _http_sink(args.api, args.timeout),
+        max_pending=args.max_pending,
+        flush_size=args.flush_size,
+        rcvbuf=args.rcvbuf,
+        max_inflight=args.max_inflight,
+    )
+    await listener.start(udp=args.udp, tcp=args.tcp)
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"[syslog_listener] stats {json.dumps(listener.snapshot())}")
+    finally:
+        await listener.stop()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Ops Copilot syslog listener (sidecar mode)")
+    ap.add_argument("--udp", default=os.environ.get("SYSLOG_UDP_LISTEN") or None)
+    ap.add_argument("--tcp", default=os.environ.get("SYSLOG_TCP_LISTEN") or None)
+    ap.add_argument("--api", default=os.environ.get("OPS_EVENT_BATCH_API", "http://127.0.0.1:8000/api/ingest/syslog/batch"))
+    ap.add_argument("--timeout", type=float, default=float(os.environ.get("INGEST_HTTP_TIMEOUT", "3")))
+    ap.add_argument("--max-pending", type=int, default=int(os.environ.get("SYSLOG_LISTEN_MAX_PENDING", "10000")))
+    ap.add_argument("--flush-size", type=int, default=int(os.environ.get("SYSLOG_LISTEN_FLUSH_SIZE", "500")))
+    ap.add_argument("--rcvbuf", type=int, default=int(os.environ.get("SYSLOG_LISTEN_RCVBUF", "0")))
+    ap.add_argument("--max-inflight", type=int, default=int(os.environ.get("SYSLOG_LISTEN_MAX_INFLIGHT", "4")),
+                    help="同时在发的 sink 批次上限；满了新消息留在缓冲里（超过 --max-pending 丢弃计数）")
+    args = ap.parse_args()
+    if not args.udp and not args.tcp:
+        ap.error("need --udp and/or --tcp (or SYSLOG_UDP_LISTEN / SYSLOG_TCP_LISTEN)")
+    asyncio.run(_run_sidecar(args))
+
+
+if __name__ == "__main__":
+    main()
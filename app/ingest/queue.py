@@ -0,0 +1,152 @@
+# app/ingest/queue.py
+"""
+进程内 ingest 队列：接口只负责入队（202），由 worker 池异步完成 脱敏/解析/upsert。
+
+    handler --submit(job)--> [bounded queue] --worker--> job.prepare() (线程池) --> job.commit() (event loop)
+
+- prepare：CPU 密集部分（正则脱敏、parse_syslog、构造 Event），放到线程里跑，不卡 event loop
+- commit ：store 写入，默认回到 event loop 上执行（内存 store 写一批是微秒级）；
+           commit_in_thread=True 时也放到线程里（SqliteStore：BEGIN IMMEDIATE 可能要等别的 worker 进程的写锁，
+           最多 busy_timeout 秒，不能卡住 event loop 上的 /api/focus 等请求）
+- 容量按「记录条数」计，而不是 job 数：一个 batch job 可能有几百条
+- 队列满：submit 返回 False，接口层返回 429 + Retry-After
+- 关闭：stop() 先等队列排空（最多 drain_timeout 秒），再取消 worker
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+
+@dataclass
+class IngestJob:
+    prepare: Callable[[], Any]          # 线程里执行，返回值交给 commit
+    commit: Callable[[Any], Any]        # event loop（或 commit_in_thread 时线程）上执行；返回 int 时表示成功条数
+    records: int = 1
+    kind: str = "syslog"
+    skipped: int = 0                    # prepare 阶段判为重复而跳过的条数（不算失败）
+    failed: int = 0                     # prepare 阶段构造失败（坏数据 / 脱敏、解析抛异常）而丢掉的条数
+    error: Optional[str] = None         # 这些失败里的第一条错误
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class IngestQueue:
+    def __init__(self, max_records: int = 50000, workers: int = 2, retry_after_s: int = 1, commit_in_thread: bool = False):
+        self.max_records = max_records
+        self.commit_in_thread = commit_in_thread
+        self.workers = max(1, workers)
+        self.retry_after_s = max(1, retry_after_s)
+
+        self._q: "asyncio.Queue[IngestJob]" = asyncio.Queue()
+        self._pending_records = 0
+        self._tasks: List[asyncio.Task] = []
+        self._closing = False
+
+        self._stats: Dict[str, Any] = {
+            "enqueued_jobs": 0,
+            "enqueued_records": 0,
+            "processed_jobs": 0,
+            "processed_records": 0,
+            "dropped_records": 0,     # 因队列满被拒绝
+            "failed_jobs": 0,         # prepare/commit 抛异常
+            "failed_records": 0,      # 单条记录构造失败（坏数据）
+            "duplicate_records": 0,   # 重试/重发的重复记录（被去重跳过）
+            "wait_ms_avg": 0.0,       # 入队 -> 开始处理（EWMA）
+            "wait_ms_max": 0.0,
+            "last_error": None,
+        }
+        self._rate_records_s = 0.0    # 处理速率（EWMA），用来估算 Retry-After
+
+    # ---------- lifecycle ----------
+    def start(self) -> None:
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(), name=f"ingest-worker-{i}"))
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._q.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"[ingest_queue] drain timeout, {self._pending_records} records left in queue")
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ---------- producer ----------
+    def submit(self, job: IngestJob) -> bool:
+        """非阻塞入队；满了返回 False（调用方负责 429）。空队列时超大 batch 也放行，避免永远进不来。"""
+        n = max(1, int(job.records))
+        if not self.can_accept(n):
+            self._stats["dropped_records"] += n
+            return False
+        job.enqueued_at = time.monotonic()
+        self._pending_records += n
+        self._stats["enqueued_jobs"] += 1
+        self._stats["enqueued_records"] += n
+        self._q.put_nowait(job)
+        return True
+
+    def can_accept(self, records: int) -> bool:
+        """多个 job 要么全进要么全不进时，先用它探一下容量。"""
+        if self._closing:
+            return False
+        return not self._pending_records or self._pending_records + records <= self.max_records
+
+    def retry_after(self) -> int:
+        """按当前积压 / 处理速率估算多久后再试（秒）。"""
+        if self._rate_records_s <= 0:
+            return self.retry_after_s
+        est = math.ceil(self._pending_records / self._rate_records_s)
+        return int(min(max(est, self.retry_after_s), 60))
+
+    def snapshot(self) -> Dict[str, Any]:
+        out = dict(self._stats)
+        out["depth_jobs"] = self._q.qsize()
+        out["depth_records"] = self._pending_records
+        out["max_records"] = self.max_records
+        out["workers"] = self.workers
+        out["rate_records_s"] = round(self._rate_records_s, 1)
+        out["wait_ms_avg"] = round(out["wait_ms_avg"], 2)
+        out["wait_ms_max"] = round(out["wait_ms_max"], 2)
+        return out
+
+    # ---------- consumer ----------
+    async def _worker(self) -> None:
+        while True:
+            job = await self._q.get()
+            n = max(1, int(job.records))
+            t0 = time.monotonic()
+            wait_ms = (t0 - job.enqueued_at) * 1000.0
+            st = self._stats
+            st["wait_ms_avg"] = wait_ms if not st["processed_jobs"] else st["wait_ms_avg"] * 0.9 + wait_ms * 0.1
+            st["wait_ms_max"] = max(st["wait_ms_max"], wait_ms)
+            try:
+                prepared = await asyncio.to_thread(job.prepare)
+                if self.commit_in_thread:
+                    accepted = await asyncio.to_thread(job.commit, prepared)
+                else:
+                    accepted = job.commit(prepared)
+                st["duplicate_records"] += job.skipped
+                st["failed_records"] += job.failed
+                if job.error is not None:
+                    st["last_error"] = f"{job.kind}: {job.error}"
+                if isinstance(accepted, int):
+                    # commit 自己丢掉的（prepare 之外的失败）
+                    st["failed_records"] += max(0, n - accepted - job.skipped - job.failed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                st["failed_jobs"] += 1
+                st["last_error"] = f"{job.kind}: {ex}"
+            finally:
+                self._pending_records -= n
+                st["processed_jobs"] += 1
+                st["processed_records"] += n
+                dt = max(time.monotonic() - t0, 1e-6)
+                rate = n / dt * self.workers
+                self._rate_records_s = rate if not self._rate_records_s else self._rate_records_s * 0.8 + rate * 0.2
+                self._q.task_done()
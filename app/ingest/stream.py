@@ -0,0 +1,306 @@
+# app/ingest/stream.py
+"""
+ingester -> API 的长连接流式传输（Unix domain socket 或 TCP），给同机部署的 tail_ingest 用。
+
+帧格式（大端）：
+    +---------+------+---------+----------------+
+    | len u32 | type | seq u64 | payload (len)  |
+    +---------+------+---------+----------------+
+  type: 0x01 syslog 记录 / 0x02 evidence 记录（payload = 紧凑 JSON，字段同 HTTP 单条接口）
+        0x10 ACK（服务端 -> 客户端，seq = 已接收的最大连续 seq，累计确认，payload 为空）
+
+- 客户端流水线发送，最多 window 帧未确认；服务端每处理完一批就回一个累计 ACK
+- 连接断开后客户端重连，把未确认的帧按新 seq 重发（at-least-once；payload 带 record_key 时 API 侧按 key 去重）
+- 服务端下游（ingest 队列）满时暂停读 socket，靠内核缓冲/TCP 窗口把背压传回客户端
+
+服务端（asyncio）在 API 进程内运行：STREAM_LISTEN=unix:data/ingest.sock 或 tcp:127.0.0.1:8765
+客户端 StreamClient 是阻塞实现（只依赖标准库），tools/tail_ingest.py 用它。
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+import struct
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+HEADER = struct.Struct(">IBQ")
+MAX_PAYLOAD = 4 * 1024 * 1024
+
+T_SYSLOG = 0x01
+T_EVIDENCE = 0x02
+T_ACK = 0x10
+
+KINDS = {T_SYSLOG: "event", T_EVIDENCE: "evidence"}
+TYPES = {"event": T_SYSLOG, "evidence": T_EVIDENCE}
+
+# sink(frames) -> 是否接收；frames = [(kind, payload_bytes)]，JSON 解码留给下游（线程里做）
+StreamSink = Callable[[List[Tuple[str, bytes]]], bool]
+
+
+def encode_frame(ftype: int, seq: int, payload: bytes = b"") -> bytes:
+    return HEADER.pack(len(payload), ftype, seq) + payload
+
+
+def parse_address(addr: str) -> Tuple[str, Any]:
+    """'unix:/path/to.sock' | 'tcp:host:port' -> (family, address)"""
+    if addr.startswith("unix:"):
+        return "unix", addr[5:]
+    if addr.startswith("tcp:"):
+        host, _, port = addr[4:].rpartition(":")
+        return "tcp", (host or "127.0.0.1", int(port))
+    raise ValueError(f"bad stream address: {addr!r} (want unix:/path or tcp:host:port)")
+
+
+# =========================================================
+# server
+# =========================================================
+
+class StreamServer:
+    def __init__(self, sink: StreamSink, *, retry_interval: float = 0.05):
+        self.sink = sink
+        self.retry_interval = retry_interval
+        self.stats: Dict[str, int] = {
+            "connections": 0,
+            "frames": 0,
+            "bytes": 0,
+            "acks": 0,
+            "paused": 0,          # 因下游满暂停读的次数
+            "protocol_errors": 0,
+        }
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._unix_path: Optional[str] = None
+
+    async def start(self, addr: str) -> None:
+        loop = asyncio.get_running_loop()
+        family, address = parse_address(addr)
+        if family == "unix":
+            if os.path.exists(address):
+                os.unlink(address)
+            d = os.path.dirname(address)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            self._server = await loop.create_unix_server(lambda: _StreamProtocol(self), address)
+            self._unix_path = address
+        else:
+            self._server = await loop.create_server(lambda: _StreamProtocol(self), address[0], address[1])
+        print(f"[ingest_stream] listening on {addr}")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._unix_path and os.path.exists(self._unix_path):
+            os.unlink(self._unix_path)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+
+class _StreamProtocol(asyncio.Protocol):
+    def __init__(self, server: StreamServer):
+        self.server = server
+        self._buf = bytearray()
+        self._transport: Optional[asyncio.Transport] = None
+        self._pending: List[Tuple[str, bytes]] = []
+        self._pending_seq = 0
+        self._acked = 0
+        self._paused = False
+
+    def connection_made(self, transport) -> None:
+        self._transport = transport
+        self.server.stats["connections"] += 1
+
+    def data_received(self, data: bytes) -> None:
+        st = self.server.stats
+        st["bytes"] += len(data)
+        buf = self._buf
+        buf += data
+
+        pos = 0
+        n = len(buf)
+        while n - pos >= HEADER.size:
+            length, ftype, seq = HEADER.unpack_from(buf, pos)
+            if length > MAX_PAYLOAD or ftype not in KINDS:
+                st["protocol_errors"] += 1
+                self._transport.close()
+                buf.clear()
+                return
+            end = pos + HEADER.size + length
+            if end > n:
+                break
+            self._pending.append((KINDS[ftype], bytes(buf[pos + HEADER.size:end])))
+            self._pending_seq = seq
+            st["frames"] += 1
+            pos = end
+        del buf[:pos]
+
+        self._deliver()
+
+    def _deliver(self) -> None:
+        if not self._pending or self._transport is None or self._transport.is_closing():
+            return
+        if not self.server.sink(self._pending):
+            # 下游满：停读，稍后重试；已缓存的帧不丢
+            if not self._paused:
+                self._paused = True
+                self.server.stats["paused"] += 1
+                self._transport.pause_reading()
+            asyncio.get_running_loop().call_later(self.server.retry_interval, self._deliver)
+            return
+        self._pending = []
+        self._acked = self._pending_seq
+        self._transport.write(encode_frame(T_ACK, self._acked))
+        self.server.stats["acks"] += 1
+        if self._paused:
+            self._paused = False
+            self._transport.resume_reading()
+
+    def connection_lost(self, exc) -> None:
+        # 未 ACK 的帧由客户端重发
+        self._pending = []
+        self._transport = None
+
+
+# =========================================================
+# client（阻塞，给 tail_ingest 用）
+# =========================================================
+
+class StreamClient:
+    """
+    send(kind, payload, offset)：发一帧；offset 是这行在源文件里的结束位置。
+    acked_offset：服务端已确认的最后一帧对应的 offset（tail_ingest 用它推进 TailState.offset）。
+    """
+
+    def __init__(self, addr: str, window: int = 1024, timeout: float = 3.0):
+        self.addr = addr
+        self.window = max(1, window)
+        self.timeout = timeout
+        self.acked_offset: Optional[int] = None
+
+        self._sock: Optional[socket.socket] = None
+        self._rbuf = bytearray()
+        self._seq = 0
+        # 未确认帧：(seq, ftype, payload, offset)
+        self._unacked: Deque[Tuple[int, int, bytes, int]] = deque()
+
+    # ---------- connection ----------
+    def _connect(self) -> None:
+        family, address = parse_address(self.addr)
+        sock = socket.socket(socket.AF_UNIX if family == "unix" else socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(address)
+        if family == "tcp":
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._rbuf.clear()
+        # 新连接 seq 重新编号，把未确认的帧重发
+        self._seq = 0
+        frames = []
+        resent: Deque[Tuple[int, int, bytes, int]] = deque()
+        for _, ftype, payload, offset in self._unacked:
+            self._seq += 1
+            resent.append((self._seq, ftype, payload, offset))
+            frames.append(encode_frame(ftype, self._seq, payload))
+        self._unacked = resent
+        if frames:
+            sock.sendall(b"".join(frames))
+
+    def close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def _reconnect(self, backoff: float) -> None:
+        self.close()
+        while True:
+            try:
+                self._connect()
+                return
+            except OSError as ex:
+                print(f"[ingest_stream] connect {self.addr} failed: {ex}; retry in {backoff:.1f}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 10.0)
+
+    # ---------- data path ----------
+    def send(self, kind: str, payload: Dict[str, Any], offset: int) -> None:
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        ftype = TYPES[kind]
+        while True:
+            try:
+                if self._sock is None:
+                    self._connect()
+                # 窗口满：阻塞等 ACK
+                while len(self._unacked) >= self.window:
+                    self._read_acks(block=True)
+                self._seq += 1
+                self._unacked.append((self._seq, ftype, body, offset))
+                self._sock.sendall(encode_frame(ftype, self._seq, body))
+                self._read_acks(block=False)
+                return
+            except OSError:
+                self._reconnect(0.5)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等所有已发送帧被确认；超时返回 False。"""
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        while self._unacked and time.monotonic() < deadline:
+            try:
+                if self._sock is None:
+                    self._connect()
+                self._read_acks(block=True)
+            except OSError:
+                self._reconnect(0.5)
+        return not self._unacked
+
+    def poll(self) -> None:
+        """非阻塞收 ACK（空闲时调用，推进 acked_offset）。"""
+        if self._sock is None or not self._unacked:
+            return
+        try:
+            self._read_acks(block=False)
+        except OSError:
+            self._reconnect(0.5)
+
+    def pending(self) -> int:
+        return len(self._unacked)
+
+    def _read_acks(self, block: bool) -> None:
+        sock = self._sock
+        sock.setblocking(block)
+        if block:
+            sock.settimeout(self.timeout)
+        try:
+            data = sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except socket.timeout:
+            # 太久没 ACK：当作连接坏了，重连重发
+            raise OSError("ack timeout")
+        finally:
+            sock.settimeout(self.timeout)
+        if not data:
+            raise OSError("connection closed by server")
+
+        self._rbuf += data
+        pos = 0
+        while len(self._rbuf) - pos >= HEADER.size:
+            length, ftype, seq = HEADER.unpack_from(self._rbuf, pos)
+            if len(self._rbuf) - pos < HEADER.size + length:
+                break
+            pos += HEADER.size + length
+            if ftype == T_ACK:
+                self._on_ack(seq)
+        del self._rbuf[:pos]
+
+    def _on_ack(self, seq: int) -> None:
+        while self._unacked and self._unacked[0][0] <= seq:
+            _, _, _, offset = self._unacked.popleft()
+            self.acked_offset = offset
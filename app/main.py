@@ -2,16 +2,18 @@ from __future__ import annotations
 
 import os
 import re
+import asyncio
 import json
 import uuid
 import time
 import traceback
 from dataclasses import dataclass, asdict
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, Request, Body
+from fastapi import FastAPI, HTTPException, Request, Body, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 import app.store as store_mod
 from app.store import InMemoryStore
@@ -28,89 +30,99 @@ from app.llm import call_llm_json, json_safe  # 需要你 llm.py 里存在这两
 
 
 try:
+    from tools.cidr_trie import parse_cidr_list
     from tools.desensitizer import Desensitizer, DesensitizeConfig
 except Exception:
     Desensitizer = None  # type: ignore
     DesensitizeConfig = None  # type: ignore
 
-def _build_des():
-    enable = os.environ.get("ENABLE_DESENSITIZE", "1").lower() not in ("0", "false", "no")
-    if not enable or Desensitizer is None:
-        return None
-    secret = os.environ.get("OPS_DESENSE_SECRET", "") or "WEAK_DEFAULT_SECRET_CHANGE_ME"
-    cfg = DesensitizeConfig(
-        secret_key=secret,
-        reversible=os.environ.get("DESENSITIZE_REVERSIBLE", "0").lower() in ("1", "true", "yes"),
-        mapping_path=os.environ.get("DESENSITIZE_MAP_PATH", "data/desensitize_map.json"),
-        keep_private_ranges=os.environ.get("KEEP_PRIVATE_RANGES", "0").lower() in ("1", "true", "yes"),
-    )
-    return Desensitizer(cfg)
-
-DES = _build_des()
-
-def _mask_text(s: str) -> str:
-    if not DES or not s:
-        return s
-    out, _ = DES.desensitize_line(s + "\n")
-    return out.rstrip("\n")
-
-def _mask_obj(obj: Any):
-    if DES is None:
-        return obj
-    if obj is None:
-        return None
-    if isinstance(obj, str):
-        return _mask_text(obj)
-    if isinstance(obj, list):
-        return [_mask_obj(x) for x in obj]
-    if isinstance(obj, dict):
-        return {k: _mask_obj(v) for k, v in obj.items()}
-    return obj
-
-
 # syslog parser（如果你项目里有）
 try:
     from app.ingest.syslog import parse_syslog
 except Exception:
     parse_syslog = None
 
+from app.ingest.dedupe import RotatingBloomFilter
+from app.ingest.encoding import DecompressMiddleware, WireStats
+from app.ingest.listener import SyslogListener
+from app.ingest.queue import IngestJob, IngestQueue
+from app.ingest.stream import StreamServer
+
 
 
+# 只在这里构建一次：API 和 tail_ingest 用同一个 DESENSITIZE_MAP_PATH（默认都是仓库下 data/），
+# 有界模式（DESENSITIZE_MAP_CACHE>0）下 reversible 的 token -> raw 落在同一个共享 sqlite 库里
+_DEFAULT_MAP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "desensitize_map.json")
+
 def _build_des():
     enable = os.environ.get("ENABLE_DESENSITIZE", "1").lower() not in ("0","false","no")
-    if not enable:
+    if not enable or Desensitizer is None:
         return None
     secret = os.environ.get("OPS_DESENSE_SECRET","") or "WEAK_DEFAULT_SECRET_CHANGE_ME"
     cfg = DesensitizeConfig(
         secret_key=secret,
         reversible=os.environ.get("DESENSITIZE_REVERSIBLE","0").lower() in ("1","true","yes"),
-        mapping_path=os.environ.get("DESENSITIZE_MAP_PATH","data/desensitize_map.json"),
+        mapping_path=os.environ.get("DESENSITIZE_MAP_PATH",_DEFAULT_MAP_PATH),
         keep_private_ranges=os.environ.get("KEEP_PRIVATE_RANGES","0").lower() in ("1","true","yes"),
+        commit_interval_s=float(os.environ.get("DESENSITIZE_COMMIT_INTERVAL","1")),
+        compact_every=int(os.environ.get("DESENSITIZE_COMPACT_EVERY","100000")),
+        map_cache_size=int(os.environ.get("DESENSITIZE_MAP_CACHE","200000")),
+        rev_cache_size=int(os.environ.get("DESENSITIZE_REV_CACHE","50000")),
+        cold_store_path=os.environ.get("DESENSITIZE_COLD_PATH",""),
+        field_aware=os.environ.get("DESENSITIZE_FIELD_AWARE","1").lower() not in ("0","false","no"),
+        field_policy_path=os.environ.get("DESENSITIZE_FIELD_POLICY",""),
+        allow_cidrs=parse_cidr_list(os.environ.get("DESENSITIZE_ALLOW_CIDRS","")),
+        allow_cidrs_path=os.environ.get("DESENSITIZE_ALLOW_CIDRS_FILE",""),
     )
     return Desensitizer(cfg)
 
 DES = _build_des()
 
-def _mask_text(s: str) -> str:
+# 已经是脱敏 token 的值（"<IP:0123456789>"），不用再扫
+_TOKEN_ONLY = re.compile(r"<(?:IP|MAC|SECRET):[0-9a-f]{10}>")
+
+
+def _mask_text(s: str, memo: Optional[Dict[str, str]] = None) -> str:
+    """
+    memo：单条记录内的「输入 -> 脱敏结果」缓存（mask-once）。
+    同一个字符串只扫一次；脱敏结果本身也登记为安全值，派生字段原样复用时直接命中。
+    """
     if not DES or not s:
         return s
-    out, _ = DES.desensitize_line(s + "\n")
-    return out.rstrip("\n")
-
-def _mask_obj(obj):
+    if memo is not None:
+        hit = memo.get(s)
+        if hit is not None:
+            return hit
+    if _TOKEN_ONLY.fullmatch(s):
+        out = s
+    else:
+        out, _ = DES.desensitize_line(s + "\n")
+        out = out.rstrip("\n")
+    if memo is not None:
+        memo[s] = out
+        memo[out] = out
+    return out
+
+def _mask_obj(obj, memo: Optional[Dict[str, str]] = None):
     """递归脱敏 dict/list/str，保证 raw 也不会漏。"""
     if DES is None:
         return obj
     if obj is None:
         return None
     if isinstance(obj, str):
-        return _mask_text(obj)
+        return _mask_text(obj, memo)
     if isinstance(obj, list):
-        return [_mask_obj(x) for x in obj]
+        return [_mask_obj(x, memo) for x in obj]
     if isinstance(obj, dict):
-        return {k: _mask_obj(v) for k, v in obj.items()}
+        return {k: _mask_field(k, v, memo) for k, v in obj.items()}
     return obj
 
+def _mask_field(key: Any, value: Any, memo: Optional[Dict[str, str]] = None):
+    """dict 的值：字段名命中策略（ip/mac/secret/keep）的字符串按字段处理（keep 的值不像数字 / 时间时仍会扫）；其余照旧递归。"""
+    if isinstance(value, str) and isinstance(key, str) and DES.field_action(key) != "scan":
+        return DES.mask_field(key, value)[0]
+    return _mask_obj(value, memo)
+
 # =============================
 # LLM Ledger (minimal JSONL)
 # =============================
@@ -276,7 +288,7 @@ class EvidenceItem:
     raw: Dict[str, Any]
 
 
-# 先用内存存，demo 足够；后续你要落盘/ES 再换
+# store 支持 evidence 时（InMemoryStore 随 snapshot/WAL 落盘；SqliteStore 多个 worker 共享）放在 store 里，这里只是兜底
 EVIDENCE: List[EvidenceItem] = []
 
 
@@ -317,7 +329,63 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-store = InMemoryStore()
+# 原始事件按事件时间分片保存（STORE_PARTITION_S 秒一片），超过 STORE_RETENTION_S 的分片整片丢弃；
+# 聚合（count / first_seen / last_seen）不受原始事件过期影响。STORE_RETENTION_S=0 = 永久保留
+STORE_PARTITION_S = float(os.getenv("STORE_PARTITION_S", "60"))
+STORE_RETENTION_S = float(os.getenv("STORE_RETENTION_S", "86400"))
+# InMemoryStore 的聚合锁分片数（按 fingerprint hash 分，线程池里并发 ingest 时不同 fingerprint 互不等锁）
+STORE_STRIPES = int(os.getenv("STORE_STRIPES", "16"))
+
+# OPS_STORE=memory（默认，重启即清空）| sqlite（STORE_SQLITE_PATH，重启 / --reload 后原始事件和聚合都还在）
+OPS_STORE = os.getenv("OPS_STORE", "memory").strip().lower()
+STORE_SQLITE_PATH = os.getenv(
+    "STORE_SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "events.sqlite"),
+)
+
+if OPS_STORE == "sqlite":
+    from app.store_sqlite import SqliteStore
+
+    store = SqliteStore(STORE_SQLITE_PATH, retention_s=STORE_RETENTION_S, partition_s=STORE_PARTITION_S)
+elif OPS_STORE in ("", "memory"):
+    store = InMemoryStore(partition_s=STORE_PARTITION_S, retention_s=STORE_RETENTION_S, stripes=STORE_STRIPES)
+    # 内存 store 的 snapshot + WAL（app/store_journal.py）：重启 / 发版后聚合和 evidence 都还在；STORE_SNAPSHOT_PATH= 关闭
+    STORE_SNAPSHOT_PATH = os.getenv(
+        "STORE_SNAPSHOT_PATH",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "store.snap"),
+    )
+    if STORE_SNAPSHOT_PATH:
+        from app.store_journal import StoreJournal
+
+        _restored = store.attach_journal(StoreJournal(
+            STORE_SNAPSHOT_PATH,
+            commit_interval=float(os.getenv("STORE_WAL_COMMIT_INTERVAL", "1.0")),
+            snapshot_every=int(os.getenv("STORE_SNAPSHOT_EVERY", "500000")),
+        ))
+        print("STORE RESTORED =", _restored)
+else:
+    raise RuntimeError(f"unknown OPS_STORE={OPS_STORE!r} (expected 'memory' or 'sqlite')")
+
+# uvicorn --workers N（WEB_CONCURRENCY=N）：每个 worker 是独立进程，模块级全局各有一份。
+# 事件 / 聚合 / evidence 必须放在共享的 sqlite 里（OPS_STORE=sqlite），否则各 worker 只看到自己收到的那部分，/api/focus 来回跳
+API_WORKERS = int(os.getenv("WEB_CONCURRENCY", "1") or "1")
+if API_WORKERS > 1 and OPS_STORE != "sqlite":
+    raise RuntimeError(
+        f"WEB_CONCURRENCY={API_WORKERS} needs a shared store: set OPS_STORE=sqlite "
+        "(all workers open the same STORE_SQLITE_PATH)"
+    )
+# SqliteStore 的写入（BEGIN IMMEDIATE）可能要排队等别的 worker 进程的写锁（最多 busy_timeout 秒）：
+# async 接口和 ingest 队列里的写入都放到线程里做，event loop 上的其他请求（/api/focus 等）不被卡住
+STORE_BLOCKING_WRITES = OPS_STORE == "sqlite"
+
+
+async def _store_write(fn, *args):
+    """async 接口里的 store 写入：sqlite 放到线程里，内存 store 直接调用（微秒级，不值得切线程）。"""
+    if STORE_BLOCKING_WRITES:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+
 print("STORE INSTANCE TYPE =", type(store))
 print("STORE HAS ingest_event =", hasattr(store, "ingest_event"))
 
@@ -349,6 +417,165 @@ def _fingerprint_fallback(msg: str) -> str:
     return s
 
 
+# -----------------------------
+# ingest: 单条 payload -> Event / EvidenceItem
+# （单条接口与 batch 接口共用，保证两条路径脱敏/解析完全一致）
+# -----------------------------
+INGEST_BATCH_MAX = int(os.getenv("INGEST_BATCH_MAX", "5000"))
+
+
+def _new_event_id() -> str:
+    return f"evt_{uuid.uuid4().hex[:12]}"
+
+
+def _new_evidence_id() -> str:
+    return f"evd_{uuid.uuid4().hex[:12]}"
+
+
+def _syslog_event_from_payload(payload: Dict[str, Any], event_id: Optional[str] = None) -> Event:
+    if not isinstance(payload, dict):
+        raise ValueError("record must be a JSON object")
+
+    host_raw = payload.get("host") or "unknown"
+    program_raw = payload.get("program") or "syslog"
+    msg_raw = payload.get("msg") or ""
+    ts = payload.get("timestamp") or datetime.now(timezone.utc).isoformat()
+
+    # mask-once：整条记录共用一个 memo，每个不同的字符串只过一次脱敏器
+    memo: Dict[str, str] = {}
+
+    # ✅ 先脱敏基础字段（后续所有派生字段都用脱敏后的）
+    host = _mask_text(str(host_raw), memo)
+    program = _mask_text(str(program_raw), memo)
+    msg = _mask_text(str(msg_raw), memo)
+
+    parsed = {}
+    if parse_syslog:
+        try:
+            # ⚠️ parse_syslog 用脱敏后的 msg（避免 parsed 里再带回明文）
+            parsed = parse_syslog(msg) or {}
+        except Exception:
+            parsed = {}
+
+    category = payload.get("category") or parsed.get("category") or "SYSLOG"
+
+    # ✅ title/fingerprint 也必须脱敏（客户端传入的值、或截断拼接出来的值都可能带明文）
+    #    直接复用的已脱敏值在 memo 里命中，不会重复扫描
+    title_raw = payload.get("title") or parsed.get("title") or f"{host} {program}: {msg[:80]}".strip()
+    title = _mask_text(str(title_raw), memo)
+
+    fp_raw = (
+        payload.get("fingerprint")
+        or parsed.get("fingerprint")
+        or f"syslog|{host}|{program}|{_fingerprint_fallback(msg)[:140]}"
+    )
+    fp = _mask_text(str(fp_raw), memo)
+
+    # ✅ raw 只能存脱敏后的：payload 其余字段 + parsed 递归脱敏
+    #    host/program/msg/title/fingerprint 直接用上面已脱敏的值覆盖，不再二次扫描
+    safe = {"host": host, "program": program, "msg": msg, "title": title, "fingerprint": fp}
+    payload_safe = {k: safe[k] if k in safe else _mask_obj(v, memo) for k, v in payload.items()}
+    payload_safe.update(safe)
+
+    # parsed 的字段是 msg 的子串/规范化结果（例如 MAC 归一化），仍按值脱敏一次
+    parsed_safe = _mask_obj(parsed, memo)
+
+    return Event(
+        event_id=event_id or _new_event_id(),
+        ts=ts,
+        fingerprint=fp,
+        category=category,
+        title=title,
+        source={
+            "name": f"{host}",
+            "kind": "syslog",
+            "host": host,
+            "program": program,
+        },
+        raw={
+            "message": msg,
+            "payload": payload_safe,
+            "parsed": parsed_safe,
+        },
+    )
+
+
+def _evidence_from_payload(payload: Dict[str, Any], evidence_id: Optional[str] = None) -> EvidenceItem:
+    if not isinstance(payload, dict):
+        raise ValueError("record must be a JSON object")
+
+    memo: Dict[str, str] = {}
+    host = _mask_text(str(payload.get("host") or "unknown"), memo)
+    user = _mask_text(str(payload.get("user") or ""), memo) if payload.get("user") else None
+    msg = _mask_text(str(payload.get("msg") or payload.get("message") or ""), memo)
+
+    # ✅ raw 一律存脱敏后的（raw 缺省就是整个 payload：host/user/msg 在 memo 里命中，不重复扫描）
+    raw_in = payload.get("raw") or payload
+    raw = _mask_obj(dict(raw_in), memo)  # recursive mask
+
+    return EvidenceItem(
+        id=evidence_id or _new_evidence_id(),
+        ts=_safe_iso(payload.get("timestamp")),
+        source=str(payload.get("source") or "unknown"),
+        kind=str(payload.get("kind") or "evidence"),
+        host=host,
+        user=user,
+        msg=msg,
+        tags=list(payload.get("tags") or []),
+        event_id=payload.get("event_id"),
+        fingerprint=payload.get("fingerprint"),
+        raw=raw,
+    )
+
+
+def _append_evidence(items: List[EvidenceItem]) -> None:
+    if not items:
+        return
+    if hasattr(store, "append_evidence"):
+        store.append_evidence([asdict(it) for it in items])
+        return
+    EVIDENCE.extend(items)
+    # 控制内存：只保留最后 5000 条
+    if len(EVIDENCE) > 5000:
+        del EVIDENCE[: len(EVIDENCE) - 5000]
+
+
+def _parse_batch_body(body: bytes, content_type: str) -> Tuple[List[Any], Dict[int, str]]:
+    """
+    解析批量 body，返回 (records, errors)：
+      - JSON 数组：[{...}, {...}]
+      - NDJSON：每行一个 JSON（content-type 含 ndjson/jsonl，或 body 不是以 '[' 开头）
+    NDJSON 某一行坏掉只记到 errors[index]，不影响其他行；整体不可解析则 400。
+    """
+    text = body.decode("utf-8", errors="replace")
+    ct = (content_type or "").lower()
+    records: List[Any] = []
+    errors: Dict[int, str] = {}
+
+    if "ndjson" not in ct and "jsonl" not in ct and text.lstrip().startswith("["):
+        try:
+            data = json.loads(text)
+        except Exception as ex:
+            raise HTTPException(status_code=400, detail=f"invalid JSON array: {ex}")
+        if not isinstance(data, list):
+            raise HTTPException(status_code=400, detail="batch body must be a JSON array or NDJSON")
+        records = data
+    else:
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except Exception as ex:
+                errors[len(records)] = f"invalid JSON: {ex}"
+                records.append(None)
+
+    if len(records) > INGEST_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"batch too large: {len(records)} > {INGEST_BATCH_MAX}")
+    return records, errors
+
+
 # =============================
 # Health
 # =============================
@@ -358,6 +585,14 @@ def health():
     return {"status": "ok", "llm": llm, "version": app.version}
 
 
+@app.get("/api/desensitize/stats")
+def desensitize_stats():
+    """token map 内存占用、LRU 命中率、冷存储写入情况。"""
+    if DES is None:
+        return {"ok": True, "enabled": False}
+    return {"ok": True, "enabled": True, "generated_at": _now_iso(), "stats": DES.stats()}
+
+
 # =============================
 # LLM Ledger APIs
 # =============================
@@ -371,6 +606,213 @@ def api_llm_usage(window_s: int = 3600, limit: int = 50):
     return ledger_usage(window_s=window_s, limit=limit)
 
 
+# =============================
+# Compressed ingest bodies (Content-Encoding: gzip / deflate)
+# =============================
+# 所有 ingest 接口（单条/batch/stream）都在中间件里流式解压，路由拿到的是明文；
+# INGEST_BODY_MAX / INGEST_STREAM_BODY_MAX 是解压后的上限（超出 413）
+INGEST_BODY_MAX = int(os.getenv("INGEST_BODY_MAX", str(64 * 1024 * 1024)))
+INGEST_STREAM_BODY_MAX = int(os.getenv("INGEST_STREAM_BODY_MAX", str(4 * 1024 * 1024 * 1024)))
+
+WIRE_STATS = WireStats()
+app.add_middleware(
+    DecompressMiddleware,
+    prefixes=("/api/ingest/", "/api/evidence/ingest", "/api/events/ingest"),
+    max_bytes=INGEST_BODY_MAX,
+    stream_max_bytes=INGEST_STREAM_BODY_MAX,
+    stats=WIRE_STATS,
+)
+
+
+@app.get("/api/ingest/wire/stats")
+def ingest_wire_stats():
+    return {"ok": True, "generated_at": _now_iso(), "stats": WIRE_STATS.snapshot()}
+
+
+# =============================
+# Retry dedupe (record_key + rotating Bloom filter)
+# =============================
+# ingester 给每条记录带稳定的 record_key（tail_ingest: "<source>:<inode>:<generation>:<offset>"），
+# 重试/重发的同一行在窗口内直接丢弃，不会让 aggregate.count 虚高；没带 record_key 的记录不受影响。
+# 注意：过滤器在进程内存里。WEB_CONCURRENCY > 1 时每个 worker 各有一份，重试落到另一个 worker 上就认不出来
+# （那一条会被多计一次）。多 worker 下只是尽力去重；要严格去重就用单 worker
+INGEST_DEDUPE = os.getenv("INGEST_DEDUPE", "1").lower() not in ("0", "false", "no")
+INGEST_DEDUPE_WINDOW_S = float(os.getenv("INGEST_DEDUPE_WINDOW_S", "900"))
+INGEST_DEDUPE_CAPACITY = int(os.getenv("INGEST_DEDUPE_CAPACITY", "1000000"))
+INGEST_DEDUPE_FP_RATE = float(os.getenv("INGEST_DEDUPE_FP_RATE", "1e-5"))
+
+DEDUPE: Optional[RotatingBloomFilter] = (
+    RotatingBloomFilter(
+        capacity=INGEST_DEDUPE_CAPACITY,
+        fp_rate=INGEST_DEDUPE_FP_RATE,
+        window_s=INGEST_DEDUPE_WINDOW_S,
+    )
+    if INGEST_DEDUPE
+    else None
+)
+if DEDUPE is not None and API_WORKERS > 1:
+    print(f"[dedupe] WARN per-process dedupe with WEB_CONCURRENCY={API_WORKERS}: retries that land on another worker are counted twice")
+
+
+def _dedupe_key(kind: str, rec: Any) -> Optional[str]:
+    if DEDUPE is None or not isinstance(rec, dict):
+        return None
+    rk = rec.get("record_key")
+    if rk is None or rk == "":
+        return None
+    return f"{kind}|{rk}"
+
+
+def _is_duplicate(kind: str, rec: Any) -> bool:
+    key = _dedupe_key(kind, rec)
+    return key is not None and DEDUPE.contains(key)
+
+
+def _remember(kind: str, records: List[Any]) -> None:
+    """记录被接收（入队成功 / 同步写入）之后再登记 key：被 429 拒掉的重试不能被当成重复。"""
+    for rec in records:
+        key = _dedupe_key(kind, rec)
+        if key is not None:
+            DEDUPE.add(key)
+
+
+@app.get("/api/ingest/dedupe/stats")
+def ingest_dedupe_stats():
+    if DEDUPE is None:
+        return {"ok": True, "enabled": False}
+    return {"ok": True, "enabled": True, "generated_at": _now_iso(), "stats": DEDUPE.snapshot()}
+
+
+# =============================
+# Ingest queue (async workers + backpressure)
+# =============================
+# INGEST_ASYNC=1（默认）：ingest 接口只校验+入队并返回 202，worker 池完成 脱敏/解析/upsert
+# 队列满（按记录条数计）返回 429 + Retry-After；INGEST_ASYNC=0 退回接口内同步处理
+INGEST_ASYNC = os.getenv("INGEST_ASYNC", "1").lower() not in ("0", "false", "no")
+INGEST_QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", "50000"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_DRAIN_TIMEOUT = float(os.getenv("INGEST_DRAIN_TIMEOUT", "10"))
+
+INGEST_QUEUE: Optional[IngestQueue] = None
+
+
+def _upsert_committed(events: List[Event]) -> int:
+    if events:
+        store.upsert_events(events)
+    return len(events)
+
+
+def _evidence_committed(items: List[EvidenceItem]) -> int:
+    _append_evidence(items)
+    return len(items)
+
+
+def _build_all(
+    build,
+    records: List[Any],
+    ids: List[str],
+    dedupe_kind: Optional[str] = None,
+    job: Optional[IngestJob] = None,
+) -> List[Any]:
+    """
+    records 可以是 dict，也可以是还没解码的 JSON bytes（stream 传输的帧，解码放在 worker 线程里）。
+    dedupe_kind：解码后才知道 record_key 的路径（stream）在这里判重+登记，跳过的条数记到 job.skipped。
+    解码 / 脱敏 / 解析失败的记录跳过（客户端已经拿到 202），条数和第一条错误记到 job.failed / job.error，
+    每批只打一行日志。
+    """
+    out = []
+    failed = 0
+    first_error: Optional[str] = None
+    for rec, rid in zip(records, ids):
+        try:
+            if isinstance(rec, (bytes, bytearray)):
+                rec = json.loads(rec)
+            if dedupe_kind is not None:
+                key = _dedupe_key(dedupe_kind, rec)
+                if key is not None and DEDUPE.seen_or_add(key):
+                    if job is not None:
+                        job.skipped += 1
+                    continue
+            out.append(build(rec, rid))
+        except Exception as ex:
+            failed += 1
+            if first_error is None:
+                first_error = f"{type(ex).__name__}: {ex}"
+    if failed:
+        kind = job.kind if job is not None else getattr(build, "__name__", "build")
+        print(f"[ingest] WARN {failed}/{len(records)} records failed ({kind}), first error: {first_error}")
+        if job is not None:
+            job.failed += failed
+            job.error = job.error or first_error
+    return out
+
+
+def _enqueue(kind: str, build, commit, records: List[Dict[str, Any]], ids: List[str]) -> None:
+    """入队一批已通过基本校验的记录；满了直接 429。"""
+    job = IngestJob(prepare=lambda: None, commit=commit, records=len(records), kind=kind)
+    job.prepare = lambda: _build_all(build, records, ids, job=job)
+    if not INGEST_QUEUE.submit(job):
+        raise HTTPException(
+            status_code=429,
+            detail="ingest queue full",
+            headers={"Retry-After": str(INGEST_QUEUE.retry_after())},
+        )
+
+
+def _check_records(
+    kind: str, records: List[Any], errors: Dict[int, str]
+) -> Tuple[List[Dict[str, Any]], List[int], List[Dict[str, Any]]]:
+    """
+    batch 基本校验：返回 (有效记录, 有效记录的 index, 逐条结果骨架)。重复记录算成功但不再写入。
+    同一批里 record_key 相同的记录也算重复（只留第一条）：DEDUPE 要等整批被接收后才登记（_remember），查不出批内重复。
+    """
+    valid: List[Dict[str, Any]] = []
+    idx: List[int] = []
+    results: List[Dict[str, Any]] = []
+    batch_keys: set = set()
+    for i, rec in enumerate(records):
+        key = _dedupe_key(kind, rec) if i not in errors else None
+        if i in errors:
+            results.append({"index": i, "ok": False, "error": errors[i]})
+        elif not isinstance(rec, dict):
+            results.append({"index": i, "ok": False, "error": "record must be a JSON object"})
+        elif key is not None and (key in batch_keys or DEDUPE.contains(key)):
+            results.append({"index": i, "ok": True, "duplicate": True})
+        else:
+            if key is not None:
+                batch_keys.add(key)
+            valid.append(rec)
+            idx.append(i)
+            results.append({"index": i, "ok": True})
+    return valid, idx, results
+
+
+def _batch_counts(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "rejected": sum(1 for r in results if not r["ok"]),
+        "duplicates": sum(1 for r in results if r.get("duplicate")),
+        "results": results,
+    }
+
+
+@app.on_event("startup")
+async def _start_ingest_queue():
+    global INGEST_QUEUE
+    if not INGEST_ASYNC:
+        return
+    INGEST_QUEUE = IngestQueue(
+        max_records=INGEST_QUEUE_MAX, workers=INGEST_WORKERS, commit_in_thread=STORE_BLOCKING_WRITES,
+    )
+    INGEST_QUEUE.start()
+
+
+@app.get("/api/ingest/queue/stats")
+def ingest_queue_stats():
+    if INGEST_QUEUE is None:
+        return {"ok": True, "enabled": False}
+    return {"ok": True, "enabled": True, "generated_at": _now_iso(), "stats": INGEST_QUEUE.snapshot()}
+
+
 # =============================
 # Evidence APIs  ✅（你缺的就是这个）
 # =============================
@@ -395,34 +837,55 @@ async def evidence_ingest(req: Request):
     """
 
     payload = await req.json()
+    if _is_duplicate("evidence", payload):
+        return {"ok": True, "duplicate": True}
+    if INGEST_QUEUE is None:
+        item = _evidence_from_payload(payload)
+        await _store_write(_append_evidence, [item])
+        _remember("evidence", [payload])
+        return {"ok": True, "id": item.id}
+
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="payload must be a JSON object")
+    evd_id = _new_evidence_id()
+    _enqueue("evidence", _evidence_from_payload, _evidence_committed, [payload], [evd_id])
+    _remember("evidence", [payload])
+    return JSONResponse(status_code=202, content={"ok": True, "queued": True, "id": evd_id})
+
+
+@app.post("/api/evidence/ingest/batch")
+async def evidence_ingest_batch(req: Request):
+    """
+    批量 evidence：body 为 JSON 数组，或 NDJSON（每行一个 payload，字段同 /api/evidence/ingest）。
+    返回逐条结果：[{"index": i, "ok": true, "id": ...} | {"index": i, "ok": false, "error": ...}]
+    """
+    records, errors = _parse_batch_body(await req.body(), req.headers.get("content-type", ""))
+    valid, idx, results = _check_records("evidence", records, errors)
+    ids = [_new_evidence_id() for _ in valid]
+
+    if INGEST_QUEUE is not None:
+        if valid:
+            _enqueue("evidence", _evidence_from_payload, _evidence_committed, valid, ids)
+            _remember("evidence", valid)
+        for i, evd_id in zip(idx, ids):
+            results[i]["id"] = evd_id
+        return JSONResponse(status_code=202, content={"ok": True, "queued": True, "accepted": len(valid), **_batch_counts(results)})
+
+    items: List[EvidenceItem] = []
+    kept: List[Dict[str, Any]] = []
+    for i, rec, evd_id in zip(idx, valid, ids):
+        try:
+            item = _evidence_from_payload(rec, evd_id)
+        except Exception as ex:
+            results[i] = {"index": i, "ok": False, "error": str(ex)}
+            continue
+        items.append(item)
+        kept.append(rec)
+        results[i]["id"] = item.id
 
-    host = _mask_text(str(payload.get("host") or "unknown"))
-    user = _mask_text(str(payload.get("user") or "")) if payload.get("user") else None
-    msg = _mask_text(str(payload.get("msg") or payload.get("message") or ""))
-
-    # ✅ raw 一律存脱敏后的
-    raw_in = payload.get("raw") or payload
-    raw = _mask_obj(dict(raw_in))  # recursive mask
-
-    item = EvidenceItem(
-        id=f"evd_{uuid.uuid4().hex[:12]}",
-        ts=_safe_iso(payload.get("timestamp")),
-        source=str(payload.get("source") or "unknown"),
-        kind=str(payload.get("kind") or "evidence"),
-        host=host,
-        user=user,
-        msg=msg,
-        tags=list(payload.get("tags") or []),
-        event_id=payload.get("event_id"),
-        fingerprint=payload.get("fingerprint"),
-        raw=raw,
-    )
-    EVIDENCE.append(item)
-    # 控制内存：只保留最后 5000 条
-    if len(EVIDENCE) > 5000:
-        del EVIDENCE[: len(EVIDENCE) - 5000]
-
-    return {"ok": True, "id": item.id}
+    await _store_write(_append_evidence, items)
+    _remember("evidence", kept)
+    return {"ok": True, "accepted": len(items), **_batch_counts(results)}
 
 
 @app.get("/api/evidence")
@@ -435,6 +898,10 @@ def evidence_list(
     取 evidence：默认最近 1 小时。
     如果传 event_id，则只返回已显式关联的 evidence。
     """
+    if hasattr(store, "recent_evidence"):
+        items = store.recent_evidence(time.time() - float(window_s), limit=int(limit), event_id=event_id)
+        return {"ok": True, "generated_at": _now_iso(), "window_s": int(window_s), "items": items}
+
     cutoff = datetime.fromtimestamp(time.time() - float(window_s), tz=timezone.utc)
     items = []
     for it in reversed(EVIDENCE):
@@ -456,71 +923,179 @@ def evidence_list(
 @app.post("/api/ingest/syslog")
 async def ingest_syslog(req: Request):
     payload = await req.json()
+    if _is_duplicate("event", payload):
+        return {"ok": True, "duplicate": True}
+    if INGEST_QUEUE is None:
+        e = _syslog_event_from_payload(payload)
+        await _store_write(store.upsert_events, [e])
+        _remember("event", [payload])
+        return {"ok": True, "event_id": e.event_id, "fingerprint": e.fingerprint, "title": e.title, "category": e.category}
+
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="payload must be a JSON object")
+    event_id = _new_event_id()
+    _enqueue("syslog", _syslog_event_from_payload, _upsert_committed, [payload], [event_id])
+    _remember("event", [payload])
+    return JSONResponse(status_code=202, content={"ok": True, "queued": True, "event_id": event_id})
+
+
+@app.post("/api/ingest/syslog/batch")
+async def ingest_syslog_batch(req: Request):
+    """
+    批量 syslog：body 为 JSON 数组，或 NDJSON（每行一个 payload，字段同 /api/ingest/syslog）。
+    整批脱敏/解析后一次 store.upsert_events()；返回逐条结果，坏记录不影响同批其他记录。
+    异步模式下只返回入队结果（202），fingerprint/title 在 worker 里才算出来。
+    """
+    records, errors = _parse_batch_body(await req.body(), req.headers.get("content-type", ""))
+    valid, idx, results = _check_records("event", records, errors)
+    ids = [_new_event_id() for _ in valid]
+
+    if INGEST_QUEUE is not None:
+        if valid:
+            _enqueue("syslog", _syslog_event_from_payload, _upsert_committed, valid, ids)
+            _remember("event", valid)
+        for i, event_id in zip(idx, ids):
+            results[i]["event_id"] = event_id
+        return JSONResponse(status_code=202, content={"ok": True, "queued": True, "accepted": len(valid), **_batch_counts(results)})
+
+    events: List[Event] = []
+    kept: List[Dict[str, Any]] = []
+    for i, rec, event_id in zip(idx, valid, ids):
+        try:
+            e = _syslog_event_from_payload(rec, event_id)
+        except Exception as ex:
+            results[i] = {"index": i, "ok": False, "error": str(ex)}
+            continue
+        events.append(e)
+        kept.append(rec)
+        results[i].update({"event_id": e.event_id, "fingerprint": e.fingerprint})
 
-    host_raw = payload.get("host") or "unknown"
-    program_raw = payload.get("program") or "syslog"
-    msg_raw = payload.get("msg") or ""
-    ts = payload.get("timestamp") or datetime.now(timezone.utc).isoformat()
+    if events:
+        await _store_write(store.upsert_events, events)
+    _remember("event", kept)
+    return {"ok": True, "accepted": len(events), **_batch_counts(results)}
 
-    # ✅ 先脱敏基础字段（后续所有派生字段都用脱敏后的）
-    host = _mask_text(str(host_raw))
-    program = _mask_text(str(program_raw))
-    msg = _mask_text(str(msg_raw))
 
-    parsed = {}
-    if parse_syslog:
-        try:
-            # ⚠️ parse_syslog 用脱敏后的 msg（避免 parsed 里再带回明文）
-            parsed = parse_syslog(msg) or {}
-        except Exception:
-            parsed = {}
-
-    category = payload.get("category") or parsed.get("category") or "SYSLOG"
+# =============================
+# Native syslog listener (UDP/TCP)
+# =============================
+# 例：SYSLOG_UDP_LISTEN=0.0.0.0:5514 SYSLOG_TCP_LISTEN=0.0.0.0:5514
+SYSLOG_UDP_LISTEN = os.getenv("SYSLOG_UDP_LISTEN", "")
+SYSLOG_TCP_LISTEN = os.getenv("SYSLOG_TCP_LISTEN", "")
 
-    # ✅ title/fingerprint 也必须脱敏（尤其 fingerprint 你现在会拼 msg）
-    title_raw = payload.get("title") or parsed.get("title") or f"{host} {program}: {msg[:80]}".strip()
-    title = _mask_text(str(title_raw))
+LISTENER: Optional[SyslogListener] = None
 
-    fp_raw = (
-        payload.get("fingerprint")
-        or parsed.get("fingerprint")
-        or f"syslog|{host}|{program}|{_fingerprint_fallback(msg)[:140]}"
+# 多 worker 时每个 worker 都会去 bind 同一个端口 / socket：改用 sidecar（python -m app.ingest.listener）把数据 POST 进来
+if API_WORKERS > 1 and (SYSLOG_UDP_LISTEN or SYSLOG_TCP_LISTEN):
+    raise RuntimeError(
+        "SYSLOG_UDP_LISTEN / SYSLOG_TCP_LISTEN are per-process; with WEB_CONCURRENCY > 1 "
+        "run the listener as a sidecar: python -m app.ingest.listener"
     )
-    fp = _mask_text(str(fp_raw))
-
-    # ✅ raw 只能存脱敏后的：message/msg/payload/parsed 全递归脱敏
-    #    注意：payload 里原本可能带着明文 msg/host/program，所以要覆盖后再 mask
-    payload_safe = dict(payload)
-    payload_safe["host"] = host
-    payload_safe["program"] = program
-    payload_safe["msg"] = msg
-    payload_safe["title"] = title
-    payload_safe["fingerprint"] = fp
-    payload_safe = _mask_obj(payload_safe)
-
-    parsed_safe = _mask_obj(parsed)
-
-    e = Event(
-        event_id=f"evt_{uuid.uuid4().hex[:12]}",
-        ts=ts,
-        fingerprint=fp,
-        category=category,
-        title=title,
-        source={
-            "name": f"{host}",
-            "kind": "syslog",
-            "host": host,
-            "program": program,
-        },
-        raw={
-            "message": msg,
-            "payload": payload_safe,
-            "parsed": parsed_safe,
-        },
+
+
+def _ingest_syslog_records(records: List[Dict[str, Any]]) -> int:
+    """listener sink：与 batch 接口同一条流水线（脱敏 -> parse_syslog -> upsert_events）。"""
+    ids = [_new_event_id() for _ in records]
+    if INGEST_QUEUE is not None:
+        job = IngestJob(prepare=lambda: None, commit=_upsert_committed, records=len(records), kind="listener")
+        job.prepare = lambda: _build_all(_syslog_event_from_payload, records, ids, job=job)
+        # 队列满：整批计入 listener 的 dropped_sink
+        return len(records) if INGEST_QUEUE.submit(job) else 0
+    return _upsert_committed(_build_all(_syslog_event_from_payload, records, ids))
+
+
+@app.on_event("startup")
+async def _start_syslog_listener():
+    global LISTENER
+    if not SYSLOG_UDP_LISTEN and not SYSLOG_TCP_LISTEN:
+        return
+    LISTENER = SyslogListener(
+        _ingest_syslog_records,
+        max_pending=int(os.getenv("SYSLOG_LISTEN_MAX_PENDING", "10000")),
+        flush_size=int(os.getenv("SYSLOG_LISTEN_FLUSH_SIZE", "500")),
+        rcvbuf=int(os.getenv("SYSLOG_LISTEN_RCVBUF", "0")),
     )
+    await LISTENER.start(udp=SYSLOG_UDP_LISTEN or None, tcp=SYSLOG_TCP_LISTEN or None)
+
+
+# =============================
+# Stream transport (Unix socket / TCP, 长连接 + 帧 + 累计 ACK)
+# =============================
+# 例：STREAM_LISTEN=unix:data/ingest.sock  或  STREAM_LISTEN=tcp:127.0.0.1:8765
+STREAM_LISTEN = os.getenv("STREAM_LISTEN", "")
+if API_WORKERS > 1 and STREAM_LISTEN:
+    raise RuntimeError("STREAM_LISTEN is per-process; with WEB_CONCURRENCY > 1 use INGEST_TRANSPORT=http in tail_ingest")
+
+STREAM_SERVER: Optional[StreamServer] = None
+
+
+def _ingest_stream_frames(frames: List[Tuple[str, bytes]]) -> bool:
+    """stream sink：一批帧要么整体入队（返回 True 后服务端才 ACK），要么整体拒绝（服务端暂停读，稍后重试）。"""
+    syslog = [p for k, p in frames if k == "event"]
+    evidence = [p for k, p in frames if k == "evidence"]
+    syslog_ids = [_new_event_id() for _ in syslog]
+    evidence_ids = [_new_evidence_id() for _ in evidence]
+
+    if INGEST_QUEUE is None:
+        _upsert_committed(_build_all(_syslog_event_from_payload, syslog, syslog_ids, "event"))
+        _evidence_committed(_build_all(_evidence_from_payload, evidence, evidence_ids, "evidence"))
+        return True
+
+    # 满了是背压（客户端稍后重发），不算 dropped：先探容量，不让 submit 记丢弃
+    if not INGEST_QUEUE.can_accept(len(frames)):
+        return False
+
+    # syslog 和 evidence 放进同一个 job：只有一次 submit，成败就是整批的成败（返回 True 服务端才 ACK）。
+    # 重连重发的重复帧在 worker 解码后判重
+    def prepare() -> Tuple[List[Event], List[EvidenceItem]]:
+        return (
+            _build_all(_syslog_event_from_payload, syslog, syslog_ids, "event", job),
+            _build_all(_evidence_from_payload, evidence, evidence_ids, "evidence", job),
+        )
+
+    def commit(built: Tuple[List[Event], List[EvidenceItem]]) -> int:
+        events, items = built
+        return _upsert_committed(events) + (_evidence_committed(items) if items else 0)
+
+    job = IngestJob(prepare=prepare, commit=commit, records=len(frames), kind="stream")
+    return INGEST_QUEUE.submit(job)
+
+
+@app.on_event("startup")
+async def _start_stream_server():
+    global STREAM_SERVER
+    if not STREAM_LISTEN:
+        return
+    STREAM_SERVER = StreamServer(_ingest_stream_frames)
+    await STREAM_SERVER.start(STREAM_LISTEN)
+
+
+@app.get("/api/ingest/stream/stats")
+def ingest_stream_stats():
+    if STREAM_SERVER is None:
+        return {"ok": True, "enabled": False}
+    return {"ok": True, "enabled": True, "generated_at": _now_iso(), "stats": STREAM_SERVER.snapshot()}
+
+
+@app.on_event("shutdown")
+async def _stop_ingest():
+    # 先停收包，再排空队列（graceful：已接收的都处理完）
+    if LISTENER is not None:
+        await LISTENER.stop()
+    if STREAM_SERVER is not None:
+        await STREAM_SERVER.stop()
+    if INGEST_QUEUE is not None:
+        await INGEST_QUEUE.stop(drain_timeout=INGEST_DRAIN_TIMEOUT)
+    # 队列排空之后：内存 store 最后一次 checkpoint（下次启动只加载 snapshot）
+    if hasattr(store, "close"):
+        await asyncio.to_thread(store.close)
+
 
-    store.upsert_events([e])
-    return {"ok": True, "event_id": e.event_id, "fingerprint": fp, "title": title, "category": category}
+@app.get("/api/ingest/listener/stats")
+def ingest_listener_stats():
+    if LISTENER is None:
+        return {"ok": True, "enabled": False}
+    return {"ok": True, "enabled": True, "generated_at": _now_iso(), "stats": LISTENER.snapshot()}
 
 # =============================
 # Events APIs
@@ -531,8 +1106,146 @@ def ingest(events: list[Event]):
     return IngestResponse(inserted=len(ids), event_ids=ids)
 
 
+# -----------------------------
+# streaming NDJSON bulk ingest
+# -----------------------------
+# body 边读边按行切，攒满 INGEST_STREAM_CHUNK 行就校验+写入一次；
+# 内存只和 chunk 大小有关，与上传总量无关。返回只有计数和（截断的）错误列表，不回显 ID。
+INGEST_STREAM_CHUNK = int(os.getenv("INGEST_STREAM_CHUNK", "1000"))
+INGEST_STREAM_MAX_LINE = int(os.getenv("INGEST_STREAM_MAX_LINE", str(1024 * 1024)))
+INGEST_STREAM_MAX_ERRORS = 100
+
+
+async def _iter_ndjson_chunks(req: Request, stats: Dict[str, Any]):
+    """
+    逐块读取 request body，按 LF 切行，每 INGEST_STREAM_CHUNK 行 yield 一次 [(line_no, bytes)]。
+    超长行（> INGEST_STREAM_MAX_LINE）直接记错误并丢弃到下一个换行。
+    """
+    buf = bytearray()
+    chunk: List[Tuple[int, bytes]] = []
+    line_no = 0
+    skipping = False
+
+    def take(line: bytes):
+        nonlocal line_no
+        line_no += 1
+        if line.strip():
+            chunk.append((line_no, bytes(line)))
+
+    def too_long():
+        nonlocal line_no
+        line_no += 1
+        _stream_error(stats, line_no, f"line exceeds {INGEST_STREAM_MAX_LINE} bytes")
+
+    async for data in req.stream():
+        buf += data
+        start = 0
+        while True:
+            nl = buf.find(b"\n", start)
+            if nl < 0:
+                break
+            if skipping:
+                skipping = False
+            elif nl - start > INGEST_STREAM_MAX_LINE:
+                # 整行（连同换行）在同一次读里到齐的超长行：同样拒掉，不交给解析
+                too_long()
+            else:
+                take(buf[start:nl])
+            start = nl + 1
+        del buf[:start]
+
+        if skipping:
+            # 还在丢同一条超长行（这次读里没见到换行）：已经记过错了，只清缓冲
+            buf.clear()
+        elif len(buf) > INGEST_STREAM_MAX_LINE:
+            too_long()
+            buf.clear()
+            skipping = True
+
+        if len(chunk) >= INGEST_STREAM_CHUNK:
+            yield chunk
+            chunk = []
+
+    if buf.strip() and not skipping:
+        take(buf)
+    if chunk:
+        yield chunk
+
+
+def _stream_error(stats: Dict[str, Any], line_no: int, err: str) -> None:
+    stats["rejected"] += 1
+    if len(stats["errors"]) < INGEST_STREAM_MAX_ERRORS:
+        stats["errors"].append({"line": line_no, "error": err[:300]})
+
+
+def _validate_event_lines(chunk: List[Tuple[int, bytes]], stats: Dict[str, Any]) -> List[Event]:
+    events: List[Event] = []
+    for line_no, line in chunk:
+        try:
+            events.append(Event.model_validate_json(line))
+        except Exception as ex:
+            _stream_error(stats, line_no, str(ex))
+    return events
+
+
+def _build_evidence_lines(chunk: List[Tuple[int, bytes]], stats: Dict[str, Any]) -> List[EvidenceItem]:
+    items: List[EvidenceItem] = []
+    for line_no, line in chunk:
+        try:
+            items.append(_evidence_from_payload(json.loads(line)))
+        except Exception as ex:
+            _stream_error(stats, line_no, str(ex))
+    return items
+
+
+@app.post("/api/events/ingest/stream")
+async def ingest_stream(req: Request):
+    """
+    NDJSON 流式批量导入（每行一个 Event JSON，结构同 /api/events/ingest 的数组元素）。
+    例：curl -T day.ndjson -H 'Content-Type: application/x-ndjson' .../api/events/ingest/stream
+    校验在线程里做（不卡 event loop），写入回到 event loop 上按 chunk 执行。
+    """
+    stats: Dict[str, Any] = {"received": 0, "inserted": 0, "rejected": 0, "chunks": 0, "errors": []}
+    async for chunk in _iter_ndjson_chunks(req, stats):
+        stats["received"] += len(chunk)
+        events = await asyncio.to_thread(_validate_event_lines, chunk, stats)
+        if events:
+            await _store_write(store.upsert_events, events)
+        stats["inserted"] += len(events)
+        stats["chunks"] += 1
+    return {"ok": True, **stats}
+
+
+@app.post("/api/evidence/ingest/stream")
+async def evidence_ingest_stream(req: Request):
+    """NDJSON 流式导入 evidence（每行一个 payload，字段同 /api/evidence/ingest，同样逐条脱敏）。"""
+    stats: Dict[str, Any] = {"received": 0, "inserted": 0, "rejected": 0, "chunks": 0, "errors": []}
+    async for chunk in _iter_ndjson_chunks(req, stats):
+        stats["received"] += len(chunk)
+        items = await asyncio.to_thread(_build_evidence_lines, chunk, stats)
+        await _store_write(_append_evidence, items)
+        stats["inserted"] += len(items)
+        stats["chunks"] += 1
+    return {"ok": True, **stats}
+
+
 @app.get("/api/events", response_model=list[Event])
-def list_events(limit: int = 20):
+def list_events(
+    limit: int = 20,
+    host: Optional[List[str]] = Query(None),
+    category: Optional[List[str]] = Query(None),
+    label: Optional[List[str]] = Query(None),
+    entity: Optional[List[str]] = Query(None),
+):
+    """
+    host / category / label / entity 任意组合（可重复，如 ?label=link&label=flap），全部命中才返回；
+    entity 匹配 entities 的 name 和 syslog 解析出的字段值（脱敏后的 IP / MAC token、端口等），大小写不敏感。
+    """
+    filters = {"host": host, "category": category, "label": label, "entity": entity}
+    if any(filters.values()):
+        if not hasattr(store, "query_events"):
+            raise HTTPException(status_code=501, detail="store does not support filtered event queries")
+        return store.query_events(limit=max(0, min(limit, 5000)), **filters)
     try:
         return store.list_events(limit=limit)
     except TypeError:
@@ -545,9 +1258,53 @@ def list_events(limit: int = 20):
         return items
 
 
+@app.get("/api/events/raw", response_model=list[Event])
+def list_raw_events(since: Optional[str] = None, until: Optional[str] = None, limit: int = 100):
+    """保留窗口内的原始事件（不聚合），since <= ts < until，最新在前；只扫相交的时间分片。"""
+    if not hasattr(store, "events_between"):
+        raise HTTPException(status_code=501, detail="store does not support time-range queries")
+    lo = _safe_parse_dt(since).timestamp() if since else None
+    hi = _safe_parse_dt(until).timestamp() if until else None
+    return store.events_between(lo, hi, limit=max(0, min(limit, 5000)))
+
+
+@app.get("/api/events/{event_id}/histogram")
+def event_histogram(event_id: str, window_s: int = 300):
+    """
+    聚合的出现次数直方图（sparkline）：minute = 最近 60 分钟每分钟次数，hour = 最近 48 小时每小时次数（旧 -> 新）；
+    count_window = 最近 window_s 秒的次数。event_id 可以是聚合视图 id、原始事件 id 或 fingerprint。
+    """
+    if not hasattr(store, "histogram"):
+        raise HTTPException(status_code=501, detail="store does not support occurrence histograms")
+    h = store.histogram(event_id)
+    if h is None:
+        raise HTTPException(status_code=404, detail="no aggregate for this event")
+    window_s = max(1, window_s)
+    return {"ok": True, "event_id": event_id, "window_s": window_s, "count_window": store.count_since(event_id, window_s), **h}
+
+
+@app.get("/api/store/stats")
+def store_stats():
+    if not hasattr(store, "partition_stats"):
+        return {"ok": True, "generated_at": _now_iso(), "stats": None}
+    out = {"ok": True, "generated_at": _now_iso(), "stats": store.partition_stats()}
+    if hasattr(store, "journal_stats"):
+        out["journal"] = store.journal_stats()
+    if hasattr(store, "index_stats"):
+        out["index"] = store.index_stats()
+    return out
+
+
 # =============================
 # Focus
 # =============================
+def _spark(e: Event) -> List[int]:
+    if not hasattr(store, "histogram") or not (e.fingerprint or "").strip():
+        return []
+    h = store.histogram(e.fingerprint.strip())
+    return h["minute"] if h else []
+
+
 @app.get("/api/focus", response_model=FocusResponse)
 def focus(top: int = 3):
     events = store.recent_events(limit=50)
@@ -559,17 +1316,19 @@ def focus(top: int = 3):
         cnt = int(agg.get("count") or 1)
         fs = agg.get("first_seen")
         ls = agg.get("last_seen")
+        last_5m = int(agg.get("last_5m") or 0)
+        rate = f"，近 5 分钟 {last_5m} 次" if last_5m else ""
 
         one_line = ""
         if "MAC_FLAPPING" in (e.category or "").upper():
             if lvl == "HIGH":
                 one_line = (
-                    f"高频 MAC 漂移（{cnt} 次，{fs} ~ {ls}），"
+                    f"高频 MAC 漂移（{cnt} 次，{fs} ~ {ls}{rate}），"
                     "高度怀疑二层环路、聚合口异常或转发表震荡，建议立即排查并必要时隔离端口。"
                 )
             elif lvl == "MEDIUM":
                 one_line = (
-                    f"MAC 漂移（{cnt} 次，{fs} ~ {ls}），"
+                    f"MAC 漂移（{cnt} 次，{fs} ~ {ls}{rate}），"
                     "建议检查 STP 状态、聚合口配置一致性及上下联口。"
                 )
             else:
@@ -593,6 +1352,7 @@ def focus(top: int = 3):
             risk_level=lvl,
             one_line=one_line,
             score=float(score),
+            spark=_spark(e),
         )
         for score, lvl, e, one_line in scored[:top]
     ]
@@ -167,6 +167,7 @@ class FocusItem(BaseModel):
     risk_level: RiskLevel | str
     one_line: Optional[str] = None
     score: float = 0.0
+    spark: List[int] = Field(default_factory=list)  # 最近 60 分钟每分钟出现次数（旧 -> 新）
 
 
 class FocusResponse(BaseModel):
@@ -44,13 +44,19 @@ def score_event(e: Event) -> Tuple[float, RiskLevel]:
       (score: float, level: "LOW"|"MEDIUM"|"HIGH")
 
     规则：
-    1) MAC_FLAPPING：基于 aggregate.count + 事件持续时间 duration_s 做分级（可解释、演示友好）
-    2) 其他事件：保留一个朴素、可解释的规则（severity/title/labels/evidence）
+    1) MAC_FLAPPING：基于最近 1 小时次数（没有速率字段时用 aggregate.count）+ 事件持续时间 duration_s 做分级，
+       最近 5 分钟的突发再加分（可解释、演示友好）
+    2) 其他事件：保留一个朴素、可解释的规则（severity/title/labels/evidence），最近 5 分钟高频再加分
+
+    aggregate.last_5m / last_60m 来自 store 的分钟计数环：一周前刷过 500 次、现在已经安静的，不会和正在刷的同分
     """
 
     # ===== 聚合信息 =====
     agg: Dict[str, Any] = getattr(e, "aggregate", None) or {}
     count = int(agg.get("count") or 1)
+    # 速率：store 给的聚合视图都有；外部传进来的事件可能没有，退回总次数
+    last_5m = int(agg.get("last_5m") or 0)
+    recent = int(agg["last_60m"]) if agg.get("last_60m") is not None else count
 
     first_seen = _parse_ts(agg.get("first_seen") or getattr(e, "ts", None))
     last_seen = _parse_ts(agg.get("last_seen") or getattr(e, "ts", None))
@@ -67,16 +73,16 @@ def score_event(e: Event) -> Tuple[float, RiskLevel]:
     # 1) MAC_FLAPPING 专项评分
     # ==========================
     if "MAC_FLAPPING" in cat or "MAC_FLAPPING" in fp or "MAC_FLAPPING" in title:
-        # 分数：次数 + 持续（加上上限，避免爆表）
-        score = 10.0 + min(count, 200) * 2.0 + min(duration_s, 1800) * 0.05
+        # 分数：最近 1 小时次数 + 持续 + 最近 5 分钟突发（加上上限，避免爆表）
+        score = 10.0 + min(recent, 200) * 2.0 + min(duration_s, 1800) * 0.05 + min(last_5m, 100) * 1.0
 
         # 分级阈值（演示用清晰可解释）
-        # - HIGH：次数很多且持续 >= 60s，倾向环路/聚合配置/接入侧异常
-        # - MEDIUM：有明显重复且持续 >= 30s
-        # - LOW：偶发/短时抖动
-        if count >= 20 and duration_s >= 60:
+        # - HIGH：最近次数很多且持续 >= 60s，或 5 分钟内 >= 20 次，倾向环路/聚合配置/接入侧异常
+        # - MEDIUM：最近有明显重复且持续 >= 30s
+        # - LOW：偶发/短时抖动，或早就不刷了
+        if (recent >= 20 and duration_s >= 60) or last_5m >= 20:
             return score, "HIGH"
-        if count >= 5 and duration_s >= 30:
+        if recent >= 5 and duration_s >= 30:
             return score, "MEDIUM"
         return score, "LOW"
 
@@ -99,6 +105,12 @@ def score_event(e: Event) -> Tuple[float, RiskLevel]:
     if "core" in labels_s:
         s += 20
 
+    # 最近 5 分钟还在高频出现
+    if last_5m >= 50:
+        s += 25
+    elif last_5m >= 10:
+        s += 15
+
     # evidence 可能不存在（或结构不同），全部做容错
     ev = getattr(e, "evidence", None)
     if ev is not None:
@@ -1,10 +1,24 @@
 from __future__ import annotations
 
+from array import array
+from collections import deque
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from datetime import datetime, timezone
+import gc
+import heapq
+import itertools
+import threading
+import time
 import uuid
+
+from sortedcontainers import SortedDict, SortedList
+
+from app.compact import EventCodec, EventColumns, Packed
+from app.histogram import OccurrenceHistogram, recent_counts, seeded, series_payload
 from app.models import Event
+from app.store_journal import WAL_EVENTS, WAL_EVIDENCE, StoreJournal
 
 
 from datetime import datetime, timezone
@@ -35,25 +49,251 @@ def _parse_ts(s: str) -> datetime:
 
 
 
-@dataclass
+def _ts_epoch(s: str) -> float:
+    return _parse_ts(s).timestamp()
+
+
+# 二级索引（/api/events?host=&category=&label=&entity=）的维度；词项 = "<维度>:<小写值>"
+INDEX_FIELDS = ("host", "category", "label", "entity")
+# parse_syslog 的 fields 里不进索引的：自由文本 / 几乎每条都一样的
+_FIELD_SKIP = {"body", "vendor"}
+_TERM_MAX = 128
+
+
+def index_terms(e: Event) -> Tuple[str, ...]:
+    """
+    一条事件的索引词项：source.host（没有就 source.name）、category、labels、entities 的 name，
+    以及 raw.parsed.fields 里的短字符串值（脱敏后的 IP / MAC token、端口名等）都算 entity。
+    """
+    src_extra = e.source.model_extra
+    pairs = [("host:", (src_extra.get("host") if src_extra else None) or e.source.name), ("category:", e.category)]
+    pairs += [("label:", v) for v in e.labels]
+    pairs += [("entity:", ent.name) for ent in e.entities]
+    extra = e.model_extra
+    raw = extra.get("raw") if extra else None
+    parsed = raw.get("parsed") if isinstance(raw, dict) else None
+    fields = parsed.get("fields") if isinstance(parsed, dict) else None
+    if isinstance(fields, dict):
+        pairs += [("entity:", v) for k, v in fields.items() if k not in _FIELD_SKIP]
+    terms = set()
+    for kind, v in pairs:
+        if isinstance(v, str) and len(v) <= _TERM_MAX:
+            v = v.strip()
+            if v:
+                terms.add(kind + v.lower())
+    return tuple(sorted(terms))
+
+
+def query_terms(filters: Dict[str, Optional[Iterable[str]]]) -> List[str]:
+    """{"host": ["core-sw-01"], "label": [...]} -> 要求同时命中的词项（和 index_terms 同样的归一化）。"""
+    out = []
+    for kind in INDEX_FIELDS:
+        for v in filters.get(kind) or ():
+            if v and v.strip():
+                out.append(f"{kind}:{v.strip().lower()}")
+    return out
+
+
+@dataclass(slots=True)
 class _AggRecord:
     event_id: str                 # 当前聚合事件的主 event_id（展示用）
     fingerprint: str
     count: int
     first_seen: str
     last_seen: str
+    first_seen_epoch: float = 0.0
+    last_seen_epoch: float = 0.0
+    seq: int = 0                  # 第一次出现的顺序（last_seen 相同时先来的排前面）
+    base: Optional[Packed] = None # 第一条事件的紧凑编码（聚合视图的 base，读时再还原成 Event）
+    hist: Optional[OccurrenceHistogram] = None  # 分钟 / 小时计数环；第二次出现时才建
 
 
-class InMemoryStore:
+# 排序索引的 key：(last_seen epoch, -seq, fingerprint / event_id)，倒序遍历 = 最新在前
+_IndexKey = Tuple[float, int, str]
+
+
+def _newest(index: SortedList, k: int):
+    """索引尾部 k 个，最新在前：O(log n + k)。"""
+    n = len(index)
+    return index.islice(max(0, n - k), n, reverse=True)
+
+
+# 一条待写入的事件：(event_id, ts, ts epoch, strip 过的 fingerprint, 紧凑编码, 索引词项)
+_Rec = Tuple[str, str, float, str, Packed, Tuple[str, ...]]
+
+# snapshot 格式版本（app/store_journal.py 只管文件，内容由 InMemoryStore._capture / _restore 定）
+_SNAPSHOT_VERSION = 3  # 3：聚合的二级索引按倒排集合存（词项 -> fingerprint 列表）
+# 还能读的旧版本：1 = 没有索引词项（恢复时从聚合 base 和原始事件重新算）；2 = 每个聚合一列词项
+_SNAPSHOT_COMPAT = (1, 2, 3)
+
+
+class _Gate:
+    """写入共享、checkpoint 独占：checkpoint 等正在写的批次做完，期间新的写入先等着（切点精确，WAL 重放不重复计数）。"""
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._writers = 0
+        self._closed = False
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        with self._cond:
+            while self._closed:
+                self._cond.wait()
+            self._writers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writers -= 1
+                if not self._writers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        with self._cond:
+            while self._closed:
+                self._cond.wait()
+            self._closed = True
+            while self._writers:
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._closed = False
+                self._cond.notify_all()
+
+
+# 聚合视图还原前的快照：(排序 key, event_id, last_seen, base, aggregate)
+_AggSnap = Tuple[_IndexKey, str, str, Packed, Dict[str, Any]]
+
+
+class _Stripe:
+    """一个锁分片：fingerprint 按 hash 落到某个 stripe，该 fingerprint 的聚合记录和 last_seen 索引项都只在这里。"""
+
+    __slots__ = ("lock", "agg", "by_last_seen")
+
     def __init__(self) -> None:
-        # event_id -> Event（用于 /api/events 原始查看）
-        self._events: Dict[str, Event] = {}
+        self.lock = threading.Lock()
+        # fingerprint -> _AggRecord
+        self.agg: Dict[str, _AggRecord] = {}
+        # 按 last_seen 排好序的索引（upsert 时维护）：读 top-N 只取尾部 k 个
+        self.by_last_seen: SortedList = SortedList()
+
+
+def _intersect(ix: Dict[str, Set[str]], terms: List[str]) -> Set[str]:
+    """倒排集合求交：按大小从小到大，先拿最小的拷一份，之后每一步只遍历当前结果。"""
+    sets = [ix.get(t) for t in terms]
+    if any(not s for s in sets):
+        return set()
+    sets.sort(key=len)
+    out = set(sets[0])
+    for s in sets[1:]:
+        out.intersection_update(s)
+        if not out:
+            break
+    return out
+
+
+class _Partition:
+    """一个时间分片（按事件 ts 落在 [start, start + partition_s)）里的原始事件，列存（见 app/compact.py）。"""
+
+    __slots__ = ("start", "events", "_bytes", "_dirty")
+
+    def __init__(self, start: float, codec: EventCodec):
+        self.start = start
+        self.events = EventColumns(codec)
+        self._bytes = 0
+        self._dirty = True
+
+    def approx_bytes(self) -> int:
+        # 估算只在查询时做，分片没变就用上次的结果
+        if self._dirty:
+            self._bytes = self.events.approx_bytes()
+            self._dirty = False
+        return self._bytes
+
 
-        # fingerprint -> _AggRecord（用于聚合）
-        self._agg: Dict[str, _AggRecord] = {}
+class InMemoryStore:
+    """
+    线程安全：FastAPI 线程池里的同步端点和 async 的 syslog 入口会同时读写同一个 store。
+
+    - 聚合按 fingerprint hash 分到 stripes 个 _Stripe，各自一把锁：不同 fingerprint 的 upsert 基本不互相等
+    - 原始事件分片 / 无 fingerprint 索引 / 过期计数 / seq 计数器一把 _raw_lock；聚合视图 event_id 反向索引一把 _id_lock
+      （只会在 stripe 锁里面再拿 _id_lock，不会反过来，不会死锁）
+    - 锁顺序：_raw_lock -> stripe 锁（按下标升序）-> _id_lock / _ix_lock；写入在放 _raw_lock 之前先拿齐本批要的
+      stripe 锁（hand-over-hand），所以各 stripe 的应用顺序 = 拿 _raw_lock 的顺序 = WAL 帧顺序
+    - 压缩编码（codec.pack）和解码（codec.unpack）都在锁外做；读只在锁里拷快照（几个引用），不阻塞写太久
+    - 读是「每个 stripe 各自一致」的快照：同一个 fingerprint 的 count / first_seen / last_seen 一定是同一时刻的
+    - 二级索引：词项 -> 聚合 fingerprint 集合（_ix_lock）/ 无 fingerprint 原始事件 event_id 集合（_raw_lock），
+      写入时增量维护；query_events 从最小的集合开始求交，只按命中数排序
+    - attach_journal() 之后每批写入追加到 WAL，定期 checkpoint 成 snapshot；重启时 snapshot + WAL 尾巴恢复（app/store_journal.py）
+    """
 
-        # fingerprint -> Event（用于 focus/top3 展示：存一份“聚合视图事件”）
-        self._agg_event: Dict[str, Event] = {}
+    def __init__(
+        self,
+        partition_s: float = 60.0,
+        retention_s: float = 0.0,
+        clock: Callable[[], float] = time.time,
+        stripes: int = 16,
+        evidence_max: int = 5000,
+    ) -> None:
+        # 原始事件按事件时间分片（默认每分钟一片）：bucket -> _Partition；
+        # retention_s > 0 时整片过期丢弃（不扫其他分片），0 = 永久保留
+        self.partition_s = max(1.0, float(partition_s))
+        self.retention_s = max(0.0, float(retention_s))
+        self._clock = clock
+        self._raw_lock = threading.Lock()
+        self._partitions: SortedDict = SortedDict()
+        # event_id -> bucket（get_event / 覆盖写定位分片用；分片过期时只清该分片自己的 id）
+        self._event_bucket: Dict[str, int] = {}
+        self.expired_events = 0
+        self.expired_partitions = 0
+        # 字符串字典（category / severity / source / fingerprint）所有分片和聚合 base 共用（自带锁）
+        self._codec = EventCodec()
+
+        # fingerprint -> stripe（聚合记录 + last_seen 索引）
+        self._stripes: List[_Stripe] = [_Stripe() for _ in range(max(1, int(stripes)))]
+
+        # 没 fingerprint 的原始事件单独一个索引（event_id -> 当前 key，覆盖写时删旧 key）；归 _raw_lock 管
+        self._nofp_by_ts: SortedList = SortedList()
+        self._nofp_key: Dict[str, _IndexKey] = {}
+        # 无 fingerprint 原始事件的二级索引：词项 -> event_id 集合；event_id -> 它的词项（覆盖写 / 过期时撤掉）
+        self._raw_ix: Dict[str, Set[str]] = {}
+        self._nofp_terms: Dict[str, Tuple[str, ...]] = {}
+
+        # 聚合的二级索引：词项 -> fingerprint 集合（和 _id_lock 一样只在 stripe 锁里面再拿）
+        self._ix_lock = threading.Lock()
+        self._agg_ix: Dict[str, Set[str]] = {}
+
+        # 聚合视图 event_id -> fingerprint（agg_e.event_id 每次改指向最新一条时同步维护）：get_event 不用扫全表
+        self._id_lock = threading.Lock()
+        self._agg_by_event_id: Dict[str, str] = {}
+        # 下一个可用的 seq（归 _raw_lock 管）：每批在 _raw_lock 里一次预留 len(batch) 个，批内第 i 条用 base + i，
+        # 并发写入时的取值也和 WAL 重放时一致（first_seen 相同时的先后、by_last_seen 的 tie-break 不变）
+        self._next_seq = 0
+
+        # evidence：(ts epoch, event_id, asdict(EvidenceItem))，只保留最近 evidence_max 条
+        self._ev_lock = threading.Lock()
+        self._evidence: Deque[Tuple[float, Optional[str], Dict[str, Any]]] = deque(maxlen=max(1, int(evidence_max)))
+
+        # 写入共享 / checkpoint 独占；_journal = None 时不落盘
+        self._gate = _Gate()
+        self._journal: Optional[StoreJournal] = None
+        self._ckpt_lock = threading.Lock()
+
+    def _stripe(self, fp: str) -> _Stripe:
+        return self._stripes[hash(fp) % len(self._stripes)]
+
+    @property
+    def _agg(self) -> Dict[str, _AggRecord]:
+        """所有 stripe 的聚合记录合成一个 dict 的拷贝（bench / 调试用，不在热路径上）。"""
+        out: Dict[str, _AggRecord] = {}
+        for st in self._stripes:
+            with st.lock:
+                out.update(st.agg)
+        return out
 
     def ingest_event(self, event: dict) -> dict:
         """
@@ -86,86 +326,681 @@ class InMemoryStore:
         return event
 
     def upsert_events(self, events: List[Event]) -> List[str]:
-        inserted_ids: List[str] = []
-
-        for e in events:
-            # 1) 原始事件入库（按 event_id）
-            self._events[e.event_id] = e
-            inserted_ids.append(e.event_id)
-
-            fp = (e.fingerprint or "").strip()
-
-            # 2) 没 fingerprint：就不做聚合（仍然保留原始事件）
-            if not fp:
-                continue
-
-            # 3) 聚合：第一次见
-            if fp not in self._agg:
-                first = e.ts
-                last = e.ts
-                self._agg[fp] = _AggRecord(
-                    event_id=e.event_id,
-                    fingerprint=fp,
-                    count=1,
-                    first_seen=first,
-                    last_seen=last,
-                )
-                # 聚合视图事件：用第一条事件做 base
-                agg_e = e.model_copy(deep=True)
-                agg_e.aggregate = {"count": 1, "first_seen": first, "last_seen": last}
-                agg_e.fingerprint = fp
-                self._agg_event[fp] = agg_e
-                continue
-
-            # 4) 聚合：更新 count/last_seen，并把展示 event_id 也更新成最新一条
-            rec = self._agg[fp]
-            rec.count += 1
-            # first_seen 保持最早
-            if _parse_ts(e.ts) < _parse_ts(rec.first_seen):
-                rec.first_seen = e.ts
-            # last_seen 更新为最新
-            if _parse_ts(e.ts) > _parse_ts(rec.last_seen):
-                rec.last_seen = e.ts
-                rec.event_id = e.event_id
-
-            # 5) 同步到聚合视图事件（这是 focus/top3 看到的内容）
-            agg_e = self._agg_event[fp]
-            agg_e.aggregate = {
+        # 锁外：解析时间、压缩编码（最贵的部分，多线程 ingest 时各线程并行做）
+        recs = [
+            (e.event_id, e.ts, _ts_epoch(e.ts), (e.fingerprint or "").strip(), self._codec.pack(e), index_terms(e))
+            for e in events
+        ]
+        wal_rows = None if self._journal is None else [self._wal_row(r) for r in recs]
+        with self._gate.shared():
+            self._apply(recs, wal_rows)
+        return [e.event_id for e in events]
+
+    def _apply(self, recs: List[_Rec], wal_rows: Optional[List[Tuple[Any, ...]]] = None) -> None:
+        """
+        wal_rows 给了就在 _raw_lock 里追加 WAL 帧（WAL 重放调用时不给）。
+        放 _raw_lock 之前先拿齐要用的 stripe 锁：并发写入同一个 fingerprint 时，聚合的应用顺序和 WAL 帧顺序一致，
+        重放出来的 base / event_id / first_seen 和线上一样。
+        """
+        # 1) 原始事件入库：整批一次 _raw_lock（按 event_id，放进事件时间对应的分片；早于保留窗口的不存原始事件，只计入聚合）
+        by_stripe: Dict[int, List[Tuple[int, _Rec]]] = {}
+        with self._raw_lock:
+            self._expire_locked()
+            base = self._next_seq
+            self._next_seq += len(recs)
+            for seq, r in enumerate(recs, base):
+                event_id, ts, ts_epoch, fp, packed, terms = r
+                stored = self._put_raw(event_id, ts, ts_epoch, packed)
+
+                # 同一个 event_id 覆盖写：旧的「无 fingerprint」索引项作废
+                old_key = self._nofp_key.pop(event_id, None)
+                if old_key is not None:
+                    self._nofp_by_ts.remove(old_key)
+                    self._unindex_raw(event_id)
+
+                # 2) 没 fingerprint：就不做聚合（仍然保留原始事件）
+                if not fp:
+                    if stored:
+                        key = (ts_epoch, -seq, event_id)
+                        self._nofp_key[event_id] = key
+                        self._nofp_by_ts.add(key)
+                        self._nofp_terms[event_id] = terms
+                        for t in terms:
+                            self._raw_ix.setdefault(t, set()).add(event_id)
+                    continue
+                by_stripe.setdefault(hash(fp) % len(self._stripes), []).append((seq, r))
+
+            if wal_rows is not None:
+                self._journal.append(WAL_EVENTS, wal_rows, len(recs))
+            locked = [self._stripes[i] for i in sorted(by_stripe)]
+            for st in locked:
+                st.lock.acquire()
+
+        # 3) 聚合：每个 stripe 拿一次锁（上面已拿），同一 fingerprint 仍按批内顺序
+        try:
+            for i, items in by_stripe.items():
+                st = self._stripes[i]
+                for seq, r in items:
+                    self._upsert_agg(st, seq, *r)
+        finally:
+            for st in locked:
+                st.lock.release()
+
+    def _unindex_raw(self, event_id: str) -> None:
+        """调用方持有 _raw_lock。"""
+        for t in self._nofp_terms.pop(event_id, ()):
+            ids = self._raw_ix.get(t)
+            if ids is not None:
+                ids.discard(event_id)
+                if not ids:
+                    del self._raw_ix[t]
+
+    def _upsert_agg(
+        self, st: _Stripe, seq: int, event_id: str, ts: str, ts_epoch: float, fp: str, packed: Packed, terms: Tuple[str, ...],
+    ) -> None:
+        """调用方持有 st.lock。"""
+        rec = st.agg.get(fp)
+
+        # 聚合：第一次见
+        if rec is None:
+            rec = st.agg[fp] = _AggRecord(
+                event_id=event_id,
+                fingerprint=fp,
+                count=1,
+                first_seen=ts,
+                last_seen=ts,
+                first_seen_epoch=ts_epoch,
+                last_seen_epoch=ts_epoch,
+                seq=seq,
+                # 聚合视图事件：用第一条事件做 base（只存编码，展示时由 _agg_view 还原）
+                base=packed,
+            )
+            st.by_last_seen.add((ts_epoch, -rec.seq, fp))
+            with self._id_lock:
+                self._agg_by_event_id[event_id] = fp
+            self._index_agg(fp, terms)
+            return
+
+        # 同一 fingerprint 的后续事件一般词项都一样；有新的（比如换了 host / 多了 label）才拿 _ix_lock 并进索引。
+        # 不拿锁先查倒排集合：聚合的索引项只增不删，GIL 下读到「已在」就一定在（没读到也只是多拿一次锁）
+        ix = self._agg_ix
+        new_terms = [t for t in terms if fp not in ix.get(t, ())]
+        if new_terms:
+            self._index_agg(fp, new_terms)
+
+        # 聚合：更新 count/last_seen，并把展示 event_id 也更新成最新一条
+        rec.count += 1
+        if rec.hist is None:
+            rec.hist = seeded(rec.first_seen_epoch)
+        rec.hist.add(ts_epoch)
+        # first_seen 保持最早
+        if ts_epoch < rec.first_seen_epoch:
+            rec.first_seen = ts
+            rec.first_seen_epoch = ts_epoch
+        # last_seen 更新为最新（索引里挪位置：删旧 key、插新 key，各 O(log n)）
+        if ts_epoch > rec.last_seen_epoch:
+            st.by_last_seen.remove((rec.last_seen_epoch, -rec.seq, fp))
+            self._repoint_agg_event_id(fp, rec.event_id, event_id)
+            rec.last_seen = ts
+            rec.last_seen_epoch = ts_epoch
+            rec.event_id = event_id
+            st.by_last_seen.add((ts_epoch, -rec.seq, fp))
+
+    def _index_agg(self, fp: str, terms: Iterable[str]) -> None:
+        with self._ix_lock:
+            for t in terms:
+                self._agg_ix.setdefault(t, set()).add(fp)
+
+    # ---------- raw partitions（调用方持有 _raw_lock） ----------
+    def _put_raw(self, event_id: str, ts: str, ts_epoch: float, packed: Packed) -> bool:
+        b = int(ts_epoch // self.partition_s)
+        old_b = self._event_bucket.get(event_id)
+        if old_b is not None and old_b != b:
+            old_part = self._partitions.get(old_b)
+            if old_part is not None:
+                old_part.events.remove(event_id)
+                old_part._dirty = True
+            del self._event_bucket[event_id]
+        if self.retention_s and b < self._min_bucket():
+            self.expired_events += 1
+            return False
+        part = self._partitions.get(b)
+        if part is None:
+            part = self._partitions[b] = _Partition(b * self.partition_s, self._codec)
+        part.events.put_packed(event_id, ts, ts_epoch, packed)
+        part._dirty = True
+        self._event_bucket[event_id] = b
+        return True
+
+    def _min_bucket(self) -> int:
+        return int((self._clock() - self.retention_s) // self.partition_s)
+
+    def _raw_snapshot(self, event_id: str) -> Optional[Tuple[str, str, Packed]]:
+        b = self._event_bucket.get(event_id)
+        if b is None:
+            return None
+        cols = self._partitions[b].events
+        row = cols.rows.get(event_id)
+        return None if row is None else cols.snapshot(row)
+
+    def _raw_get(self, event_id: str) -> Optional[Event]:
+        with self._raw_lock:
+            snap = self._raw_snapshot(event_id)
+        return None if snap is None else self._codec.unpack(*snap)
+
+    def _iter_raw(self) -> Iterator[Event]:
+        with self._raw_lock:
+            snaps = [
+                part.events.snapshot(row)
+                for part in self._partitions.values()
+                for row, _ in part.events.iter_rows()
+            ]
+        for snap in snaps:
+            yield self._codec.unpack(*snap)
+
+    # ---------- aggregate views ----------
+    def _agg_snap(self, st: _Stripe, key: _IndexKey, now: float) -> _AggSnap:
+        """调用方持有 st.lock：拷出还原聚合视图要的字段（速率也在锁里算，和 count 是同一时刻的）。"""
+        rec = st.agg[key[2]]
+        aggregate = {
+            "count": rec.count,
+            "first_seen": rec.first_seen,
+            "last_seen": rec.last_seen,
+            **recent_counts(rec.hist, rec.first_seen_epoch, now),
+        }
+        return key, rec.event_id, rec.last_seen, rec.base, aggregate
+
+    def _agg_unpack(self, snap: _AggSnap) -> Event:
+        """聚合视图事件（focus/top3 看到的内容）：第一条事件做 base，event_id / ts 指向最新一条，带上 aggregate。"""
+        key, event_id, last_seen, base, aggregate = snap
+        return self._codec.unpack(event_id, last_seen, base, aggregate=aggregate, fingerprint=key[2])
+
+    def _agg_view(self, fp: str) -> Event:
+        st = self._stripe(fp)
+        with st.lock:
+            rec = st.agg[fp]
+            snap = self._agg_snap(st, (rec.last_seen_epoch, -rec.seq, fp), self._clock())
+        return self._agg_unpack(snap)
+
+    def _newest_aggs(self, limit: int) -> List[_AggSnap]:
+        """每个 stripe 各取最新 limit 个（各自锁里拷快照），再归并出全局最新 limit 个。"""
+        now = self._clock()
+        per: List[List[_AggSnap]] = []
+        for st in self._stripes:
+            with st.lock:
+                per.append([self._agg_snap(st, k, now) for k in _newest(st.by_last_seen, limit)])
+        merged = heapq.merge(*per, key=lambda s: s[0], reverse=True)
+        return list(itertools.islice(merged, limit))
+
+    def expire(self) -> int:
+        """丢弃整片落在保留窗口之外的分片；返回丢掉的原始事件数。聚合（聚合视图）不受影响。"""
+        with self._raw_lock:
+            return self._expire_locked()
+
+    def _expire_locked(self) -> int:
+        if not self.retention_s or not self._partitions:
+            return 0
+        min_b = self._min_bucket()
+        if self._partitions.peekitem(0)[0] >= min_b:
+            return 0
+        dropped = 0
+        while self._partitions and self._partitions.peekitem(0)[0] < min_b:
+            b, part = self._partitions.popitem(0)
+            for eid in part.events.ids_live():
+                if self._event_bucket.get(eid) == b:
+                    del self._event_bucket[eid]
+                if self._nofp_key.pop(eid, None) is not None:
+                    self._unindex_raw(eid)
+            dropped += len(part.events)
+            self.expired_partitions += 1
+        # 无 fingerprint 索引按 ts 排序：过期分片里的条目正好是一段前缀
+        cut = self._nofp_by_ts.bisect_left((min_b * self.partition_s,))
+        del self._nofp_by_ts[:cut]
+        self.expired_events += dropped
+        return dropped
+
+    def events_between(self, since: Optional[float] = None, until: Optional[float] = None, limit: int = 100) -> List[Event]:
+        """原始事件里 since <= ts < until 的，最新在前；只访问与时间范围相交的分片。"""
+        if limit <= 0:
+            return []
+        lo = int(since // self.partition_s) if since is not None else None
+        hi = int(until // self.partition_s) if until is not None else None
+        snaps: List[Tuple[str, str, Packed]] = []
+        with self._raw_lock:
+            self._expire_locked()
+            for b in self._partitions.irange(lo, hi, reverse=True):
+                cols = self._partitions[b].events
+                items = [
+                    (ts, row) for row, ts in cols.iter_rows()
+                    if (since is None or ts >= since) and (until is None or ts < until)
+                ]
+                items.sort(key=lambda x: x[0], reverse=True)
+                snaps.extend(cols.snapshot(row) for _, row in items[:limit - len(snaps)])
+                if len(snaps) >= limit:
+                    break
+        return [self._codec.unpack(*snap) for snap in snaps]
+
+    def partition_stats(self) -> Dict[str, Any]:
+        with self._raw_lock:
+            self._expire_locked()
+            parts = [
+                {
+                    "start": datetime.fromtimestamp(p.start, tz=timezone.utc).isoformat(),
+                    "events": len(p.events),
+                    "approx_bytes": p.approx_bytes(),
+                }
+                for p in self._partitions.values()
+            ]
+            raw_events = len(self._event_bucket)
+            expired_events, expired_partitions = self.expired_events, self.expired_partitions
+        return {
+            "partition_s": self.partition_s,
+            "retention_s": self.retention_s,
+            "raw_events": raw_events,
+            "aggregates": sum(len(st.agg) for st in self._stripes),
+            "stripes": len(self._stripes),
+            "expired_events": expired_events,
+            "expired_partitions": expired_partitions,
+            "approx_bytes": sum(p["approx_bytes"] for p in parts),
+            "partitions": parts,
+        }
+
+    # ---------- occurrence histogram ----------
+    def _fp_for(self, key: str) -> Optional[str]:
+        """fingerprint / 聚合视图 event_id / 原始事件 event_id -> fingerprint（不保证之后仍在，调用方再查一次）。"""
+        if key in self._stripe(key).agg:
+            return key
+        with self._id_lock:
+            fp = self._agg_by_event_id.get(key)
+        if fp is None:
+            with self._raw_lock:
+                snap = self._raw_snapshot(key)
+            if snap is None:
+                return None
+            fpc = snap[2][3]
+            fp = self._codec.fingerprints.get(fpc - 1).strip() if fpc else ""
+        return fp or None
+
+    def count_since(self, key: str, seconds: float) -> int:
+        """该聚合最近 seconds 秒里出现的次数（不需要原始事件还在）。"""
+        fp = self._fp_for(key)
+        if fp is None:
+            return 0
+        st = self._stripe(fp)
+        with st.lock:
+            rec = st.agg.get(fp)
+            if rec is None:
+                return 0
+            return (rec.hist or seeded(rec.first_seen_epoch)).count_since(seconds, self._clock())
+
+    def histogram(self, key: str) -> Optional[Dict[str, Any]]:
+        """sparkline 数据：最近 60 分钟的每分钟次数 + 最近 48 小时的每小时次数（旧 -> 新）。"""
+        fp = self._fp_for(key)
+        if fp is None:
+            return None
+        st = self._stripe(fp)
+        now = self._clock()
+        with st.lock:
+            rec = st.agg.get(fp)
+            if rec is None:
+                return None
+            return {
+                "fingerprint": fp,
                 "count": rec.count,
                 "first_seen": rec.first_seen,
                 "last_seen": rec.last_seen,
+                "now": datetime.fromtimestamp(now, tz=timezone.utc).isoformat(),
+                **series_payload(rec.hist, rec.first_seen_epoch, now),
             }
-            agg_e.event_id = rec.event_id  # 展示时指向最新一条 event
-            agg_e.ts = rec.last_seen       # ts 也用 last_seen 更直观
 
-        return inserted_ids
+    def _repoint_agg_event_id(self, fp: str, old_id: str, new_id: str) -> None:
+        # 旧 id 可能已经被别的聚合占用（event_id 重复写入），只删指向自己的
+        with self._id_lock:
+            if self._agg_by_event_id.get(old_id) == fp:
+                del self._agg_by_event_id[old_id]
+            self._agg_by_event_id[new_id] = fp
+
+    # ---------- evidence ----------
+    def append_evidence(self, items: List[Dict[str, Any]]) -> None:
+        """items = asdict(EvidenceItem)。"""
+        if not items:
+            return
+        with self._gate.shared():
+            self._append_evidence(items)
+            if self._journal is not None:
+                self._journal.append(WAL_EVIDENCE, items)
+
+    def _append_evidence(self, items: List[Dict[str, Any]]) -> None:
+        rows = [(_ts_epoch(it.get("ts") or ""), it.get("event_id"), it) for it in items]
+        with self._ev_lock:
+            self._evidence.extend(rows)
+
+    def recent_evidence(self, since: float, limit: int = 50, event_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """ts >= since 的 evidence，最新写入的在前（碰到第一条早于 since 的就停）；event_id 给了就只要关联到它的。"""
+        out: List[Dict[str, Any]] = []
+        if limit <= 0:
+            return out
+        with self._ev_lock:
+            for ts_epoch, eid, it in reversed(self._evidence):
+                if ts_epoch < since:
+                    break
+                if event_id and eid != event_id:
+                    continue
+                out.append(it)
+                if len(out) >= limit:
+                    break
+        return out
+
+    # ---------- snapshot + WAL ----------
+    def attach_journal(self, journal: StoreJournal) -> Dict[str, Any]:
+        """启动时调用一次：恢复 snapshot、重放 WAL 尾巴，之后的写入都记 WAL。返回恢复统计。"""
+        t0 = time.perf_counter()
+        # 恢复时一口气建几百万个长期存活的对象：分代 GC 会被反复触发、每次都扫一遍已建好的，先停掉；
+        # 建完 freeze 进永久代，之后的 full GC 也不用再扫这些
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            state, frames = journal.load()
+            restored = state is None or self._restore(state)
+            del state
+            t1 = time.perf_counter()
+            for kind, payload in frames:
+                if not restored:
+                    continue  # 帧照样读完（尾帧截断在迭代到最后时才做），但不重放
+                if kind == WAL_EVENTS:
+                    self._apply([self._unwal_row(row) for row in payload])
+                elif kind == WAL_EVIDENCE:
+                    self._append_evidence(payload)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        gc.freeze()
+        self._journal = journal
+        journal.start(self.checkpoint)
+        if not restored:
+            # snapshot 读不了：WAL 尾巴只是它之后的增量，叠在空 store 上 count / first_seen 全是错的。
+            # 从空开始，马上 checkpoint 一次让这段 WAL 作废，免得下次启动又把它重放进来
+            self.checkpoint()
+        return {
+            "snapshot_s": round(t1 - t0, 3),
+            "replay_s": round(time.perf_counter() - t1, 3),
+            "replayed_events": journal.stats["replayed_events"] if restored else 0,
+            "aggregates": sum(len(st.agg) for st in self._stripes),
+            "raw_events": len(self._event_bucket),
+        }
+
+    def checkpoint(self) -> Optional[int]:
+        """写一份 snapshot：写入暂停期间只轮转 WAL + 拷状态，序列化 / fsync 在暂停之外。返回 snapshot 字节数。"""
+        journal = self._journal
+        if journal is None or journal.read_only:
+            return None
+        with self._ckpt_lock:
+            with self._gate.exclusive():
+                covers = journal.rotate()
+                state = self._capture()
+            return journal.write_snapshot(state, covers)
+
+    def close(self) -> None:
+        """正常退出：最后一次 checkpoint（下次启动只读 snapshot，不用重放），然后停掉 WAL 线程。"""
+        journal = self._journal
+        if journal is None:
+            return
+        try:
+            self.checkpoint()
+        finally:
+            journal.close()
+
+    def journal_stats(self) -> Optional[Dict[str, Any]]:
+        return None if self._journal is None else self._journal.snapshot()
+
+    def _wal_row(self, r: _Rec) -> Tuple[Any, ...]:
+        """WAL 里存串而不是字典 code（code 只在本进程有效）。"""
+        event_id, ts, ts_epoch, _, (cat, sev, src, fp, blob), terms = r
+        c = self._codec
+        return (
+            event_id, ts, ts_epoch,
+            c.categories.get(cat), c.severities.get(sev), c.sources.get(src),
+            c.fingerprints.get(fp - 1) if fp else None,
+            blob, terms,
+        )
+
+    def _unwal_row(self, row: Tuple[Any, ...]) -> _Rec:
+        # 升级前写的 WAL 行没有词项（8 列）：解码出事件现算
+        event_id, ts, ts_epoch, cat, sev, src, fp, blob, *terms = row
+        c = self._codec
+        packed = (
+            c.categories.code(cat), c.severities.code(sev), c.sources.code(src),
+            0 if fp is None else c.fingerprints.code(fp) + 1,
+            blob,
+        )
+        terms = tuple(terms[0]) if terms else index_terms(c.unpack(event_id, ts, packed))
+        return event_id, ts, ts_epoch, (fp or "").strip(), packed, terms
+
+    def _capture(self) -> Dict[str, Any]:
+        """调用方持有 _gate 独占（没有写入在进行）：拷出全部状态，都是新建的 list / tuple / bytes，可以在锁外序列化。"""
+        # 聚合按列存：数值列用 array.tobytes()，marshal 读写都比百万个小 tuple 快
+        recs = [rec for st in self._stripes for rec in st.agg.values()]
+        aggs = (
+            [r.fingerprint for r in recs],
+            [r.event_id for r in recs],
+            array("q", [r.count for r in recs]).tobytes(),
+            [r.first_seen for r in recs],
+            [r.last_seen for r in recs],
+            array("d", [r.first_seen_epoch for r in recs]).tobytes(),
+            array("d", [r.last_seen_epoch for r in recs]).tobytes(),
+            array("q", [r.seq for r in recs]).tobytes(),
+            [r.base for r in recs],
+            [None if r.hist is None else r.hist.to_bytes() for r in recs],
+        )
+        with self._ix_lock:
+            agg_ix = [(t, list(fps)) for t, fps in self._agg_ix.items()]
+        with self._ev_lock:
+            evidence = [it for _, _, it in self._evidence]
+        # 读路径也会过期分片（_expire_locked），所以分片要在 _raw_lock 里拷
+        with self._raw_lock:
+            parts = [(b, p.events.state()) for b, p in self._partitions.items()]
+            nofp = list(self._nofp_by_ts)
+            nofp_terms = list(self._nofp_terms.items())
+            expired = (self.expired_events, self.expired_partitions)
+            seq = self._next_seq
+        return {
+            "v": _SNAPSHOT_VERSION,
+            "partition_s": self.partition_s,
+            "codec": [t.strings() for t in self._codec.tables()],
+            "seq": seq,
+            "parts": parts,
+            "nofp": nofp,
+            "nofp_terms": nofp_terms,
+            "aggs": aggs,
+            "agg_ix": agg_ix,
+            "evidence": evidence,
+            "expired": expired,
+        }
+
+    def _restore(self, state: Dict[str, Any]) -> bool:
+        """返回 False = 版本不认识，什么都没恢复（调用方不能再重放 WAL 尾巴）。"""
+        version = state.get("v")
+        if version not in _SNAPSHOT_COMPAT:
+            print(f"[store] WARN snapshot version {version!r} not supported; starting empty, WAL tail discarded")
+            return False
+        for table, strings in zip(self._codec.tables(), state["codec"]):
+            table.restore(strings)
+        self._next_seq = state["seq"]
+        self.expired_events, self.expired_partitions = state["expired"]
+
+        # 原始事件：分片宽度改过就不恢复（分片号对不上），聚合照常恢复
+        if state["partition_s"] == self.partition_s:
+            for b, cols in state["parts"]:
+                part = self._partitions[b] = _Partition(b * self.partition_s, self._codec)
+                part.events = EventColumns.from_state(self._codec, cols)
+                for eid in part.events.ids_live():
+                    self._event_bucket[eid] = b
+            self._nofp_by_ts = SortedList(tuple(k) for k in state["nofp"])
+            self._nofp_key = {k[2]: k for k in self._nofp_by_ts}
+            for eid, terms in state.get("nofp_terms", ()):
+                self._nofp_terms[eid] = tuple(terms)
+                for t in terms:
+                    self._raw_ix.setdefault(t, set()).add(eid)
+        else:
+            print(f"[store] WARN snapshot partition_s={state['partition_s']} != {self.partition_s}; raw events not restored")
+
+        # 百万级聚合时这个循环就是恢复时间的大头：位置参数构造、局部变量、不做多余的拷贝
+        fps, event_ids, counts, first_seen, last_seen, fs_epoch, ls_epoch, seqs, bases, hists, *terms_col = state["aggs"]
+        n = len(self._stripes)
+        aggs = [st.agg for st in self._stripes]
+        keys: List[List[_IndexKey]] = [[] for _ in self._stripes]
+        by_event_id = self._agg_by_event_id
+        hist_of = OccurrenceHistogram.from_bytes
+        for fp, event_id, count, first, last, f_epoch, l_epoch, seq, base, hist in zip(
+            fps, event_ids, array("q", counts), first_seen, last_seen,
+            array("d", fs_epoch), array("d", ls_epoch), array("q", seqs), bases, hists,
+        ):
+            i = hash(fp) % n
+            aggs[i][fp] = _AggRecord(
+                event_id, fp, count, first, last, f_epoch, l_epoch, seq, base,
+                hist_of(hist) if hist is not None else None,
+            )
+            keys[i].append((l_epoch, -seq, fp))
+            by_event_id[event_id] = fp
+        # SortedList(iterable) 一次排好，比逐个 add 快得多
+        for st, k in zip(self._stripes, keys):
+            st.by_last_seen = SortedList(k)
+
+        # 聚合的二级索引：v3 直接是倒排集合；v2 是每个聚合一列词项；v1 没有，重新算
+        ix = self._agg_ix
+        if version == 3:
+            for t, group in state["agg_ix"]:
+                ix[t] = set(group)
+        elif version == 2:
+            for fp, terms in zip(fps, terms_col[0]):
+                for t in terms:
+                    ix.setdefault(t, set()).add(fp)
+
+        self._evidence.extend((_ts_epoch(it.get("ts") or ""), it.get("event_id"), it) for it in state["evidence"])
+        if version == 1:
+            self._reindex()
+        return True
+
+    def _reindex(self) -> None:
+        """
+        v1 snapshot 没存词项：从聚合的 base 和还在分片里的原始事件重新算二级索引。
+        原始事件已经过期的那部分事件带过的词项找不回来（聚合只按 base + 现存事件的词项并集匹配）。
+        """
+        unpack = self._codec.unpack
+        fp_str = self._codec.fingerprints.get
+        by_fp: Dict[str, Set[str]] = {}
+        for st in self._stripes:
+            for fp, rec in st.agg.items():
+                if rec.base is not None:
+                    by_fp[fp] = set(index_terms(unpack(rec.event_id, rec.first_seen, rec.base)))
+        for part in self._partitions.values():
+            cols = part.events
+            for row, _ in cols.iter_rows():
+                event_id, ts, packed = cols.snapshot(row)
+                terms = index_terms(unpack(event_id, ts, packed))
+                fp = fp_str(packed[3] - 1).strip() if packed[3] else ""
+                if fp:
+                    if fp in by_fp:
+                        by_fp[fp].update(terms)
+                elif event_id in self._nofp_key:
+                    self._nofp_terms[event_id] = terms
+                    for t in terms:
+                        self._raw_ix.setdefault(t, set()).add(event_id)
+        for fp, terms in by_fp.items():
+            self._index_agg(fp, terms)
 
     def list_events(self, limit: int = 20) -> List[Event]:
         # 返回“聚合视图事件”为主（你页面更像事件平台）
-        items = list(self._agg_event.values())
-
-        # 没 fingerprint 的原始事件，也要展示出来（避免丢数据）
-        for e in self._events.values():
-            if not (e.fingerprint or "").strip():
-                items.append(e)
-
-        items.sort(key=lambda x: _parse_ts((x.aggregate or {}).get("last_seen") or x.ts), reverse=True)
-        return items[:limit]
+        # 没 fingerprint 的原始事件，也要展示出来（避免丢数据）：两边各取前 limit 个再归并
+        if limit <= 0:
+            return []
+        agg = [(s[0], s) for s in self._newest_aggs(limit)]
+        with self._raw_lock:
+            self._expire_locked()
+            raw = [(k, self._raw_snapshot(k[2])) for k in _newest(self._nofp_by_ts, limit)]
+        merged = heapq.merge(agg, raw, key=lambda kv: kv[0][0], reverse=True)
+        return [
+            self._agg_unpack(v) if len(v) == 5 else self._codec.unpack(*v)
+            for _, v in itertools.islice(merged, limit)
+        ]
+
+    def query_events(self, limit: int = 20, **filters: Optional[Iterable[str]]) -> List[Event]:
+        """
+        /api/events 的过滤版：host / category / label / entity（每个可以给多个值，全部要命中），
+        返回和 list_events 一样的条目（聚合视图 + 无 fingerprint 的原始事件），最新在前。
+        聚合按它所有事件的词项并集匹配：entity=down 能命中出现过 down 的聚合，哪怕聚合视图的 base 是 up 那条。
+        从最小的倒排集合开始求交，再只对命中的条目取 top-limit：耗时和命中数成正比，和库大小无关。
+        """
+        terms = query_terms(filters)
+        if not terms:
+            return self.list_events(limit)
+        if limit <= 0:
+            return []
+
+        with self._ix_lock:
+            fps = _intersect(self._agg_ix, terms)
+        by_stripe: Dict[int, List[str]] = {}
+        for fp in fps:
+            by_stripe.setdefault(hash(fp) % len(self._stripes), []).append(fp)
+        agg_keys: List[_IndexKey] = []
+        for i, group in by_stripe.items():
+            st = self._stripes[i]
+            with st.lock:
+                for fp in group:
+                    rec = st.agg.get(fp)
+                    if rec is not None:
+                        agg_keys.append((rec.last_seen_epoch, -rec.seq, fp))
+
+        with self._raw_lock:
+            self._expire_locked()
+            raw_keys = [self._nofp_key[eid] for eid in _intersect(self._raw_ix, terms) if eid in self._nofp_key]
+            raw_keys = heapq.nlargest(limit, raw_keys)
+            raw = [(k, self._raw_snapshot(k[2])) for k in raw_keys]
+
+        now = self._clock()
+        agg = []
+        for k in heapq.nlargest(limit, agg_keys):
+            st = self._stripe(k[2])
+            with st.lock:
+                rec = st.agg.get(k[2])
+                if rec is not None:
+                    agg.append((k, self._agg_snap(st, (rec.last_seen_epoch, -rec.seq, k[2]), now)))
+        merged = heapq.merge(agg, raw, key=lambda kv: kv[0][0], reverse=True)
+        return [
+            self._agg_unpack(v) if len(v) == 5 else self._codec.unpack(*v)
+            for _, v in itertools.islice(merged, limit)
+        ]
+
+    def index_stats(self) -> Dict[str, Any]:
+        with self._ix_lock:
+            agg_terms = len(self._agg_ix)
+            agg_postings = sum(len(v) for v in self._agg_ix.values())
+        with self._raw_lock:
+            raw_terms = len(self._raw_ix)
+            raw_postings = sum(len(v) for v in self._raw_ix.values())
+        return {"agg_terms": agg_terms, "agg_postings": agg_postings, "raw_terms": raw_terms, "raw_postings": raw_postings}
 
     def recent_events(self, limit: int = 50) -> List[Event]:
         # focus 评分最好用聚合事件（count 高的自然更“值得看”）
-        items = list(self._agg_event.values())
-        items.sort(key=lambda x: _parse_ts((x.aggregate or {}).get("last_seen") or x.ts), reverse=True)
-        return items[:limit]
+        if limit <= 0:
+            return []
+        return [self._agg_unpack(s) for s in self._newest_aggs(limit)]
 
     def get_event(self, event_id: str) -> Optional[Event]:
         # 先从原始事件里找
-        e = self._events.get(event_id)
+        e = self._raw_get(event_id)
         if e:
             return e
 
-        # 再从聚合视图里找（如果传进来的是聚合视图 event_id）
-        for agg_e in self._agg_event.values():
-            if agg_e.event_id == event_id:
-                return agg_e
-        return None
+        # 再从聚合视图里找（如果传进来的是聚合视图 event_id）：反向索引 O(1)
+        with self._id_lock:
+            fp = self._agg_by_event_id.get(event_id)
+        if fp is None:
+            return None
+        st = self._stripe(fp)
+        with st.lock:
+            rec = st.agg.get(fp)
+            if rec is None:
+                return None
+            snap = self._agg_snap(st, (rec.last_seen_epoch, -rec.seq, fp), self._clock())
+        return self._agg_unpack(snap)
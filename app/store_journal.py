@@ -0,0 +1,297 @@
+"""
+InMemoryStore 的持久化：snapshot + 预写日志（WAL）。重启时加载 snapshot、只重放 WAL 尾巴，聚合 / evidence 不丢。
+
+    <path>          snapshot：头 + marshal(整个 store 的紧凑状态)，tmp + fsync + rename 原子替换
+    <path>.wal      WAL：文件头带代号 gen；之后每帧 = kind(1B) + len(u32) + crc32(u32) + marshal(payload)
+                      E = 一批 upsert（每条：event_id, ts, ts_epoch, category, severity, source, fingerprint, blob）
+                      V = 一批 evidence（asdict(EvidenceItem)）
+    <path>.wal.old  checkpoint 时轮转出来、还没进 snapshot 的 WAL
+
+- 写：append() 只把编好的帧放进内存缓冲（O(1)），后台线程每 commit_interval 秒一次性写入 + fsync（group commit）
+  -> 崩溃最多丢最后一个 commit 间隔内的写入
+- checkpoint：WAL 超过 snapshot_every 条事件时（以及 close() 时），store 在写入全部暂停的一瞬间 rotate() 并拷出状态，
+  序列化 + 落盘在暂停之外做。upsert 不是幂等的（count += 1），所以靠代号精确切分：
+  snapshot 记录 covers = 它已经包含的最大 WAL 代号，加载时只重放代号 > covers 的 WAL 文件
+  （snapshot 已经落盘、.wal.old 还没删就崩溃，重启也不会重复计数）
+- 读：load() -> (snapshot 状态 or None, WAL 帧迭代器)；CRC 不对 / 写了一半的尾帧丢弃，并从那里截断
+- marshal：只有 tuple / list / dict / str / bytes / int / float / None，C 实现，比 JSON 快一个量级，也不会执行代码
+- 单进程：对 <path>.lock 加 flock，拿不到（另一个进程在写同一份）就只读加载、不写盘（同 tools/token_journal.py）
+"""
+from __future__ import annotations
+
+import atexit
+import marshal
+import os
+import struct
+import threading
+import zlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有 flock，不做多进程保护
+    fcntl = None  # type: ignore
+
+WAL_EVENTS = b"E"
+WAL_EVIDENCE = b"V"
+
+_SNAP_MAGIC = b"OPSSNAP1"
+_WAL_MAGIC = b"OPSWAL01"
+_GEN = struct.Struct("<Q")        # 文件头里的代号 / snapshot 的 covers
+_FRAME = struct.Struct("<cII")    # kind, payload 长度, crc32
+
+Frame = Tuple[bytes, Any]
+
+
+class StoreJournal:
+    def __init__(
+        self,
+        path: str,
+        *,
+        commit_interval: float = 1.0,
+        snapshot_every: int = 500_000,
+    ):
+        self.path = path
+        self.wal_path = path + ".wal"
+        self.old_wal_path = path + ".wal.old"
+        self.commit_interval = max(0.01, commit_interval)
+        self.snapshot_every = max(1, snapshot_every)
+
+        self._buf: List[bytes] = []
+        self._buf_events = 0
+        self._lock = threading.Lock()          # 保护 _buf
+        self._io_lock = threading.Lock()       # 串行化 commit / rotate 的文件操作
+        self._gen = 1                          # 当前 .wal 的代号
+        self._covers = 0                       # 磁盘上 snapshot 已包含的最大代号
+        self._wal_events = 0                   # 当前 .wal 里的事件数（触发 checkpoint 用）
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._checkpoint: Optional[Callable[[], None]] = None
+        self._lock_file = None
+        self.read_only = False
+
+        self.stats: Dict[str, int] = {
+            "appended_events": 0, "commits": 0, "checkpoints": 0,
+            "replayed_frames": 0, "replayed_events": 0, "torn_frames": 0, "snapshot_bytes": 0,
+        }
+
+    # ---------- load ----------
+    def load(self) -> Tuple[Optional[Any], Iterator[Frame]]:
+        """帧迭代器要整个消费完再 start()（尾帧截断在迭代到最后时才做）。"""
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        # 先拿 owner 锁：拿不到就只读，不去截断别的进程正在写的 WAL
+        if not self._acquire_owner_lock():
+            self.read_only = True
+            print(f"[store_journal] WARN {self.path} is owned by another process; loaded read-only, writes are not persisted")
+        state = None
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                data = f.read()
+            if data[:8] == _SNAP_MAGIC and len(data) >= 8 + _GEN.size + 4:
+                (covers,) = _GEN.unpack_from(data, 8)
+                body = memoryview(data)[8 + _GEN.size + 4:]
+                (crc,) = struct.unpack_from("<I", data, 8 + _GEN.size)
+                if zlib.crc32(body) == crc:
+                    state = marshal.loads(body)
+                    self._covers = covers
+                    self.stats["snapshot_bytes"] = len(data)
+                else:
+                    print(f"[store_journal] WARN {self.path} failed CRC check; ignoring snapshot")
+        return state, self._frames()
+
+    def _frames(self) -> Iterator[Frame]:
+        # .wal.old 在 .wal 之前；代号 <= covers 的已经在 snapshot 里了
+        for path in (self.old_wal_path, self.wal_path):
+            gen, frames = self._read_wal(path)
+            if gen is None or gen <= self._covers:
+                continue
+            for kind, payload in frames:
+                self.stats["replayed_frames"] += 1
+                if kind == WAL_EVENTS:
+                    self.stats["replayed_events"] += len(payload)
+                    self._wal_events += len(payload)
+                yield kind, payload
+
+    def _read_wal(self, path: str) -> Tuple[Optional[int], Iterator[Frame]]:
+        if not os.path.exists(path):
+            return None, iter(())
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:8] != _WAL_MAGIC or len(data) < 8 + _GEN.size:
+            print(f"[store_journal] WARN {path} has no WAL header; ignoring")
+            return None, iter(())
+        (gen,) = _GEN.unpack_from(data, 8)
+        return gen, self._iter_frames(path, data, 8 + _GEN.size)
+
+    def _wal_gen(self, path: str) -> int:
+        with open(path, "rb") as f:
+            head = f.read(8 + _GEN.size)
+        return _GEN.unpack_from(head, 8)[0] if head[:8] == _WAL_MAGIC and len(head) == 8 + _GEN.size else 0
+
+    def _iter_frames(self, path: str, data: bytes, pos: int) -> Iterator[Frame]:
+        view = memoryview(data)
+        end = len(data)
+        while pos < end:
+            if pos + _FRAME.size > end:
+                break
+            kind, size, crc = _FRAME.unpack_from(data, pos)
+            body = view[pos + _FRAME.size:pos + _FRAME.size + size]
+            if len(body) < size or zlib.crc32(body) != crc:
+                break
+            yield kind, marshal.loads(body)
+            pos += _FRAME.size + size
+        if pos < end:
+            # 崩溃时最后一帧可能只写了一半：截掉，否则之后追加的帧都读不到
+            self.stats["torn_frames"] += 1
+            if not self.read_only:
+                with open(path, "rb+") as f:
+                    f.truncate(pos)
+
+    # ---------- write ----------
+    def start(self, checkpoint: Optional[Callable[[], None]] = None) -> None:
+        """load() 之后调用：开后台 group commit 线程；checkpoint = store 的 checkpoint 方法。"""
+        if self.read_only:
+            return
+        self._checkpoint = checkpoint
+        # snapshot 已落盘、.wal.old 还没删就崩溃：它已经在 snapshot 里了，留着会被下次 rotate() 接上新帧
+        if os.path.exists(self.old_wal_path) and self._wal_gen(self.old_wal_path) <= self._covers:
+            os.unlink(self.old_wal_path)
+        # 现有 .wal 还没进 snapshot 就接着写；没有（或者已经被 snapshot 包含）就新开 covers + 1
+        gen = self._wal_gen(self.wal_path) if os.path.exists(self.wal_path) else 0
+        if gen > self._covers:
+            self._gen = gen
+        else:
+            self._gen = self._covers + 1
+            self._new_wal(self.wal_path, self._gen)
+        self._thread = threading.Thread(target=self._run, name="store-journal", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _acquire_owner_lock(self) -> bool:
+        if fcntl is None:
+            return True
+        f = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f  # 进程退出时随文件描述符一起释放
+        return True
+
+    def append(self, kind: bytes, payload: Any, events: int = 0) -> None:
+        if self.read_only:
+            return
+        body = marshal.dumps(payload)
+        frame = _FRAME.pack(kind, len(body), zlib.crc32(body)) + body
+        with self._lock:
+            self._buf.append(frame)
+            self._buf_events += events
+
+    def commit(self) -> None:
+        """把缓冲写进 WAL 并 fsync（后台线程周期调用；rotate() / close() 时也会调）。"""
+        if self.read_only:
+            return
+        with self._io_lock:
+            self._commit_locked()
+
+    def _commit_locked(self) -> None:
+        with self._lock:
+            buf, self._buf = self._buf, []
+            events, self._buf_events = self._buf_events, 0
+        if not buf:
+            return
+        try:
+            with open(self.wal_path, "ab") as f:
+                f.write(b"".join(buf))
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as ex:
+            # 写失败：放回缓冲，下个周期重试
+            print(f"[store_journal] commit failed: {ex}")
+            with self._lock:
+                self._buf[:0] = buf
+                self._buf_events += events
+            return
+        self._wal_events += events
+        self.stats["appended_events"] += events
+        self.stats["commits"] += 1
+
+    def rotate(self) -> int:
+        """
+        store 在写入全部暂停时调用：缓冲落盘，当前 .wal 轮转成 .wal.old，新开下一代 .wal。
+        返回此刻 store 状态所包含的最大代号（写 snapshot 时作为 covers）。
+        """
+        with self._io_lock:
+            self._commit_locked()
+            covers = self._gen
+            if os.path.exists(self.old_wal_path):
+                # 上次 checkpoint 中途崩溃留下的 .wal.old 还没进 snapshot：把当前 .wal 的帧接到它后面
+                with open(self.wal_path, "rb") as src, open(self.old_wal_path, "ab") as dst:
+                    src.seek(8 + _GEN.size)
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.unlink(self.wal_path)
+            else:
+                os.replace(self.wal_path, self.old_wal_path)
+            self._gen = covers + 1
+            self._new_wal(self.wal_path, self._gen)
+            self._wal_events = 0
+        return covers
+
+    def write_snapshot(self, state: Any, covers: int) -> int:
+        """state 落盘（tmp + fsync + rename），之后 .wal.old 才能删；返回 snapshot 字节数。"""
+        body = marshal.dumps(state)
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_SNAP_MAGIC + _GEN.pack(covers) + struct.pack("<I", zlib.crc32(body)))
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._covers = covers
+        if os.path.exists(self.old_wal_path):
+            os.unlink(self.old_wal_path)
+        size = 8 + _GEN.size + 4 + len(body)
+        self.stats["checkpoints"] += 1
+        self.stats["snapshot_bytes"] = size
+        return size
+
+    def _new_wal(self, path: str, gen: int) -> None:
+        with open(path, "wb") as f:
+            f.write(_WAL_MAGIC + _GEN.pack(gen))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def due(self) -> bool:
+        return self._wal_events >= self.snapshot_every
+
+    def snapshot(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = dict(self.stats)
+        out.update(
+            path=self.path,
+            read_only=self.read_only,
+            wal_gen=self._gen,
+            snapshot_covers=self._covers,
+            wal_events=self._wal_events,
+            snapshot_every=self.snapshot_every,
+        )
+        return out
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.commit_interval + 5)
+        self.commit()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.commit_interval):
+            self.commit()
+            if self._checkpoint is not None and self.due():
+                try:
+                    self._checkpoint()
+                except Exception as ex:
+                    print(f"[store_journal] checkpoint failed: {ex}")
@@ -0,0 +1,507 @@
+"""
+SqliteStore：和 InMemoryStore 同样的接口（upsert_events / list_events / recent_events / get_event / events_between），
+数据落在 sqlite 文件里，重启（包括 uvicorn --reload）不丢原始事件和聚合。
+
+- WAL + synchronous=NORMAL：读不阻塞写；一批 upsert_events 在一个 BEGIN IMMEDIATE 事务里写完（ingest 突发时一批只 fsync 一次）
+- events     : event_id 主键，fingerprint / ts_epoch 上有索引；没 fingerprint 的事件另有部分索引（list_events 用）
+- aggregates : fingerprint 主键，(last_seen_epoch DESC, seq) 和 event_id 上有索引；base = 第一条事件的 JSON，
+               hist = 分钟 / 小时出现次数环（app/histogram.py）
+- evidence   : 自增 id（= 写入顺序）+ ts_epoch / event_id，body = EvidenceItem JSON；只保留最近 evidence_max 条
+- meta       : 跨进程共享的计数器（next_seq / expired_events），只在写事务里读改
+- agg_terms / raw_terms : 二级索引（词项见 app.store.index_terms）-> fingerprint / 无 fingerprint 的 event_id；
+               query_events 用 INTERSECT 求交，只对命中的行排序
+- SQL 都是模块级常量、参数化：sqlite3 连接的语句缓存按 SQL 文本命中，热路径不重复 prepare
+
+多进程（uvicorn --workers N）：每个 worker 各开一个连接，写在 BEGIN IMMEDIATE 里排队，seq 从 meta 里按批预留，
+所有 worker 看到的是同一份聚合 / evidence（WAL 下读到的都是已提交的）。
+
+排序规则与 InMemoryStore 一致：last_seen（或 ts）新的在前，相同时先来的（seq 小）在前。
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.histogram import OccurrenceHistogram, recent_counts, seeded, series_payload
+from app.models import Event
+from app.store import _ts_epoch, index_terms, query_terms
+
+# 行里带整条事件 JSON（1-2KB），用普通 rowid 表：WITHOUT ROWID 表的大行会溢出到 overflow 页，又大又慢
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS events (
+        event_id TEXT PRIMARY KEY,
+        ts_epoch REAL NOT NULL,
+        fingerprint TEXT NOT NULL,   -- strip 过的，'' = 没有
+        seq INTEGER NOT NULL,
+        body TEXT NOT NULL            -- Event JSON
+    )""",
+    "CREATE INDEX IF NOT EXISTS events_ts ON events (ts_epoch)",
+    "CREATE INDEX IF NOT EXISTS events_fp ON events (fingerprint)",
+    "CREATE INDEX IF NOT EXISTS events_nofp ON events (ts_epoch DESC, seq) WHERE fingerprint = ''",
+    """CREATE TABLE IF NOT EXISTS aggregates (
+        fingerprint TEXT PRIMARY KEY,
+        event_id TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        first_seen TEXT NOT NULL,
+        first_seen_epoch REAL NOT NULL,
+        last_seen TEXT NOT NULL,
+        last_seen_epoch REAL NOT NULL,
+        seq INTEGER NOT NULL,
+        base TEXT NOT NULL,           -- 第一条事件的 JSON（聚合视图的 base）
+        hist BLOB                     -- OccurrenceHistogram.to_bytes()；NULL = 只出现过一次
+    )""",
+    "CREATE INDEX IF NOT EXISTS aggregates_last_seen ON aggregates (last_seen_epoch DESC, seq)",
+    "CREATE INDEX IF NOT EXISTS aggregates_event_id ON aggregates (event_id)",
+    """CREATE TABLE IF NOT EXISTS evidence (
+        id INTEGER PRIMARY KEY,       -- 写入顺序
+        ts_epoch REAL NOT NULL,
+        event_id TEXT,
+        body TEXT NOT NULL            -- EvidenceItem JSON
+    )""",
+    "CREATE INDEX IF NOT EXISTS evidence_event_id ON evidence (event_id, id)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    # 二级索引：行很小，用 WITHOUT ROWID（主键就是数据）
+    """CREATE TABLE IF NOT EXISTS agg_terms (
+        term TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        PRIMARY KEY (term, fingerprint)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS raw_terms (
+        event_id TEXT NOT NULL,       -- 只登记没 fingerprint 的原始事件；覆盖写 / 过期时按 event_id 删
+        term TEXT NOT NULL,
+        PRIMARY KEY (event_id, term)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS raw_terms_term ON raw_terms (term, event_id)",
+)
+
+_SQL_PUT_EVENT = "INSERT OR REPLACE INTO events (event_id, ts_epoch, fingerprint, seq, body) VALUES (?, ?, ?, ?, ?)"
+_SQL_GET_EVENT = "SELECT body FROM events WHERE event_id = ?"
+_SQL_NEWEST_NOFP = "SELECT ts_epoch, body FROM events WHERE fingerprint = '' ORDER BY ts_epoch DESC, seq LIMIT ?"
+_SQL_PUT_AGG = (
+    "INSERT OR REPLACE INTO aggregates "
+    "(fingerprint, event_id, count, first_seen, first_seen_epoch, last_seen, last_seen_epoch, seq, base, hist) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+_AGG_COLUMNS = "fingerprint, event_id, count, first_seen, first_seen_epoch, last_seen, last_seen_epoch, seq, base, hist"
+_SQL_NEWEST_AGG = f"SELECT {_AGG_COLUMNS} FROM aggregates ORDER BY last_seen_epoch DESC, seq LIMIT ?"
+_SQL_AGG_BY_EVENT_ID = f"SELECT {_AGG_COLUMNS} FROM aggregates WHERE event_id = ? LIMIT 1"
+_SQL_AGG_BY_FP = f"SELECT {_AGG_COLUMNS} FROM aggregates WHERE fingerprint = ?"
+_SQL_FP_OF_EVENT = "SELECT fingerprint FROM events WHERE event_id = ?"
+_SQL_DEL_EVENT = "DELETE FROM events WHERE event_id = ?"
+_SQL_EVENTS_BETWEEN = "SELECT body FROM events WHERE ts_epoch >= ? AND ts_epoch < ? ORDER BY ts_epoch DESC, seq LIMIT ?"
+_SQL_EXPIRE = "DELETE FROM events WHERE ts_epoch < ?"
+_SQL_EXPIRE_TERMS = "DELETE FROM raw_terms WHERE event_id IN (SELECT event_id FROM events WHERE ts_epoch < ? AND fingerprint = '')"
+_SQL_PUT_AGG_TERM = "INSERT OR IGNORE INTO agg_terms (term, fingerprint) VALUES (?, ?)"
+_SQL_PUT_RAW_TERM = "INSERT OR IGNORE INTO raw_terms (event_id, term) VALUES (?, ?)"
+_SQL_DEL_RAW_TERMS = "DELETE FROM raw_terms WHERE event_id = ?"
+_SQL_META_GET = "SELECT value FROM meta WHERE key = ?"
+_SQL_META_SET = "UPDATE meta SET value = ? WHERE key = ?"
+_SQL_META_ADD = "UPDATE meta SET value = value + ? WHERE key = ?"
+_SQL_PUT_EVIDENCE = "INSERT INTO evidence (ts_epoch, event_id, body) VALUES (?, ?, ?)"
+_SQL_TRIM_EVIDENCE = "DELETE FROM evidence WHERE id <= (SELECT MAX(id) FROM evidence) - ?"
+_SQL_EVIDENCE = "SELECT body FROM evidence WHERE ts_epoch >= ? ORDER BY id DESC LIMIT ?"
+_SQL_EVIDENCE_BY_EVENT = "SELECT body FROM evidence WHERE event_id = ? AND ts_epoch >= ? ORDER BY id DESC LIMIT ?"
+
+# 一次 IN (...) 查询最多带多少个参数（低于 SQLITE_MAX_VARIABLE_NUMBER 的旧默认 999）
+_IN_CHUNK = 500
+
+# aggregates 一行：(fingerprint, event_id, count, first_seen, first_seen_epoch, last_seen, last_seen_epoch, seq, base, hist)
+_AggRow = List[Any]
+
+
+class SqliteStore:
+    def __init__(
+        self,
+        path: str,
+        retention_s: float = 0.0,
+        partition_s: float = 60.0,
+        busy_timeout: float = 10.0,
+        clock: Callable[[], float] = time.time,
+        evidence_max: int = 5000,
+    ) -> None:
+        self.path = path
+        # retention_s > 0 时，早于保留窗口的原始事件在写入时按 ts_epoch 索引删掉；聚合不受影响。partition_s 只用于统计分组
+        self.retention_s = max(0.0, float(retention_s))
+        self.partition_s = max(1.0, float(partition_s))
+        self._clock = clock
+        self.evidence_max = max(1, int(evidence_max))
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(
+            path, timeout=busy_timeout, check_same_thread=False, isolation_level=None, cached_statements=64,
+        )
+        self._conn.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for ddl in _SCHEMA:
+            self._conn.execute(ddl)
+        # 旧库（还没有 hist 列）：补列，已有聚合的 hist 为 NULL，下次出现时按 first_seen 补建
+        if "hist" not in {r[1] for r in self._conn.execute("PRAGMA table_info(aggregates)")}:
+            self._conn.execute("ALTER TABLE aggregates ADD COLUMN hist BLOB")
+        self._lock = threading.Lock()
+        # seq 接着库里已有的最大值往下发（重启后顺序仍然稳定）；多个 worker 同时启动时只有第一个 INSERT 生效
+        if self._conn.execute(_SQL_META_GET, ("next_seq",)).fetchone() is None:
+            row = self._conn.execute(
+                "SELECT MAX(s) FROM (SELECT MAX(seq) AS s FROM events UNION ALL SELECT MAX(seq) FROM aggregates)"
+            ).fetchone()
+            self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('next_seq', ?)", ((row[0] or 0) + 1,))
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('expired_events', 0)")
+        if self._conn.execute(_SQL_META_GET, ("terms_indexed",)).fetchone() is None:
+            self._backfill_terms()
+
+    def _backfill_terms(self) -> None:
+        """二级索引之前建的库：按现有原始事件 + 聚合 base 补一遍词项（多个 worker 同时启动时只有一个真做）。"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self._conn.execute(_SQL_META_GET, ("terms_indexed",)).fetchone() is None:
+                agg_terms = set()
+                for fp, base in self._conn.execute("SELECT fingerprint, base FROM aggregates"):
+                    agg_terms.update((t, fp) for t in index_terms(Event.model_validate_json(base)))
+                raw_terms = []
+                for event_id, fp, body in self._conn.execute("SELECT event_id, fingerprint, body FROM events"):
+                    terms = index_terms(Event.model_validate_json(body))
+                    if fp:
+                        agg_terms.update((t, fp) for t in terms)
+                    else:
+                        raw_terms.extend((event_id, t) for t in terms)
+                self._conn.executemany(_SQL_PUT_AGG_TERM, agg_terms)
+                self._conn.executemany(_SQL_PUT_RAW_TERM, raw_terms)
+                self._conn.execute("INSERT INTO meta (key, value) VALUES ('terms_indexed', 1)")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ---------- write ----------
+    def upsert_events(self, events: List[Event]) -> List[str]:
+        if not events:
+            return []
+        with self._lock:
+            # BEGIN IMMEDIATE：一开始就拿写锁（多进程时在这里排队），聚合的读-改-写在同一个事务里
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._expire()
+                ids = self._upsert(events)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return ids
+
+    def _reserve_seq(self, n: int) -> Iterator[int]:
+        """在写事务里从 meta 预留 n 个 seq（别的进程的连接拿到的是后面一段，不会重号）。"""
+        start = self._conn.execute(_SQL_META_GET, ("next_seq",)).fetchone()[0]
+        self._conn.execute(_SQL_META_SET, (start + n, "next_seq"))
+        return iter(range(start, start + n))
+
+    def _upsert(self, events: List[Event]) -> List[str]:
+        cutoff = self._cutoff()
+        # 每条事件最多用两个 seq（原始事件一个、新聚合一个）
+        seq = self._reserve_seq(2 * len(events))
+        rows = []
+        drop = []
+        expired = 0
+        fps = {(e.fingerprint or "").strip() for e in events}
+        fps.discard("")
+        aggs = self._load_aggs(fps)
+        dirty: Dict[str, _AggRow] = {}
+        hists: Dict[str, OccurrenceHistogram] = {}  # 这一批里解码过的直方图，最后统一编码回 a[9]
+        agg_terms = set()
+        raw_terms: Dict[str, Tuple[str, ...]] = {}  # 批内同一 event_id 出现多次：以最后一次为准
+
+        for e in events:
+            ts_epoch = _ts_epoch(e.ts)
+            fp = (e.fingerprint or "").strip()
+            body = e.model_dump_json()
+            terms = index_terms(e)
+            # 早于保留窗口的不存原始事件，只计入聚合（同 InMemoryStore）
+            raw_terms.pop(e.event_id, None)
+            if cutoff is None or ts_epoch >= cutoff:
+                rows.append((e.event_id, ts_epoch, fp, next(seq), body))
+                if not fp:
+                    raw_terms[e.event_id] = terms
+            else:
+                drop.append((e.event_id,))  # 同 id 之前存过的旧版本也不留
+                expired += 1
+            if not fp:
+                continue
+            agg_terms.update((t, fp) for t in terms)
+
+            a = aggs.get(fp)
+            if a is None:
+                # 聚合视图事件：用第一条事件做 base
+                a = aggs[fp] = [fp, e.event_id, 1, e.ts, ts_epoch, e.ts, ts_epoch, next(seq), body, None]
+            else:
+                a[2] += 1
+                h = hists.get(fp)
+                if h is None:
+                    h = hists[fp] = OccurrenceHistogram.from_bytes(a[9]) if a[9] else seeded(a[4])
+                h.add(ts_epoch)
+                if ts_epoch < a[4]:
+                    a[3], a[4] = e.ts, ts_epoch
+                if ts_epoch > a[6]:
+                    # 展示 event_id / last_seen 指向最新一条
+                    a[1], a[5], a[6] = e.event_id, e.ts, ts_epoch
+            dirty[fp] = a
+
+        for fp, h in hists.items():
+            dirty[fp][9] = h.to_bytes()
+
+        # 同一个 event_id 覆盖写：INSERT OR REPLACE 整行替换（ts / fingerprint / seq 都换成新的）
+        self._conn.executemany(_SQL_DEL_EVENT, drop)
+        self._conn.executemany(_SQL_PUT_EVENT, rows)
+        self._conn.executemany(_SQL_PUT_AGG, dirty.values())
+        # 覆盖写的旧版本（不管之前有没有 fingerprint）的原始事件词项先撤掉；聚合词项只增不减（同 InMemoryStore）
+        self._conn.executemany(_SQL_DEL_RAW_TERMS, ((e.event_id,) for e in events))
+        self._conn.executemany(_SQL_PUT_RAW_TERM, ((eid, t) for eid, terms in raw_terms.items() for t in terms))
+        self._conn.executemany(_SQL_PUT_AGG_TERM, agg_terms)
+        if expired:
+            self._conn.execute(_SQL_META_ADD, (expired, "expired_events"))
+        return [e.event_id for e in events]
+
+    def _load_aggs(self, fps: set) -> Dict[str, _AggRow]:
+        out: Dict[str, _AggRow] = {}
+        fps = list(fps)
+        for i in range(0, len(fps), _IN_CHUNK):
+            chunk = fps[i:i + _IN_CHUNK]
+            q = f"SELECT {_AGG_COLUMNS} FROM aggregates WHERE fingerprint IN ({','.join('?' * len(chunk))})"
+            for row in self._conn.execute(q, chunk):
+                out[row[0]] = list(row)
+        return out
+
+    # ---------- retention ----------
+    def _cutoff(self) -> Optional[float]:
+        return self._clock() - self.retention_s if self.retention_s else None
+
+    def _expire(self) -> int:
+        cutoff = self._cutoff()
+        if cutoff is None:
+            return 0
+        self._conn.execute(_SQL_EXPIRE_TERMS, (cutoff,))
+        before = self._conn.total_changes
+        self._conn.execute(_SQL_EXPIRE, (cutoff,))
+        dropped = self._conn.total_changes - before
+        if dropped:
+            self._conn.execute(_SQL_META_ADD, (dropped, "expired_events"))
+        return dropped
+
+    def expire(self) -> int:
+        """删掉早于保留窗口的原始事件；返回删掉的条数。聚合不受影响。"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                dropped = self._expire()
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return dropped
+
+    @property
+    def expired_events(self) -> int:
+        """所有进程累计的过期 / 超出保留窗口没存的原始事件数。"""
+        with self._lock:
+            return self._conn.execute(_SQL_META_GET, ("expired_events",)).fetchone()[0]
+
+    # ---------- evidence ----------
+    def append_evidence(self, items: List[Dict[str, Any]]) -> None:
+        """items = asdict(EvidenceItem)；多个 worker 写进同一张表，只保留最近 evidence_max 条。"""
+        if not items:
+            return
+        rows = [(_ts_epoch(it.get("ts") or ""), it.get("event_id"), json.dumps(it, ensure_ascii=False)) for it in items]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(_SQL_PUT_EVIDENCE, rows)
+                self._conn.execute(_SQL_TRIM_EVIDENCE, (self.evidence_max,))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def recent_evidence(self, since: float, limit: int = 50, event_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """ts >= since 的 evidence，最新写入的在前；event_id 给了就只要关联到它的。"""
+        if limit <= 0:
+            return []
+        with self._lock:
+            if event_id:
+                rows = self._conn.execute(_SQL_EVIDENCE_BY_EVENT, (event_id, since, limit)).fetchall()
+            else:
+                rows = self._conn.execute(_SQL_EVIDENCE, (since, limit)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    # ---------- read ----------
+    def list_events(self, limit: int = 20) -> List[Event]:
+        # 聚合视图事件 + 没 fingerprint 的原始事件：各取前 limit 个再归并（同 InMemoryStore）
+        if limit <= 0:
+            return []
+        with self._lock:
+            aggs = self._conn.execute(_SQL_NEWEST_AGG, (limit,)).fetchall()
+            raws = self._conn.execute(_SQL_NEWEST_NOFP, (limit,)).fetchall()
+        agg = ((a[6], a) for a in aggs)
+        raw = ((ts, body) for ts, body in raws)
+        merged = heapq.merge(agg, raw, key=lambda kv: kv[0], reverse=True)
+        now = self._clock()
+        return [
+            _agg_view(v, now) if isinstance(v, tuple) else Event.model_validate_json(v)
+            for _, v in itertools.islice(merged, limit)
+        ]
+
+    def query_events(self, limit: int = 20, **filters: Optional[Iterable[str]]) -> List[Event]:
+        """同 InMemoryStore.query_events：各词项的命中集合 INTERSECT，再按 list_events 的顺序取前 limit 个。"""
+        terms = query_terms(filters)
+        if not terms:
+            return self.list_events(limit)
+        if limit <= 0:
+            return []
+        agg_sub = " INTERSECT ".join(["SELECT fingerprint FROM agg_terms WHERE term = ?"] * len(terms))
+        raw_sub = " INTERSECT ".join(["SELECT event_id FROM raw_terms WHERE term = ?"] * len(terms))
+        with self._lock:
+            aggs = self._conn.execute(
+                f"SELECT {_AGG_COLUMNS} FROM aggregates WHERE fingerprint IN ({agg_sub}) "
+                "ORDER BY last_seen_epoch DESC, seq LIMIT ?",
+                (*terms, limit),
+            ).fetchall()
+            raws = self._conn.execute(
+                f"SELECT ts_epoch, body FROM events WHERE fingerprint = '' AND event_id IN ({raw_sub}) "
+                "ORDER BY ts_epoch DESC, seq LIMIT ?",
+                (*terms, limit),
+            ).fetchall()
+        agg = ((a[6], a) for a in aggs)
+        raw = ((ts, body) for ts, body in raws)
+        merged = heapq.merge(agg, raw, key=lambda kv: kv[0], reverse=True)
+        now = self._clock()
+        return [
+            _agg_view(v, now) if isinstance(v, tuple) else Event.model_validate_json(v)
+            for _, v in itertools.islice(merged, limit)
+        ]
+
+    def index_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            agg = self._conn.execute("SELECT COUNT(DISTINCT term), COUNT(*) FROM agg_terms").fetchone()
+            raw = self._conn.execute("SELECT COUNT(DISTINCT term), COUNT(*) FROM raw_terms").fetchone()
+        return {"agg_terms": agg[0], "agg_postings": agg[1], "raw_terms": raw[0], "raw_postings": raw[1]}
+
+    def recent_events(self, limit: int = 50) -> List[Event]:
+        if limit <= 0:
+            return []
+        with self._lock:
+            rows = self._conn.execute(_SQL_NEWEST_AGG, (limit,)).fetchall()
+        now = self._clock()
+        return [_agg_view(a, now) for a in rows]
+
+    def get_event(self, event_id: str) -> Optional[Event]:
+        # 先从原始事件里找，再找聚合视图 event_id
+        with self._lock:
+            row = self._conn.execute(_SQL_GET_EVENT, (event_id,)).fetchone()
+            if row is None:
+                agg = self._conn.execute(_SQL_AGG_BY_EVENT_ID, (event_id,)).fetchone()
+        if row is not None:
+            return Event.model_validate_json(row[0])
+        return _agg_view(agg, self._clock()) if agg is not None else None
+
+    def events_between(self, since: Optional[float] = None, until: Optional[float] = None, limit: int = 100) -> List[Event]:
+        """原始事件里 since <= ts < until 的，最新在前（走 ts_epoch 索引）。"""
+        if limit <= 0:
+            return []
+        cutoff = self._cutoff()
+        lo = max(x for x in (since, cutoff, float("-inf")) if x is not None)
+        hi = until if until is not None else float("inf")
+        with self._lock:
+            rows = self._conn.execute(_SQL_EVENTS_BETWEEN, (lo, hi, limit)).fetchall()
+        return [Event.model_validate_json(r[0]) for r in rows]
+
+    # ---------- occurrence histogram ----------
+    def _agg_row_for(self, key: str) -> Optional[Tuple[Any, ...]]:
+        """fingerprint / 聚合视图 event_id / 原始事件 event_id -> aggregates 行。"""
+        with self._lock:
+            row = self._conn.execute(_SQL_AGG_BY_FP, (key,)).fetchone()
+            if row is None:
+                row = self._conn.execute(_SQL_AGG_BY_EVENT_ID, (key,)).fetchone()
+            if row is None:
+                ev = self._conn.execute(_SQL_FP_OF_EVENT, (key,)).fetchone()
+                if ev and ev[0]:
+                    row = self._conn.execute(_SQL_AGG_BY_FP, (ev[0],)).fetchone()
+        return row
+
+    def count_since(self, key: str, seconds: float) -> int:
+        row = self._agg_row_for(key)
+        if row is None:
+            return 0
+        return _hist_of(row).count_since(seconds, self._clock())
+
+    def histogram(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._agg_row_for(key)
+        if row is None:
+            return None
+        now = self._clock()
+        return {
+            "fingerprint": row[0],
+            "count": row[2],
+            "first_seen": row[3],
+            "last_seen": row[5],
+            "now": datetime.fromtimestamp(now, tz=timezone.utc).isoformat(),
+            **series_payload(OccurrenceHistogram.from_bytes(row[9]) if row[9] else None, row[4], now),
+        }
+
+    def partition_stats(self) -> Dict[str, Any]:
+        """与 InMemoryStore.partition_stats 同样的结构；分片 = 按 partition_s 对 ts_epoch 分组。"""
+        with self._lock:
+            self._expire()
+            groups = self._conn.execute(
+                "SELECT CAST(ts_epoch / ? AS INTEGER) AS b, COUNT(*), SUM(LENGTH(body)) FROM events GROUP BY b ORDER BY b",
+                (self.partition_s,),
+            ).fetchall()
+            aggregates = self._conn.execute("SELECT COUNT(*) FROM aggregates").fetchone()[0]
+            expired_events = self._conn.execute(_SQL_META_GET, ("expired_events",)).fetchone()[0]
+        parts = [
+            {
+                "start": datetime.fromtimestamp(b * self.partition_s, tz=timezone.utc).isoformat(),
+                "events": n,
+                "approx_bytes": int(size or 0),
+            }
+            for b, n, size in groups
+        ]
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "partition_s": self.partition_s,
+            "retention_s": self.retention_s,
+            "raw_events": sum(p["events"] for p in parts),
+            "aggregates": aggregates,
+            "expired_events": expired_events,
+            "approx_bytes": sum(p["approx_bytes"] for p in parts),
+            "partitions": parts,
+        }
+
+
+def _hist_of(row: Tuple[Any, ...]) -> OccurrenceHistogram:
+    return OccurrenceHistogram.from_bytes(row[9]) if row[9] else seeded(row[4])
+
+
+def _agg_view(row: Tuple[Any, ...], now: float) -> Event:
+    """聚合视图事件：第一条事件做 base，event_id / ts 指向最新一条，带上 aggregate。"""
+    fp, event_id, count, first_seen, first_epoch, last_seen, _, _, base, hist = row
+    d = json.loads(base)
+    d["event_id"] = event_id
+    d["ts"] = last_seen
+    d["aggregate"] = {
+        "count": count,
+        "first_seen": first_seen,
+        "last_seen": last_seen,
+        **recent_counts(OccurrenceHistogram.from_bytes(hist) if hist else None, first_epoch, now),
+    }
+    d["fingerprint"] = fp
+    return Event.model_validate(d)
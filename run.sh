@@ -135,7 +135,14 @@ trap cleanup INT TERM EXIT
 # Start services
 # =========================
 echo "🚀 Starting API..."
-uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload &
+if [ "${WEB_CONCURRENCY:-1}" -gt 1 ]; then
+  # 多 worker：共享 sqlite store（--reload 不支持 --workers）
+  export OPS_STORE="${OPS_STORE:-sqlite}"
+  echo "   WEB_CONCURRENCY=$WEB_CONCURRENCY OPS_STORE=$OPS_STORE"
+  uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers "$WEB_CONCURRENCY" &
+else
+  uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload &
+fi
 API_PID=$!
 echo "✅ API PID: $API_PID"
 
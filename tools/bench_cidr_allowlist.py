@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark：Desensitizer 的 IP 保留名单（CidrTrie + DecisionMemo）。
+
+    python -m tools.bench_cidr_allowlist [--cidrs 10000] [--lines 20000] [--repeat 3]
+
+- lookup : 单次判定（地址字符串 -> 是否在名单里）
+           linear = 逐个 ipaddress 网段 `in`（旧写法的直接推广），trie = CidrTrie，memo = 再加 DecisionMemo
+- line   : FortiGate 流量日志（约一半源地址在名单里）整行 desensitize_line，有 / 无保留名单对比
+"""
+from __future__ import annotations
+
+import argparse
+import ipaddress
+import random
+import tempfile
+import time
+from typing import Callable, List
+
+from tools.bench_desensitizer import _kv_lines
+from tools.cidr_trie import CidrTrie, DecisionMemo
+from tools.desensitizer import DesensitizeConfig, Desensitizer
+
+
+def _random_cidrs(n: int, seed: int) -> List[str]:
+    """名单：10.x 下的 /16-/28 管理网段为主，混一些公网 /24 和 IPv6 /48-/64。"""
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n):
+        r = i % 10
+        if r < 7:
+            plen = rnd.randrange(16, 29)
+            out.append(f"10.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randrange(256)}/{plen}")
+        elif r < 9:
+            out.append(f"{rnd.randrange(1, 224)}.{rnd.randrange(256)}.{rnd.randrange(256)}.0/24")
+        else:
+            out.append(f"2001:db8:{rnd.randrange(65536):x}:{rnd.randrange(65536):x}::/{rnd.choice((48, 56, 64))}")
+    return out
+
+
+def _random_ips(n: int, seed: int) -> List[str]:
+    rnd = random.Random(seed)
+    return [
+        f"{rnd.choice((10, 10, 61, 172))}.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randrange(1, 255)}"
+        for _ in range(n)
+    ]
+
+
+def _best(fn: Callable[[], None], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.process_time()
+        fn()
+        best = min(best, time.process_time() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cidrs", type=int, default=10000)
+    ap.add_argument("--lines", type=int, default=20000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    cidrs = _random_cidrs(args.cidrs, seed=1)
+    t0 = time.perf_counter()
+    trie = CidrTrie(cidrs)
+    print(f"cidrs={len(cidrs)} build={(time.perf_counter() - t0) * 1000:.0f}ms")
+
+    # ---------- lookup ----------
+    ips = _random_ips(args.lines, seed=2)
+    nets = [ipaddress.ip_network(c, strict=False) for c in cidrs]
+    sample = ips[:200]  # linear 太慢，只跑一小段
+    t_lin = _best(lambda: [any(ipaddress.ip_address(ip) in n for n in nets) for ip in sample], 1) / len(sample)
+    t_trie = _best(lambda: [ip in trie for ip in ips], args.repeat) / len(ips)
+    memo = DecisionMemo()
+
+    def memo_lookup() -> None:
+        for ip in ips:
+            d = memo.get(ip)
+            if d is None:
+                memo.put(ip, ip in trie)
+
+    memo_lookup()
+    t_memo = _best(memo_lookup, args.repeat) / len(ips)
+    mismatches = sum(1 for ip in sample if (ip in trie) != any(ipaddress.ip_address(ip) in n for n in nets))
+    print(
+        f"lookup linear={t_lin * 1e6:9.2f}us  trie={t_trie * 1e6:6.2f}us  trie+memo(warm)={t_memo * 1e6:6.2f}us  "
+        f"kept={sum(1 for ip in ips if ip in trie)}/{len(ips)}  mismatches(vs linear, {len(sample)})={mismatches}"
+    )
+
+    # ---------- whole line ----------
+    lines = _kv_lines(args.lines, seed=3)
+    for name, allow in (("no allow-list", ()), (f"{len(cidrs)} cidrs", tuple(cidrs))):
+        des = Desensitizer(DesensitizeConfig(
+            secret_key="bench-secret-0123456789abcdef",
+            mapping_path=tempfile.mktemp(prefix="bench_cidr_", suffix=".json"),
+            map_cache_size=200_000,
+            allow_cidrs=allow,
+        ))
+        for line in lines:
+            des.desensitize_line(line)
+        t = _best(lambda: [des.desensitize_line(line) for line in lines], args.repeat) / len(lines)
+        kept = sum(des.desensitize_line(line)[1].get("IP_KEPT", 0) for line in lines)
+        print(f"line   {name:<14} {t * 1e6:7.2f}us/line  IP_KEPT={kept}")
+        des.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark：Desensitizer.desensitize_line（旧的 5 遍 re.sub vs 单次扫描）。
+
+    python -m tools.bench_desensitizer [--lines 50000] [--repeat 3]
+
+- legacy : 旧实现（IP / MAC / 3 个 secret 各一遍 re.sub，字符串 pattern，每个新 token 重新 hmac.new）
+- scanner: tools.desensitizer.Desensitizer（预编译合并 alternation + 预过滤 + 预 key 的 HMAC copy）
+分别测 warm（token 都已在 map 里，稳态）和 cold（全是新值，每行都要算 HMAC）两种情况。
+另外在 FortiGate kv 行上对比整行正则扫描和 field_aware（按字段名脱敏）。
+scanner 的新 token 只进 journal 缓冲（后台线程落盘），legacy 副本不落盘，基本只比 CPU；
+同时统计两边输出不一致的行数。
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import hmac
+import random
+import re
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+from tools.desensitizer import DesensitizeConfig, Desensitizer
+
+
+class LegacyDesensitizer:
+    """旧版 desensitize_line 的原样拷贝（只保留 CPU 相关部分）。"""
+
+    def __init__(self, cfg: DesensitizeConfig):
+        self.cfg = cfg
+        self._map: Dict[str, str] = {}
+
+    def desensitize_line(self, line: str) -> Tuple[str, Dict]:
+        s = line
+        s = self._mask_ip(s)
+        s = self._mask_mac(s)
+        s = self._mask_secret(s)
+        return s, {}
+
+    def _h(self, s: str) -> str:
+        return hmac.new(self.cfg.secret_key.encode(), s.encode(), hashlib.sha256).hexdigest()[:10]
+
+    def _map_value(self, raw: str, prefix: str) -> str:
+        if raw in self._map:
+            return self._map[raw]
+        token = f"<{prefix}:{self._h(raw)}>"
+        self._map[raw] = token
+        return token
+
+    def _mask_ip(self, s: str) -> str:
+        return re.sub(r"\b\d{1,3}(?:\.\d{1,3}){3}\b", lambda m: self._map_value(m.group(0), "IP"), s)
+
+    def _mask_mac(self, s: str) -> str:
+        pattern = (
+            r"\b(?:[0-9A-Fa-f]{2}[:-]){5}[0-9A-Fa-f]{2}\b"
+            r"|(?:[0-9A-Fa-f]{4}-){2}[0-9A-Fa-f]{4}\b"
+            r"|[0-9A-Fa-f]{12}\b"
+        )
+        return re.sub(pattern, lambda m: self._map_value(m.group(0), "MAC"), s)
+
+    def _mask_secret(self, s: str) -> str:
+        for p in (r"(password\s*=\s*)(\S+)", r"(token\s*=\s*)(\S+)", r"(secret\s*=\s*)(\S+)"):
+            s = re.sub(p, lambda m: m.group(1) + self._map_value(m.group(2), "SECRET"), s, flags=re.IGNORECASE)
+        return s
+
+
+def _sample_lines(n: int, seed: int) -> List[str]:
+    rnd = random.Random(seed)
+
+    def ip() -> str:
+        return f"{rnd.choice((10, 172, 192, 61))}.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randrange(1, 255)}"
+
+    def mac() -> str:
+        return "%04x-%04x-%04x" % (rnd.randrange(65536), rnd.randrange(65536), rnd.randrange(65536))
+
+    out = []
+    for i in range(n):
+        r = i % 5
+        if r == 0:
+            out.append(
+                f"date=2025-08-18 time=14:25:{i % 60:02d} devname=FG-01 type=traffic subtype=forward "
+                f"srcip={ip()} srcport={rnd.randrange(1024, 65535)} dstip={ip()} dstport=443 action=deny policyid=7\n"
+            )
+        elif r == 1:
+            out.append(
+                f"%Aug 18 14:25:29:336 2025 H3C L2MGNT/5/MAC_FLAPPING: MAC address {mac()} has been moving "
+                f"between port GigabitEthernet1/0/{rnd.randrange(48)} and port GigabitEthernet2/0/48.\n"
+            )
+        elif r == 2 and i % 10 == 2:
+            out.append(f"%%10SHELL/5/SHELL_LOGIN: user admin logged in from {ip()} password=hunter{i}\n")
+        elif r == 2:
+            # secret 的值本身是 IP / MAC：旧实现先换地址再算 SECRET（token 是 HMAC("<IP:...>")），要一致
+            out.append(f"%%10SHELL/5/SHELL_LOGIN: user admin password={ip()} token={mac()} secret=k-{ip()}\n")
+        elif r == 3:
+            out.append(f"%%10IFNET/5/LINK_UPDOWN: GigabitEthernet1/0/{rnd.randrange(48)} link down\n")
+        else:
+            out.append("syslog\n" if i % 2 else "core-sw-01\n")
+    return out
+
+
+def _kv_lines(n: int, seed: int) -> List[str]:
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n):
+        out.append(
+            f"date=2025-08-18 time=14:25:{i % 60:02d} devname=\"FG-01\" devid=\"FG100F0000000001\" logid=\"0000000013\" "
+            f"type=\"traffic\" subtype=\"forward\" level=\"notice\" vd=\"root\" eventtime={1755498329000000000 + i} "
+            f"srcip=10.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randrange(1, 255)} srcport={rnd.randrange(1024, 65535)} "
+            f"srcintf=\"port1\" dstip=61.170.{rnd.randrange(256)}.{rnd.randrange(1, 255)} dstport=443 dstintf=\"wan1\" "
+            f"sessionid={rnd.randrange(10 ** 9)} proto=6 action=\"deny\" policyid=7 "
+            f"poluuid=\"1b2c3d4e-aaaa-bbbb-cccc-00112233aabb\" service=\"HTTPS\" duration={rnd.randrange(600)} "
+            f"sentbyte={rnd.randrange(10 ** 6)} rcvdbyte={rnd.randrange(10 ** 6)} msg=\"blocked by policy\"\n"
+        )
+    return out
+
+
+def _time(fn: Callable[[str], Tuple[str, Dict]], lines: List[str]) -> float:
+    t0 = time.process_time()
+    for line in lines:
+        fn(line)
+    return time.process_time() - t0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lines", type=int, default=50000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    cfg = DesensitizeConfig(
+        secret_key="bench-secret-0123456789abcdef",
+        mapping_path=tempfile.mktemp(prefix="bench_des_", suffix=".json"),
+    )
+    legacy = LegacyDesensitizer(cfg)
+    scanner = Desensitizer(cfg)
+
+    n = args.lines
+    warm = _sample_lines(n, seed=0)
+    for line in warm:
+        legacy.desensitize_line(line)
+        scanner.desensitize_line(line)
+
+    # 取 repeat 次里最好的一次；cold 每次换一批新值，保证确实是冷的
+    print(f"lines={n} repeat={args.repeat}")
+    for name in ("cold", "warm"):
+        best = {"legacy": float("inf"), "scanner": float("inf")}
+        for r in range(args.repeat):
+            lines = _sample_lines(n, seed=100 + r) if name == "cold" else warm
+            best["legacy"] = min(best["legacy"], _time(legacy.desensitize_line, lines))
+            best["scanner"] = min(best["scanner"], _time(scanner.desensitize_line, lines))
+        print(
+            f"{name:<5} legacy={best['legacy'] / n * 1e6:7.2f}us/line  scanner={best['scanner'] / n * 1e6:7.2f}us/line  "
+            f"speedup={best['legacy'] / max(best['scanner'], 1e-9):5.2f}x"
+        )
+
+    diff = sum(1 for line in warm if legacy.desensitize_line(line)[0] != scanner.desensitize_line(line)[0])
+    counts: Dict[str, int] = {}
+    for line in warm:
+        for k, v in scanner.desensitize_line(line)[1].items():
+            counts[k] = counts.get(k, 0) + v
+    print(f"output mismatches={diff}  meta totals={counts}")
+
+    field = Desensitizer(DesensitizeConfig(
+        secret_key=cfg.secret_key,
+        mapping_path=tempfile.mktemp(prefix="bench_des_", suffix=".json"),
+        field_aware=True,
+    ))
+    kv = _kv_lines(n, seed=7)
+    for line in kv:
+        scanner.desensitize_line(line)
+        field.desensitize_line(line)
+    best = {"scanner": float("inf"), "field": float("inf")}
+    for _ in range(args.repeat):
+        best["scanner"] = min(best["scanner"], _time(scanner.desensitize_line, kv))
+        best["field"] = min(best["field"], _time(field.desensitize_line, kv))
+    print(
+        f"kv    scanner={best['scanner'] / n * 1e6:7.2f}us/line  field_aware={best['field'] / n * 1e6:7.2f}us/line  "
+        f"speedup={best['scanner'] / max(best['field'], 1e-9):5.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark：/api/ingest/syslog 单条记录的脱敏 CPU 开销（旧的多次 mask vs mask-once）。
+
+    python -m tools.bench_ingest_mask [--lines 20000]
+
+对同一批样例 payload 分别跑：
+  - legacy   : 旧实现（host/program/msg/title/fingerprint 各 mask 一次，payload_safe、parsed 再整体递归 mask）
+  - mask_once: app.main._syslog_event_from_payload（单条记录共享 memo）
+输出每行 CPU 微秒数、每行 desensitize_line 调用次数。
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+# 在 import app.main 之前设置：不落盘 map、不起异步队列
+_TMP = tempfile.mkdtemp(prefix="bench_mask_")
+os.environ.setdefault("DESENSITIZE_MAP_PATH", os.path.join(_TMP, "map.json"))
+os.environ.setdefault("OPS_DESENSE_SECRET", "bench-secret-0123456789abcdef")
+os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+os.environ["INGEST_ASYNC"] = "0"
+
+import app.main as m  # noqa: E402
+from app.models import Event  # noqa: E402
+
+
+def _sample_payloads(n: int) -> List[Dict[str, Any]]:
+    rnd = random.Random(42)
+    out = []
+    for i in range(n):
+        mac = "%04x-%04x-%04x" % (rnd.randrange(65536), rnd.randrange(65536), rnd.randrange(65536))
+        ip = "10.%d.%d.%d" % (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256))
+        if i % 2:
+            msg = (
+                f"%Aug 18 14:25:29:336 2025 H3C L2MGNT/5/MAC_FLAPPING: MAC address {mac} has been moving "
+                f"between port GigabitEthernet1/0/{rnd.randrange(48)} and port GigabitEthernet2/0/48."
+            )
+        else:
+            msg = f"%%10SHELL/5/SHELL_LOGIN: user admin logged in from {ip} password=hunter{i}"
+        out.append({
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "host": f"core-sw-{i % 8:02d}",
+            "program": "syslog",
+            "msg": msg,
+            "meta": {"ingest": "bench", "peer": ip},
+        })
+    return out
+
+
+def legacy_event(payload: Dict[str, Any]) -> Event:
+    """旧版 ingest_syslog 的脱敏流程（逐字段 mask + payload/parsed 整体再 mask）。"""
+    _mask_text, _mask_obj = m._mask_text, m._mask_obj
+    host = _mask_text(str(payload.get("host") or "unknown"))
+    program = _mask_text(str(payload.get("program") or "syslog"))
+    msg = _mask_text(str(payload.get("msg") or ""))
+    parsed = m.parse_syslog(msg) or {}
+    category = payload.get("category") or parsed.get("category") or "SYSLOG"
+    title = _mask_text(str(payload.get("title") or parsed.get("title") or f"{host} {program}: {msg[:80]}".strip()))
+    fp = _mask_text(str(
+        payload.get("fingerprint")
+        or parsed.get("fingerprint")
+        or f"syslog|{host}|{program}|{m._fingerprint_fallback(msg)[:140]}"
+    ))
+    payload_safe = dict(payload)
+    payload_safe.update({"host": host, "program": program, "msg": msg, "title": title, "fingerprint": fp})
+    payload_safe = _mask_obj(payload_safe)
+    parsed_safe = _mask_obj(parsed)
+    return Event(
+        event_id=f"evt_{uuid.uuid4().hex[:12]}",
+        ts=payload.get("timestamp"),
+        fingerprint=fp,
+        category=category,
+        title=title,
+        source={"name": host, "kind": "syslog", "host": host, "program": program},
+        raw={"message": msg, "payload": payload_safe, "parsed": parsed_safe},
+    )
+
+
+def _run(name: str, fn, payloads: List[Dict[str, Any]]) -> None:
+    calls = {"n": 0}
+    orig = m.DES.desensitize_line
+
+    def counted(line: str):
+        calls["n"] += 1
+        return orig(line)
+
+    m.DES.desensitize_line = counted  # type: ignore[method-assign]
+    try:
+        t0 = time.process_time()
+        for p in payloads:
+            fn(p)
+        cpu = time.process_time() - t0
+    finally:
+        m.DES.desensitize_line = orig  # type: ignore[method-assign]
+
+    n = len(payloads)
+    print(f"{name:<10} cpu/line={cpu / n * 1e6:8.1f}us  desensitize_line/line={calls['n'] / n:5.2f}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lines", type=int, default=20000)
+    args = ap.parse_args()
+
+    if m.DES is None:
+        raise SystemExit("desensitizer disabled (ENABLE_DESENSITIZE=0), nothing to benchmark")
+
+    payloads = _sample_payloads(args.lines)
+    # 预热：token map 先填满，避免把首次 HMAC/落盘算进任一方
+    for p in payloads:
+        legacy_event(p)
+
+    _run("legacy", legacy_event, payloads)
+    _run("mask_once", m._syslog_event_from_payload, payloads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark + 边界检查：NDJSON 流式导入的按行切分（app.main._iter_ndjson_chunks）。
+
+    python -m tools.bench_ingest_stream [--lines 200000] [--read 65536]
+
+- split  : 同一份 body 按 --read 字节一次地喂进去，切行吞吐（MB/s、行/s）
+- checks : 超长行（INGEST_STREAM_MAX_LINE）在一次读里到齐 / 跨两次读 / 跨多次读、结尾无换行、空行，
+           逐个比对 rejected 计数、错误行号和后面正常行的行号
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+# 在 import app.main 之前设置：不落盘 map、不起异步队列、store 不落盘
+_TMP = tempfile.mkdtemp(prefix="bench_stream_")
+os.environ.setdefault("DESENSITIZE_MAP_PATH", os.path.join(_TMP, "map.json"))
+os.environ.setdefault("OPS_DESENSE_SECRET", "bench-secret-0123456789abcdef")
+os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+os.environ["INGEST_ASYNC"] = "0"
+os.environ.setdefault("STORE_SNAPSHOT_PATH", "")  # 不给内存 store 挂 snapshot / WAL
+
+import app.main as m  # noqa: E402
+
+
+class _Body:
+    """只实现 _iter_ndjson_chunks 用到的 stream()：按给定的块依次吐出。"""
+
+    def __init__(self, parts: List[bytes]):
+        self._parts = parts
+
+    async def stream(self):
+        for p in self._parts:
+            yield p
+
+
+def _split(parts: List[bytes]) -> Tuple[List[Tuple[int, bytes]], Dict[str, Any]]:
+    stats: Dict[str, Any] = {"rejected": 0, "errors": []}
+
+    async def run():
+        out: List[Tuple[int, bytes]] = []
+        async for chunk in m._iter_ndjson_chunks(_Body(parts), stats):  # type: ignore[arg-type]
+            out.extend(chunk)
+        return out
+
+    return asyncio.run(run()), stats
+
+
+def _reads(body: bytes, size: int) -> List[bytes]:
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def _checks() -> bool:
+    saved = m.INGEST_STREAM_MAX_LINE
+    m.INGEST_STREAM_MAX_LINE = 10
+    long = b"x" * 33
+    cases = [
+        # (名字, 分块, 期望的 (行号, 内容), 期望的错误行号)
+        ("short lines", [b"a\nb\n", b"c\n"], [(1, b"a"), (2, b"b"), (3, b"c")], []),
+        ("no trailing newline", [b"a\n", b"bc"], [(1, b"a"), (2, b"bc")], []),
+        ("blank lines", [b"a\n\n  \nb\n"], [(1, b"a"), (4, b"b")], []),
+        ("long, one read", [b"a\n" + long + b"\nb\n"], [(1, b"a"), (3, b"b")], [2]),
+        ("long, two reads", [b"a\n" + long[:20], long[20:] + b"\nb\n"], [(1, b"a"), (3, b"b")], [2]),
+        ("long, three reads", [long[:11], long[11:22], long[22:] + b"\nok\n"], [(2, b"ok")], [1]),
+        ("long, many reads", _reads(long * 5 + b"\nok\n", 4), [(2, b"ok")], [1]),
+        ("long at EOF", [b"a\n", long[:15], long[15:]], [(1, b"a")], [2]),
+        ("two long lines", _reads(long + b"\n" + long + b"\nok\n", 7), [(3, b"ok")], [1, 2]),
+    ]
+    ok = True
+    try:
+        for name, parts, want_lines, want_errors in cases:
+            lines, stats = _split(parts)
+            got_errors = [e["line"] for e in stats["errors"]]
+            same = lines == want_lines and got_errors == want_errors and stats["rejected"] == len(want_errors)
+            ok &= same
+            print(f"check {name:<20} lines={[n for n, _ in lines]} errors={got_errors}  ok={same}")
+    finally:
+        m.INGEST_STREAM_MAX_LINE = saved
+    return ok
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lines", type=int, default=200000)
+    ap.add_argument("--read", type=int, default=65536, help="每次 body 读的字节数（Starlette 默认 64KB 左右）")
+    args = ap.parse_args()
+
+    ok = _checks()
+
+    line = b'{"event_id":"evt_%012d","ts":"2025-08-18T14:25:29+00:00","category":"SYSLOG","title":"link flap"}\n'
+    body = b"".join(line % i for i in range(args.lines))
+    parts = _reads(body, args.read)
+    t0 = time.perf_counter()
+    lines, stats = _split(parts)
+    dt = time.perf_counter() - t0
+    print(
+        f"split   lines={len(lines)} body={len(body) / 1e6:.1f}MB read={args.read}B  "
+        f"{len(body) / 1e6 / dt:7.1f} MB/s  {len(lines) / dt:10.0f} lines/s  rejected={stats['rejected']}"
+    )
+    print(f"checks  all ok={ok}")
+
+
+if __name__ == "__main__":
+    main()
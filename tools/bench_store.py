@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Benchmark：InMemoryStore 的写入和 Web UI 轮询读（list_events / recent_events）。
+
+    python -m tools.bench_store [--fingerprints 200000] [--events 400000] [--limit 50]
+    python -m tools.bench_store --lookup [--lookup-fingerprints 1000000]
+    python -m tools.bench_store --memory [--memory-events 100000]
+    python -m tools.bench_store --threads 8 [--thread-events 20000] [--thread-fingerprints 500]
+    python -m tools.bench_store --query [--query-events 200000] [--query-hosts 2000]
+
+- upsert : 逐批 upsert_events 的吞吐
+- poll   : list_events(limit) / recent_events(limit)，对比旧实现（每次全量 _parse_ts + sort）
+- lookup : get_event(聚合视图 event_id)，对比旧实现（线性扫聚合表）；
+           聚合视图 id 只在聚合表里（原始事件表里查不到），走的正是 /api/focus -> analyze 的路径
+- threads: N 个线程并发 upsert_events（同时有一个线程不停 list_events / recent_events / get_event），
+           对比单线程吞吐；结束后逐个 fingerprint 精确核对 count / first_seen / last_seen，不一致就非 0 退出
+- query  : query_events(host / category / label / entity) 走二级索引，对比全量扫 list_events 再按词项过滤；
+           逐条核对结果一致，另外核对 checkpoint + 恢复后索引查询结果不变
+- memory : tracemalloc 量每条事件常驻多少字节，对比旧布局（每条存 pydantic Event，每个 fingerprint 再 deep copy 一份）
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.compact import iso_from_micros
+from app.models import Event
+from app.store import InMemoryStore, _parse_ts, _ts_epoch, index_terms, query_terms
+from app.store_journal import StoreJournal
+
+
+def _events(n: int, fingerprints: int, seed: int) -> List[Event]:
+    rnd = random.Random(seed)
+    base = datetime(2025, 8, 18, tzinfo=timezone.utc)
+    out = []
+    for i in range(n):
+        fp = f"syslog|sw-{rnd.randrange(fingerprints)}|LINK_UPDOWN" if i % 50 else ""
+        out.append(Event(
+            event_id=f"evt_{i:012x}",
+            ts=(base + timedelta(seconds=i // 10)).isoformat(),
+            source={"name": "bench", "kind": "syslog"},
+            category="SYSLOG",
+            title=f"event {i}",
+            fingerprint=fp,
+        ))
+    return out
+
+
+# 旧实现的排序 / 扫描都在聚合记录和原始事件的 ts 串上做，Event 只在取出的前 limit 个上还原（和新实现一样）
+def _legacy_list(store: InMemoryStore, limit: int) -> List[Event]:
+    items: List[Tuple[str, Callable[[], Event]]] = [
+        (rec.last_seen, lambda fp=fp: store._agg_view(fp)) for fp, rec in store._agg.items()
+    ]
+    codec = store._codec
+    for part in store._partitions.values():
+        cols = part.events
+        for row, _ in cols.iter_rows():
+            fp = cols.fp[row]
+            if not fp or not codec.fingerprints.get(fp - 1).strip():
+                ts = cols.raw_ts.get(row) or iso_from_micros(cols.ts_us[row])
+                items.append((ts, lambda cols=cols, row=row: cols.materialize(row)))
+    items.sort(key=lambda x: _parse_ts(x[0]), reverse=True)
+    return [make() for _, make in items[:limit]]
+
+
+def _legacy_recent(store: InMemoryStore, limit: int) -> List[Event]:
+    items = sorted(store._agg.items(), key=lambda kv: _parse_ts(kv[1].last_seen), reverse=True)
+    return [store._agg_view(fp) for fp, _ in items[:limit]]
+
+
+def _legacy_get_agg(store: InMemoryStore, event_id: str) -> Optional[Event]:
+    for fp, rec in store._agg.items():
+        if rec.event_id == event_id:
+            return store._agg_view(fp)
+    return None
+
+
+class _LegacyLayout:
+    """旧的存储布局（只保留占内存的部分）：event_id -> (ts, Event)，fingerprint -> deep copy 的聚合视图 Event。"""
+
+    def __init__(self) -> None:
+        self.events: Dict[str, Tuple[float, Event]] = {}
+        self.agg_event: Dict[str, Event] = {}
+
+    def upsert_events(self, events: List[Event]) -> None:
+        for e in events:
+            self.events[e.event_id] = (_ts_epoch(e.ts), e)
+            fp = (e.fingerprint or "").strip()
+            if fp and fp not in self.agg_event:
+                agg_e = e.model_copy(deep=True)
+                agg_e.aggregate = {"count": 1, "first_seen": e.ts, "last_seen": e.ts}
+                self.agg_event[fp] = agg_e
+
+
+def _syslog_events(n: int, hosts: int, seed: int) -> Iterator[Event]:
+    """接近 syslog_tail_ingest 产出的事件：raw 里带 payload / parsed / message，evidence 带一条日志。"""
+    rnd = random.Random(seed)
+    base = datetime(2025, 8, 18, tzinfo=timezone.utc)
+    for i in range(n):
+        host = f"sw-{rnd.randrange(hosts):04d}"
+        port = f"GigabitEthernet1/0/{rnd.randrange(48)}"
+        state = rnd.choice(("up", "down"))
+        msg = f"%LINK-3-UPDOWN: Interface {port}, changed state to {state}"
+        ts = (base + timedelta(seconds=i // 10)).isoformat()
+        yield Event(
+            event_id=f"evt_{i:012x}",
+            ts=ts,
+            source={"name": host, "kind": "syslog", "type": "switch", "vendor": "cisco"},
+            category="SYSLOG",
+            title=f"{host} {msg}",
+            severity_hint="WARN" if state == "down" else "INFO",
+            entities=[{"type": "device", "name": host}, {"type": "interface", "name": port}],
+            labels=["syslog", "link"],
+            evidence={"logs": [{"log_id": f"log_{i:012x}", "ts": ts, "raw": msg, "fields": {"host": host, "program": "LINK"}}]},
+            raw={
+                "payload": {"host": host, "program": "LINK", "msg": msg, "timestamp": ts},
+                "parsed": {"host": host, "program": "LINK", "fields": {"interface": port, "state": state}},
+                "message": msg,
+                "ingest": "tail_ingest",
+            },
+            fingerprint=f"syslog|{host}|{port}|LINK_UPDOWN",
+        )
+
+
+def _traced_bytes(build: Callable[[], object]) -> Tuple[int, object]:
+    """build() 返回的对象常驻多少字节（构造过程中的临时对象已释放，不计）。"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, obj
+
+
+def _bench_memory(n: int, hosts: int) -> None:
+    def fill(store):
+        batch = []
+        for e in _syslog_events(n, hosts, seed=0):
+            batch.append(e)
+            if len(batch) == 500:
+                store.upsert_events(batch)
+                batch = []
+        store.upsert_events(batch)
+        return store
+
+    legacy_bytes, legacy = _traced_bytes(lambda: fill(_LegacyLayout()))
+    fps = len(legacy.agg_event)
+    del legacy
+    compact_bytes, store = _traced_bytes(lambda: fill(InMemoryStore()))
+    print(
+        f"memory events={n} fingerprints={fps}  legacy={legacy_bytes / n:7.0f}B/event  "
+        f"compact={compact_bytes / n:6.0f}B/event  ratio={legacy_bytes / compact_bytes:.1f}x  "
+        f"(strings: {len(store._codec.sources)} sources, {len(store._codec.fingerprints)} fingerprints)"
+    )
+
+
+def _bench_lookup(n: int, repeat: int) -> None:
+    store = InMemoryStore()
+    base = datetime(2025, 8, 18, tzinfo=timezone.utc).isoformat()
+    proto = Event(event_id="evt_proto", ts=base, source={"name": "bench", "kind": "syslog"}, category="SYSLOG", title="t")
+    t0 = time.perf_counter()
+    batch = []
+    for i in range(n):
+        # model_copy(update=...) 比逐个校验构造快很多，n=1M 时建表时间可接受
+        batch.append(proto.model_copy(update={"event_id": f"evt_{i:012x}", "fingerprint": f"fp{i}"}))
+        if len(batch) == 1000:
+            store.upsert_events(batch)
+            batch = []
+    store.upsert_events(batch)
+    # 原始事件表里删掉，只剩聚合视图：模拟聚合视图 id 不在 _events 里的情况
+    store._partitions.clear()
+    store._event_bucket.clear()
+    print(f"lookup fingerprints={len(store._agg)} build={time.perf_counter() - t0:.1f}s")
+
+    rnd = random.Random(1)
+    ids = [f"evt_{rnd.randrange(n):012x}" for _ in range(2000)]
+    legacy_ids = ids[:20]  # 线性扫太慢，只跑 20 次
+    t_old = _ms(lambda: [_legacy_get_agg(store, i) for i in legacy_ids], 1) / len(legacy_ids)
+    t_new = _ms(lambda: [store.get_event(i) for i in ids], repeat) / len(ids)
+    same = all(store.get_event(i) == _legacy_get_agg(store, i) for i in legacy_ids)
+    print(f"lookup get_event  legacy={t_old:9.3f}ms  indexed={t_new * 1000:7.3f}us  same={same}")
+
+
+def _stress_threads(threads: int, per_thread: int, fingerprints: int, batch: int) -> None:
+    base = datetime(2025, 8, 18, tzinfo=timezone.utc)
+    proto = Event(event_id="evt_proto", ts=base.isoformat(), source={"name": "bench", "kind": "syslog"}, category="SYSLOG", title="t")
+
+    # 线程 t 的第 i 条：fingerprint 轮流取，ts 各线程交错（同一 fingerprint 的 first/last 来自不同线程）
+    def work(t: int) -> List[List[Event]]:
+        evs = [
+            proto.model_copy(update={
+                "event_id": f"evt_{t:02d}_{i:08d}",
+                "ts": (base + timedelta(milliseconds=i * threads + t)).isoformat(),
+                "fingerprint": f"fp{(i * 7 + t) % fingerprints}",
+            })
+            for i in range(per_thread)
+        ]
+        return [evs[i:i + batch] for i in range(0, len(evs), batch)]
+
+    loads = [work(t) for t in range(threads)]
+    expect: Dict[str, List] = {}
+    for batches in loads:
+        for b in batches:
+            for e in b:
+                x = expect.setdefault(e.fingerprint, [0, e.ts, e.ts])
+                x[0] += 1
+                x[1] = min(x[1], e.ts, key=_ts_epoch)
+                x[2] = max(x[2], e.ts, key=_ts_epoch)
+
+    def run(n_threads: int) -> Tuple[InMemoryStore, float, int]:
+        store = InMemoryStore()
+        stop = threading.Event()
+        polls = [0]
+
+        def reader() -> None:
+            while not stop.is_set():
+                for e in store.recent_events(20):
+                    store.get_event(e.event_id)
+                store.list_events(20)
+                polls[0] += 1
+
+        def writer(ts: List[List[Event]]) -> None:
+            for b in ts:
+                store.upsert_events(b)
+
+        # n_threads 个写线程平分全部负载
+        parts = [[b for t in range(threads) if t % n_threads == w for b in loads[t]] for w in range(n_threads)]
+        ths = [threading.Thread(target=writer, args=(p,)) for p in parts]
+        rd = threading.Thread(target=reader)
+        rd.start()
+        t0 = time.perf_counter()
+        for th in ths:
+            th.start()
+        for th in ths:
+            th.join()
+        dt = time.perf_counter() - t0
+        stop.set()
+        rd.join()
+        return store, dt, polls[0]
+
+    total = threads * per_thread
+    for n in (1, threads):
+        store, dt, polls = run(n)
+        bad = []
+        aggs = store._agg
+        for fp, (cnt, first, last) in expect.items():
+            rec = aggs.get(fp)
+            if rec is None or (rec.count, rec.first_seen, rec.last_seen) != (cnt, first, last):
+                bad.append(fp)
+        raw = store.partition_stats()["raw_events"]
+        ok = not bad and len(aggs) == len(expect) and raw == total
+        print(
+            f"threads={n:<2} events={total} fingerprints={len(expect)}  {total / dt:9.0f} events/s  "
+            f"reader_polls={polls}  raw={raw}  exact={ok}"
+        )
+        if not ok:
+            print(f"  mismatched fingerprints: {bad[:10]}{' ...' if len(bad) > 10 else ''}")
+            sys.exit(1)
+
+
+def _legacy_query(store: InMemoryStore, limit: int, **filters: Optional[List[str]]) -> List[Event]:
+    """没有索引时的做法：所有聚合视图 + 无 fingerprint 事件按 list_events 顺序还原，逐条算词项过滤（聚合只看 base）。"""
+    want = set(query_terms(filters))
+    everything = store.list_events(len(store._agg) + len(store._nofp_key))
+    return [e for e in everything if want.issubset(index_terms(e))][:limit]
+
+
+def _bench_query(n: int, hosts: int, limit: int, repeat: int) -> None:
+    t0 = time.perf_counter()
+    store = InMemoryStore()
+    batch = []
+    for i, e in enumerate(_syslog_events(n, hosts, seed=0)):
+        batch.append(e if i % 50 else e.model_copy(update={"fingerprint": ""}))
+        if len(batch) == 500:
+            store.upsert_events(batch)
+            batch = []
+    store.upsert_events(batch)
+    print(f"query events={n} aggregates={len(store._agg)} build={time.perf_counter() - t0:.1f}s  {store.index_stats()}")
+
+    cases = (
+        {"host": ["sw-0007"]},
+        {"host": ["SW-0007"], "entity": ["GigabitEthernet1/0/3"]},
+        {"label": ["link"], "entity": ["gigabitethernet1/0/3"], "category": ["syslog"]},
+        {"entity": ["GigabitEthernet1/0/7"]},  # 聚合按词项并集匹配，所以只比每个 fingerprint 内不变的值（host / 端口）
+        {"host": ["no-such-host"]},
+    )
+    ok = True
+    for f in cases:
+        t_new = _ms(lambda: store.query_events(limit, **f), repeat)
+        t_old = _ms(lambda: _legacy_query(store, limit, **f), 1)
+        got = store.query_events(limit, **f)
+        same = got == _legacy_query(store, limit, **f)
+        ok &= same
+        print(f"query {str(f):<80} hits={len(got):<4} legacy={t_old:9.1f}ms  indexed={t_new:7.3f}ms  same={same}")
+
+    # snapshot + 恢复后索引照样可用
+    path = os.path.join(tempfile.mkdtemp(), "bench_query.snap")
+    journal = StoreJournal(path, snapshot_every=10 ** 12)
+    store.attach_journal(journal)
+    store.checkpoint()
+    ref = [store.query_events(limit, **f) for f in cases]
+    store.close()
+    journal._lock_file.close()  # 同一进程里模拟「进程退出释放 flock」
+    restored = InMemoryStore()
+    restored.attach_journal(StoreJournal(path, snapshot_every=10 ** 12))
+    same = [restored.query_events(limit, **f) for f in cases] == ref
+    ok &= same
+    print(f"query after snapshot restore same={same}  {restored.index_stats()}")
+    restored.close()
+    if not ok:
+        sys.exit(1)
+
+
+def _ms(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--fingerprints", type=int, default=200000)
+    ap.add_argument("--events", type=int, default=400000)
+    ap.add_argument("--limit", type=int, default=50)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--lookup", action="store_true", help="只跑 get_event 反向索引的对比")
+    ap.add_argument("--lookup-fingerprints", type=int, default=1000000)
+    ap.add_argument("--memory", action="store_true", help="只跑每条事件常驻字节数的对比（tracemalloc）")
+    ap.add_argument("--memory-events", type=int, default=100000)
+    ap.add_argument("--memory-hosts", type=int, default=500)
+    ap.add_argument("--query", action="store_true", help="只跑二级索引查询（query_events）和全量扫的对比")
+    ap.add_argument("--query-events", type=int, default=200000)
+    ap.add_argument("--query-hosts", type=int, default=2000)
+    ap.add_argument("--threads", type=int, default=0, help="只跑多线程并发写入 + 聚合计数精确核对")
+    ap.add_argument("--thread-events", type=int, default=20000, help="每个线程写多少条")
+    ap.add_argument("--thread-fingerprints", type=int, default=500)
+    ap.add_argument("--thread-batch", type=int, default=50)
+    args = ap.parse_args()
+
+    if args.threads:
+        _stress_threads(args.threads, args.thread_events, args.thread_fingerprints, args.thread_batch)
+        return
+    if args.lookup:
+        _bench_lookup(args.lookup_fingerprints, args.repeat)
+        return
+    if args.query:
+        _bench_query(args.query_events, args.query_hosts, args.limit, args.repeat)
+        return
+    if args.memory:
+        _bench_memory(args.memory_events, args.memory_hosts)
+        return
+
+    events = _events(args.events, args.fingerprints, seed=0)
+    store = InMemoryStore()
+    t0 = time.perf_counter()
+    for i in range(0, len(events), 200):
+        store.upsert_events(events[i:i + 200])
+    dt = time.perf_counter() - t0
+    print(f"upsert events={len(events)} fingerprints={len(store._agg)}  {len(events) / dt:9.0f} events/s")
+
+    k = args.limit
+    for name, new, old in (
+        ("list_events", lambda: store.list_events(k), lambda: _legacy_list(store, k)),
+        ("recent_events", lambda: store.recent_events(k), lambda: _legacy_recent(store, k)),
+    ):
+        t_new = _ms(new, args.repeat)
+        t_old = _ms(old, 1)
+        same = [e.ts for e in new()] == [e.ts for e in old()]
+        print(f"poll {name:<13} limit={k}  legacy={t_old:9.1f}ms  indexed={t_new:7.3f}ms  same_order={same}")
+
+
+if __name__ == "__main__":
+    main()
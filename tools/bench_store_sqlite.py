@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark：SqliteStore 对比 InMemoryStore（同一批 syslog 形状的事件）。
+
+    python -m tools.bench_store_sqlite [--events 100000] [--hosts 500] [--batch 200] [--path /tmp/bench_events.sqlite]
+
+- ingest : 按 --batch 条一批 upsert_events 的吞吐（sqlite 一批一个事务）
+- read   : list_events(50) / recent_events(50) / get_event(原始 id) / get_event(聚合视图 id) 的单次耗时
+- reopen : sqlite 关掉再打开后第一次 list_events（模拟重启后 Web UI 第一次轮询）
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import time
+from typing import Callable, List
+
+from app.models import Event
+from app.store import InMemoryStore
+from app.store_sqlite import SqliteStore
+from tools.bench_store import _syslog_events
+
+
+def _best_us(fn: Callable[[], object], repeat: int, n: int = 1) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best / n * 1e6
+
+
+def _ingest(store, events: List[Event], batch: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(0, len(events), batch):
+        store.upsert_events(events[i:i + batch])
+    return len(events) / (time.perf_counter() - t0)
+
+
+def _remove_db(path: str) -> None:
+    for p in (path, path + "-wal", path + "-shm"):
+        if os.path.exists(p):
+            os.remove(p)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=100000)
+    ap.add_argument("--hosts", type=int, default=500)
+    ap.add_argument("--batch", type=int, default=200)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--path", default="/tmp/bench_events.sqlite")
+    args = ap.parse_args()
+
+    events = list(_syslog_events(args.events, args.hosts, seed=0))
+    rnd = random.Random(1)
+    raw_ids = [events[rnd.randrange(len(events))].event_id for _ in range(1000)]
+
+    _remove_db(args.path)
+    stores = (("memory", InMemoryStore()), ("sqlite", SqliteStore(args.path)))
+    results = {}
+    for name, store in stores:
+        rate = _ingest(store, events, args.batch)
+        agg_ids = [e.event_id for e in store.recent_events(1000)]
+        results[name] = [e.model_dump() for e in store.list_events(50)]
+        print(
+            f"{name:<6} ingest={rate:8.0f} events/s  "
+            f"list_events={_best_us(lambda: store.list_events(50), args.repeat):8.0f}us  "
+            f"recent_events={_best_us(lambda: store.recent_events(50), args.repeat):8.0f}us  "
+            f"get_event(raw)={_best_us(lambda: [store.get_event(i) for i in raw_ids], args.repeat, len(raw_ids)):6.1f}us  "
+            f"get_event(agg)={_best_us(lambda: [store.get_event(i) for i in agg_ids], args.repeat, len(agg_ids)):6.1f}us"
+        )
+    print(f"same list_events output: {results['memory'] == results['sqlite']}")
+
+    stores[1][1].close()
+    t0 = time.perf_counter()
+    reopened = SqliteStore(args.path)
+    n = len(reopened.list_events(50))
+    print(
+        f"sqlite reopen + first list_events: {(time.perf_counter() - t0) * 1000:.1f}ms ({n} events)  "
+        f"db={os.path.getsize(args.path) / 1e6:.1f}MB"
+    )
+    reopened.close()
+    _remove_db(args.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Benchmark：InMemoryStore 的 snapshot + WAL（app/store_journal.py）。
+
+    python -m tools.bench_store_wal [--fingerprints 1000000] [--repeats 2] [--tail 50000] [--batch 500] [--writers 4] [--path /tmp/bench_store.snap]
+
+- ingest   : 同一批事件按 --batch 条一批 upsert_events，不记 WAL vs 记 WAL（group commit）的吞吐 -> WAL 开销
+- snapshot : checkpoint 里写入暂停的时间（轮转 WAL + 拷状态）、总时间、snapshot 大小
+- restore  : 新进程视角 attach_journal：只有 snapshot 的恢复时间；snapshot + --tail 条 WAL 尾巴的恢复时间；
+             --writers 个线程并发写同一批 fingerprint（小批次交错）之后的恢复 —— WAL 帧顺序要和应用顺序一致才 same
+- 恢复后 recent_events / list_events 与原 store 逐字段比对
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from app.models import Event
+from app.store import InMemoryStore
+from app.store_journal import StoreJournal
+
+
+def _events(fingerprints: int, repeats: int, start: int = 0) -> List[Event]:
+    """fingerprints 个聚合，每个出现 repeats 次；model_copy(update=...) 比逐个校验构造快很多。"""
+    base = datetime(2025, 8, 18, tzinfo=timezone.utc)
+    proto = Event(
+        event_id="evt_proto", ts=base.isoformat(), source={"name": "bench", "kind": "syslog"},
+        category="SYSLOG", title="link flap", labels=["syslog", "link"],
+    )
+    out = []
+    for i in range(start, start + fingerprints * repeats):
+        out.append(proto.model_copy(update={
+            "event_id": f"evt_{i:012x}",
+            "ts": (base + timedelta(milliseconds=i)).isoformat(),
+            "fingerprint": f"syslog|sw-{i % fingerprints}|LINK_UPDOWN",
+        }))
+    return out
+
+
+def _ingest(store: InMemoryStore, events: List[Event], batch: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(0, len(events), batch):
+        store.upsert_events(events[i:i + batch])
+    return len(events) / (time.perf_counter() - t0)
+
+
+def _remove(path: str) -> None:
+    for p in (path, path + ".wal", path + ".wal.old", path + ".tmp", path + ".lock"):
+        if os.path.exists(p):
+            os.remove(p)
+
+
+def _view(store: InMemoryStore) -> list:
+    return [e.model_dump() for e in store.recent_events(200)] + [e.model_dump() for e in store.list_events(50)]
+
+
+def _restore(path: str) -> tuple:
+    store = InMemoryStore()
+    journal = StoreJournal(path, snapshot_every=10 ** 12)
+    t0 = time.perf_counter()
+    stats = store.attach_journal(journal)
+    return store, journal, time.perf_counter() - t0, stats
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--fingerprints", type=int, default=1000000)
+    ap.add_argument("--repeats", type=int, default=2, help="每个 fingerprint 出现几次")
+    ap.add_argument("--tail", type=int, default=50000, help="snapshot 之后再写多少条（重启时要重放的 WAL 尾巴）")
+    ap.add_argument("--batch", type=int, default=500)
+    ap.add_argument("--writers", type=int, default=4, help="并发写 WAL 尾巴的线程数（第 5 步）")
+    ap.add_argument("--path", default="/tmp/bench_store.snap")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    events = _events(args.fingerprints, args.repeats)
+    tail = _events(args.fingerprints, 1, start=len(events))[:args.tail]
+    print(f"generated events={len(events)} tail={len(tail)} in {time.perf_counter() - t0:.1f}s")
+
+    # 1) WAL 开销：同一批事件，不记 WAL vs 记 WAL
+    plain = InMemoryStore()
+    rate_plain = _ingest(plain, events, args.batch)
+    del plain
+
+    _remove(args.path)
+    store = InMemoryStore()
+    journal = StoreJournal(args.path, snapshot_every=10 ** 12)  # 手动 checkpoint，不让后台线程插进来
+    store.attach_journal(journal)
+    rate_wal = _ingest(store, events, args.batch)
+    journal.commit()
+    print(
+        f"ingest  no-wal={rate_plain:9.0f} events/s  wal={rate_wal:9.0f} events/s  "
+        f"overhead={(1 - rate_wal / rate_plain) * 100:5.1f}%  wal={os.path.getsize(journal.wal_path) / 1e6:.1f}MB"
+    )
+
+    # 2) checkpoint：写入暂停的部分单独计时（与 InMemoryStore.checkpoint 同样的步骤）
+    t0 = time.perf_counter()
+    with store._gate.exclusive():
+        covers = journal.rotate()
+        state = store._capture()
+    t_pause = time.perf_counter() - t0
+    size = journal.write_snapshot(state, covers)
+    t_total = time.perf_counter() - t0
+    del state
+    print(
+        f"snapshot aggregates={sum(len(st.agg) for st in store._stripes)}  pause={t_pause * 1000:7.0f}ms  "
+        f"total={t_total * 1000:7.0f}ms  size={size / 1e6:.1f}MB"
+    )
+
+    # 3) 重启：只有 snapshot
+    ref = _view(store)
+    journal.close()
+    journal._lock_file.close()  # 同一进程里模拟「进程退出释放 flock」
+    restored, j2, dt, stats = _restore(args.path)
+    print(f"restore snapshot only   {dt * 1000:7.0f}ms  {stats}  same={_view(restored) == ref}")
+
+    # 4) 重启：snapshot + WAL 尾巴（崩溃前最后一次 checkpoint 之后又写了 --tail 条）
+    _ingest(restored, tail, args.batch)
+    ref = _view(restored)
+    j2.close()
+    j2._lock_file.close()
+    del restored
+    restored, j3, dt, stats = _restore(args.path)
+    print(f"restore snapshot + tail {dt * 1000:7.0f}ms  {stats}  same={_view(restored) == ref}")
+
+    # 5) 重启：多个线程并发写入后的 WAL 尾巴。各线程写同一组新 fingerprint（每批 10 条交错），
+    #    谁先应用谁成为聚合的 base / first_seen —— 重放必须按同样的顺序
+    n = max(1, args.writers)
+    fresh = _events(max(1, args.tail // n), 1, start=10 ** 9)
+    per_thread = [
+        [e.model_copy(update={"event_id": f"{e.event_id}_w{w}", "fingerprint": e.fingerprint + "|hot"}) for e in fresh]
+        for w in range(n)
+    ]
+    threads = [threading.Thread(target=_ingest, args=(restored, evs, 10)) for evs in per_thread]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # 让线程切换足够频繁，「应用」和「写 WAL」之间被插队的窗口才测得到
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    sys.setswitchinterval(interval)
+    ref = _view(restored)
+    j3.close()
+    j3._lock_file.close()
+    del restored
+    restored, j4, dt, stats = _restore(args.path)
+    print(f"restore concurrent x{n}  {dt * 1000:7.0f}ms  {stats}  same={_view(restored) == ref}")
+    j4.close()
+    j4._lock_file.close()
+    _remove(args.path)
+
+
+if __name__ == "__main__":
+    main()
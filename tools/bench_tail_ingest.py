@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Benchmark：tail_ingest 文本模式 vs bytes 模式（读文件 + 切行 + 脱敏 + 分类 + 组 payload，不发网络）。
+
+    python -m tools.bench_tail_ingest [--size-mb 1024] [--path /tmp/bench_rsyslog.log] [--keep]
+
+- text : TextLineReader（"r" 模式 readline，整行 decode）+ build_payload
+- bytes: BytesLineReader（大块二进制读 + memoryview 切行）+ build_payload_bytes（只 decode 出进程的字段）
+报告吞吐（lines/s、MB/s）、前 20000 行的 tracemalloc 峰值，以及两边 payload 不一致的条数（忽略 timestamp）。
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Tuple
+
+from tools.desensitizer import DesensitizeConfig, Desensitizer
+from tools.tail_ingest import BytesLineReader, TextLineReader, build_payload, build_payload_bytes
+
+SAMPLE_LINES = 20000
+
+
+def _gen_log(path: str, size_mb: int, seed: int = 0) -> None:
+    rnd = random.Random(seed)
+
+    def ip() -> str:
+        return f"{rnd.choice((10, 172, 192, 61))}.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randrange(1, 255)}"
+
+    def mac() -> str:
+        return "%04x-%04x-%04x" % (rnd.randrange(65536), rnd.randrange(65536), rnd.randrange(65536))
+
+    target = size_mb * 1024 * 1024
+    written = 0
+    i = 0
+    with open(path, "wb") as f:
+        while written < target:
+            chunk = []
+            for _ in range(5000):
+                r = i % 6
+                if r == 0:
+                    s = (
+                        f"Aug 18 14:25:{i % 60:02d} fg-01: date=2025-08-18 devname=FG-01 type=traffic subtype=forward "
+                        f"srcip={ip()} srcport={rnd.randrange(1024, 65535)} dstip={ip()} dstport=443 action=deny policyid=7\n"
+                    )
+                elif r == 1:
+                    s = (
+                        f"Aug 18 14:25:29 core-sw-01: %Aug 18 14:25:29:336 2025 H3C L2MGNT/5/MAC_FLAPPING: MAC address "
+                        f"{mac()} has been moving between port GigabitEthernet1/0/{rnd.randrange(48)} "
+                        f"and port GigabitEthernet2/0/48.\n"
+                    )
+                elif r == 2:
+                    s = f"Aug 18 14:25:30 core-sw-01: %%10SHELL/5/SHELL_LOGIN: user admin logged in from {ip()} password=hunter{i}\n"
+                elif r == 3:
+                    s = (
+                        f"Dec 26 19:30:12 2025 YYLLS-SW{rnd.randrange(4)}:  %%10IFNET/5/LINK_UPDOWN: "
+                        f"GigabitEthernet1/0/{rnd.randrange(48)} link down.\n"
+                    )
+                elif r == 4:
+                    s = f"Aug 18 14:25:31 dc-01: kerberos EventID=4771 pre-auth failed 用户 u{i % 97} 来自 {ip()}\n"
+                else:
+                    s = f"Aug 18 14:25:32 vpn-gw: ssl vpn tunnel up for user{i % 211}\n"
+                chunk.append(s)
+                i += 1
+            data = "".join(chunk).encode("utf-8")
+            f.write(data)
+            written += len(data)
+
+
+def _run(path: str, binary: bool, build: Callable[[Any, Any], Tuple[str, Dict[str, Any]]],
+         des: Desensitizer, limit: int = 0) -> Tuple[int, float]:
+    n = 0
+    t0 = time.perf_counter()
+    if binary:
+        f = open(path, "rb")
+        reader: Any = BytesLineReader(f, 0)
+    else:
+        f = open(path, "r", encoding="utf-8", errors="replace")
+        reader = TextLineReader(f)
+    with f:
+        while True:
+            item = reader.readline()
+            if item is None:
+                break
+            build(des, item[0])
+            n += 1
+            if limit and n >= limit:
+                break
+    return n, time.perf_counter() - t0
+
+
+def _peak(path: str, binary: bool, build: Callable[[Any, Any], Tuple[str, Dict[str, Any]]], des: Desensitizer) -> int:
+    tracemalloc.start()
+    try:
+        _run(path, binary, build, des, limit=SAMPLE_LINES)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _mismatches(path: str, des: Desensitizer) -> int:
+    diff = 0
+    with open(path, "rb") as fb, open(path, "r", encoding="utf-8", errors="replace") as ft:
+        rb, rt = BytesLineReader(fb, 0), TextLineReader(ft)
+        for _ in range(SAMPLE_LINES):
+            ib, it = rb.readline(), rt.readline()
+            if ib is None or it is None:
+                break
+            kb, pb = build_payload_bytes(des, ib[0])
+            kt, pt = build_payload(des, it[0])
+            pb.pop("timestamp", None)
+            pt.pop("timestamp", None)
+            if kb != kt or pb != pt:
+                diff += 1
+    return diff
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size-mb", type=int, default=1024)
+    ap.add_argument("--path", default="")
+    ap.add_argument("--keep", action="store_true", help="保留生成的日志文件")
+    args = ap.parse_args()
+
+    path = args.path or os.path.join(tempfile.gettempdir(), f"bench_rsyslog_{args.size_mb}mb.log")
+    if not os.path.exists(path) or os.path.getsize(path) < args.size_mb * 1024 * 1024:
+        print(f"generating {args.size_mb}MB -> {path}")
+        _gen_log(path, args.size_mb)
+    size = os.path.getsize(path)
+
+    des = Desensitizer(DesensitizeConfig(
+        secret_key="bench-secret-0123456789abcdef",
+        mapping_path=tempfile.mktemp(prefix="bench_tail_", suffix=".json"),
+        map_cache_size=200_000,
+    ))
+    try:
+        # 先跑一遍把 token 算进 LRU，两边在同样的缓存状态下比较
+        _run(path, True, build_payload_bytes, des, limit=SAMPLE_LINES)
+        print(f"file={size / 1048576:.0f}MB")
+        for name, binary, build in (("text", False, build_payload), ("bytes", True, build_payload_bytes)):
+            n, dt = _run(path, binary, build, des)
+            peak = _peak(path, binary, build, des)
+            print(
+                f"{name:<5} lines={n} time={dt:7.2f}s  {n / dt:10.0f} lines/s  {size / 1048576 / dt:7.1f} MB/s  "
+                f"peak({SAMPLE_LINES} lines)={peak / 1024:.0f}KiB"
+            )
+        print(f"payload mismatches (first {SAMPLE_LINES} lines)={_mismatches(path, des)}")
+    finally:
+        des.close()
+        if not args.keep and not args.path:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# tools/cidr_trie.py
+"""
+Desensitizer 的 IP 保留名单（allow-list）：哪些网段的地址不脱敏，原样保留。
+
+- CidrTrie     : IPv4 / IPv6 网段编进按字节分层的前缀树（stride = 8 bit）。
+                 非整字节的前缀在最后一层展开（/20 -> 16 个兄弟节点），查询最多 4 层（v4）/ 16 层（v6），
+                 每层一次 dict 查找，和名单里有多少网段无关
+- DecisionMemo : 最近的 "地址字符串 -> 判定结果" 缓存；两代 dict 轮换（满了旧代整体丢掉），不用逐条 LRU 记账
+"""
+from __future__ import annotations
+
+import ipaddress
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# keep_private_ranges=True 时加入的网段
+PRIVATE_CIDRS = (
+    "10.0.0.0/8",
+    "172.16.0.0/12",
+    "192.168.0.0/16",
+    "fc00::/7",
+    "fe80::/10",
+)
+
+# 节点：{字节值: [终止标记, 子节点]}；终止 = 这条路径上已经是某个网段的完整前缀
+_Node = Dict[int, List[Any]]
+
+
+class CidrTrie:
+    def __init__(self, cidrs: Iterable[str] = ()):
+        self._roots: Dict[int, _Node] = {4: {}, 6: {}}
+        self._match_all = {4: False, 6: False}
+        self.networks = 0
+        for c in cidrs:
+            self.add(c)
+
+    @classmethod
+    def from_file(cls, path: str) -> "CidrTrie":
+        """一行一个 CIDR（或单个地址），# 之后是注释。"""
+        trie = cls()
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                c = line.split("#", 1)[0].strip()
+                if c:
+                    trie.add(c)
+        return trie
+
+    def add(self, cidr: str) -> None:
+        net = ipaddress.ip_network(cidr.strip(), strict=False)
+        self.networks += 1
+        plen = net.prefixlen
+        if plen == 0:
+            self._match_all[net.version] = True
+            return
+        b = net.network_address.packed
+        full, rem = divmod(plen, 8)
+        if rem == 0:
+            full, rem = full - 1, 8
+        node = self._roots[net.version]
+        for i in range(full):
+            e = node.get(b[i])
+            if e is None:
+                e = node[b[i]] = [False, {}]
+            elif e[0]:
+                return  # 已被更短的前缀覆盖
+            node = e[1]
+        # 最后一层：前缀剩下 rem 位，展开成 2^(8-rem) 个字节值
+        base = b[full] & (0xFF << (8 - rem)) & 0xFF
+        for v in range(base, base + (1 << (8 - rem))):
+            e = node.get(v)
+            if e is None:
+                node[v] = [True, {}]
+            else:
+                e[0] = True
+                e[1] = {}  # 更长的前缀被覆盖，子树没用了
+
+    def __len__(self) -> int:
+        return self.networks
+
+    def contains_packed(self, packed: bytes) -> bool:
+        """packed：4 字节（v4）或 16 字节（v6）的网络序地址。"""
+        if self._match_all[4 if len(packed) == 4 else 6]:
+            return True
+        node = self._roots[4 if len(packed) == 4 else 6]
+        for byte in packed:
+            e = node.get(byte)
+            if e is None:
+                return False
+            if e[0]:
+                return True
+            node = e[1]
+        return False
+
+    def __contains__(self, ip: str) -> bool:
+        packed = pack_ip(ip)
+        return packed is not None and self.contains_packed(packed)
+
+
+def pack_ip(ip: str) -> Optional[bytes]:
+    """地址字符串 -> packed bytes；不是合法地址返回 None。IPv4 走手写快速路径（不经 ipaddress）。"""
+    if ":" not in ip:
+        parts = ip.split(".")
+        if len(parts) != 4:
+            return None
+        try:
+            return bytes([int(p) for p in parts])
+        except ValueError:  # 非数字或 > 255
+            return None
+    try:
+        return ipaddress.IPv6Address(ip).packed
+    except ValueError:
+        return None
+
+
+_MISS = object()
+
+
+class DecisionMemo:
+    """两代 dict 的有界缓存：当前代满了就变成旧代，旧代整体丢弃；旧代命中时提升回当前代。"""
+
+    def __init__(self, capacity: int = 65536):
+        self.capacity = max(1, int(capacity))
+        self._cur: Dict[str, Any] = {}
+        self._old: Dict[str, Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        v = self._cur.get(key, _MISS)
+        if v is _MISS:
+            v = self._old.get(key, _MISS)
+            if v is _MISS:
+                self.misses += 1
+                return default
+            self.put(key, v)
+        self.hits += 1
+        return v
+
+    def put(self, key: str, value: Any) -> None:
+        if len(self._cur) >= self.capacity:
+            self._old, self._cur = self._cur, {}
+        self._cur[key] = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._cur) + len(self._old),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+        }
+
+
+def parse_cidr_list(spec: str) -> Tuple[str, ...]:
+    """"10.0.0.0/8, 2001:db8::/32" -> ("10.0.0.0/8", "2001:db8::/32")"""
+    return tuple(c.strip() for c in spec.replace(";", ",").split(",") if c.strip())
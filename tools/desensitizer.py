@@ -3,11 +3,16 @@ from __future__ import annotations
 
 import os
 import re
-import json
 import hmac
 import hashlib
 from dataclasses import dataclass
-from typing import Tuple, Dict
+from typing import Any, Tuple, Dict, Optional, Union
+import ipaddress
+
+from tools.cidr_trie import PRIVATE_CIDRS, CidrTrie, DecisionMemo, pack_ip
+from tools.kv_fields import KEEP_VALUE, KV_MIN_PAIRS, KV_RE, FieldPolicy
+from tools.token_journal import TokenJournal
+from tools.token_store import LRUCache, SqliteRevStore
 
 
 @dataclass
@@ -16,114 +21,381 @@ class DesensitizeConfig:
     reversible: bool = False
     mapping_path: str = "data/desensitize_map.json"
     keep_private_ranges: bool = False
+    # 保留名单：这些网段（IPv4/IPv6 CIDR）里的地址原样保留；keep_private_ranges 等于再加上 RFC1918 + fc00::/7 + fe80::/10。
+    # allow_cidrs_path 是一行一个 CIDR 的文件；ip_memo_size 是「地址 -> 判定」缓存的大小
+    allow_cidrs: Tuple[str, ...] = ()
+    allow_cidrs_path: str = ""
+    ip_memo_size: int = 65536
+    # token map 持久化：journal group-commit 间隔（秒）、journal 多少行后压缩进 snapshot
+    commit_interval_s: float = 1.0
+    compact_every: int = 100_000
+    # 有界内存：map_cache_size>0 时正向 map 只留 LRU 热数据（未命中重新算 HMAC），
+    # reversible 的 token -> raw 落到 sqlite 冷存储（cold_store_path 默认与 mapping_path 同名 .sqlite），
+    # 不再整份加载/保存 JSON map；0 = 旧行为（全量常驻内存 + journal）
+    map_cache_size: int = 0
+    rev_cache_size: int = 50_000
+    cold_store_path: str = ""
+    # 按字段名脱敏：kv 行（>= KV_MIN_PAIRS 对 key=value）逐字段按策略处理，只有自由文本字段走正则；
+    # field_policy_path 是叠加在默认策略上的 JSON（见 tools/kv_fields.py）
+    field_aware: bool = False
+    field_policy_path: str = ""
+
+
+# 单次扫描：IP / MAC / IPv6 / secret 合成一个预编译的 alternation，按出现位置从左到右一遍替换。
+# 同一位置 IP 优先于 MAC（与旧的 IP -> MAC -> secret 多遍顺序一致），MAC 优先于 IPv6（xx:xx:xx:xx:xx:xx 按 MAC 算）。
+# IPv6 只认完整 8 段或带 "::" 的写法（不会误吃 14:25:29 这类时间），候选再经 ipaddress 校验；不支持内嵌 IPv4 的写法
+# （::ffff:1.2.3.4 里的 IPv4 部分照样按 IPv4 脱敏）。
+# 开头的 lookahead 只放行可能是候选首字符的位置（数字/hex/p/s/t/:），其余位置不用逐个分支去试。
+_SCANNER = re.compile(
+    r"(?=[0-9A-Fa-fPpSsTt:])"
+    r"(?:(?P<ip>\b\d{1,3}(?:\.\d{1,3}){3}\b)"
+    r"|(?P<mac>\b(?:[0-9A-Fa-f]{2}[:-]){5}[0-9A-Fa-f]{2}\b"  # xx:xx:xx:xx:xx:xx 或 xx-xx-xx-xx-xx-xx
+    r"|(?:[0-9A-Fa-f]{4}-){2}[0-9A-Fa-f]{4}\b"  # xxxx-xxxx-xxxx
+    r"|[0-9A-Fa-f]{12}\b)"  # xxxxxxxxxxxx
+    r"|(?P<ip6>(?<![\w:.])(?:(?:[0-9A-Fa-f]{1,4}:){7}[0-9A-Fa-f]{1,4}"  # 完整 8 段
+    r"|(?:[0-9A-Fa-f]{1,4}:){1,6}:(?:[0-9A-Fa-f]{1,4}(?::[0-9A-Fa-f]{1,4}){0,5})?"  # x::  x::y
+    r"|::[0-9A-Fa-f]{1,4}(?::[0-9A-Fa-f]{1,4}){0,6})(?![\w:.]))"  # ::y
+    r"|(?P<skey>(?i:password|token|secret)\s*=\s*)(?P<sval>\S+))"
+)
+# 已经是 token 的值（上游 ingester 脱敏过）不再套一层
+_TOKEN_RE = re.compile(r"<(?:IP|MAC|SECRET):[0-9a-f]{10}>")
+_HEX12 = re.compile(r"[0-9A-Fa-f]{12}")
+# 最短候选："1.2.3.4" / "token=x"（7 字符）；MAC 需要 : - 或 12 位连续 hex
+_MIN_CANDIDATE = 7
+
+# bytes 版（同一套 pattern）：tail_ingest 的 bytes 模式不解码整行，直接在原始字节上扫
+_SCANNER_B = re.compile(_SCANNER.pattern.encode())
+_TOKEN_RE_B = re.compile(_TOKEN_RE.pattern.encode())
+_HEX12_B = re.compile(_HEX12.pattern.encode())
+
+# field-aware 模式下判断字段值的形状：像才整体换 token，不像就退回正则扫描
+_IPV4_FULL = re.compile(r"\d{1,3}(?:\.\d{1,3}){3}")
+_MAC_FULL = re.compile(r"(?:[0-9A-Fa-f]{2}[:-]){5}[0-9A-Fa-f]{2}|(?:[0-9A-Fa-f]{4}[.-]){2}[0-9A-Fa-f]{4}|[0-9A-Fa-f]{12}")
 
 
 class Desensitizer:
     def __init__(self, cfg: DesensitizeConfig):
         self.cfg = cfg
-        self._map: Dict[str, str] = {}
-        self._rev: Dict[str, str] = {}
-        self._load_map()
+        self._map: Union[Dict[str, str], LRUCache] = {}
+        self._rev: Union[Dict[str, str], LRUCache] = {}
+        # HMAC 只 key 一次，每个新 token copy() 一份再 update
+        self._hmac = hmac.new(cfg.secret_key.encode(), digestmod=hashlib.sha256)
+        self._journal: Optional[TokenJournal] = None
+        self._cold: Optional[SqliteRevStore] = None
+        self._allow: Optional[CidrTrie] = self._build_allow_list()
+        self._ip_memo = DecisionMemo(cfg.ip_memo_size)
+        self._policy: Optional[FieldPolicy] = FieldPolicy.load(cfg.field_policy_path) if cfg.field_aware else None
+
+        if cfg.map_cache_size > 0:
+            self._map = LRUCache(cfg.map_cache_size)
+            self._rev = LRUCache(cfg.rev_cache_size)
+            if cfg.reversible:
+                # 多个进程（API / ingester）可以共享同一个库；key_id 保证大家用的是同一个 secret
+                self._cold = SqliteRevStore(
+                    self._cold_store_path(),
+                    commit_interval=cfg.commit_interval_s,
+                    key_id=hmac.new(cfg.secret_key.encode(), b"token-store-key-id", hashlib.sha256).hexdigest()[:16],
+                )
+                self._migrate_legacy_map()
+                self._cold.start()
+        else:
+            self._journal = TokenJournal(
+                cfg.mapping_path,
+                reversible=cfg.reversible,
+                commit_interval=cfg.commit_interval_s,
+                compact_every=cfg.compact_every,
+                snapshot_source=lambda: (dict(self._map), dict(self._rev)),
+            )
+            self._load_map()
+            self._journal.start()
 
     # -------------------------
     # public
     # -------------------------
     def desensitize_line(self, line: str) -> Tuple[str, Dict]:
-        meta = {}
+        """返回 (脱敏后的行, 各类别命中次数 {"IP": n, "MAC": n, "SECRET": n, "IP_KEPT": n})。"""
+        meta: Dict[str, int] = {}
+        if self._policy is not None and line.count("=") >= KV_MIN_PAIRS:
+            return self._desensitize_kv(line, meta), meta
+        return self._scan(line, meta), meta
+
+    def desensitize_bytes(self, line: bytes) -> Tuple[bytes, Dict]:
+        """
+        bytes 版 desensitize_line：整行不解码，只有命中的片段 decode 后去查/算 token。
+        与 str 版的差别只在非 ASCII 字符上：\\b / \\s 按 ASCII 判定（例如紧贴中文的 IP 也会被脱敏）。
+        """
+        meta: Dict[str, int] = {}
+        if self._policy is not None and line.count(b"=") >= KV_MIN_PAIRS:
+            # kv 行按字段处理：值要按字段名拆开，这里解码一次（仍只在 kv 行上）
+            text = bytes(line).decode("utf-8", errors="replace")
+            return self._desensitize_kv(text, meta).encode("utf-8"), meta
+        if len(line) < _MIN_CANDIDATE or not (
+            b"." in line or b"=" in line or b":" in line or b"-" in line
+            or (len(line) >= 12 and _HEX12_B.search(line) is not None)
+        ):
+            return bytes(line), meta
 
-        s = line
-        s = self._mask_ip(s)
-        s = self._mask_mac(s)
-        s = self._mask_secret(s)
+        def repl(m: "re.Match[bytes]") -> bytes:
+            kind = m.lastgroup
+            if kind == "ip" or kind == "ip6":
+                ip = m.group(0).decode("ascii")
+                out = self._mask_ip(ip, meta)
+                return m.group(0) if out is ip else out.encode("ascii")
+            if kind == "mac":
+                meta["MAC"] = meta.get("MAC", 0) + 1
+                return self._map_value(m.group(0).decode("ascii"), "MAC").encode("ascii")
+            val = m.group("sval")
+            if _TOKEN_RE_B.fullmatch(val):
+                return m.group(0)
+            meta["SECRET"] = meta.get("SECRET", 0) + 1
+            raw = val.decode("utf-8", errors="replace")
+            return m.group("skey") + self._secret_token(raw, meta).encode("ascii")
 
-        return s, meta
+        return _SCANNER_B.sub(repl, line), meta
+
+    def mask_field(self, key: str, value: str) -> Tuple[str, Dict]:
+        """按字段名脱敏单个值（结构化 payload 用）；没开 field_aware 时等同 desensitize_line。"""
+        meta: Dict[str, int] = {}
+        if self._policy is None:
+            return self._scan(value, meta), meta
+        return self._mask_value(self._policy.action(key), value, meta), meta
+
+    def field_action(self, key: str) -> str:
+        """字段名对应的动作（ip/mac/secret/keep/scan）；没开 field_aware 时一律 scan。"""
+        return self._policy.action(key) if self._policy is not None else "scan"
+
+    def reveal(self, token: str) -> Optional[str]:
+        """reversible 模式下 token -> 原值；查不到（或非 reversible）返回 None。"""
+        if not self.cfg.reversible:
+            return None
+        raw = self._rev.get(token)
+        if raw is None and self._cold is not None:
+            raw = self._cold.get(token)
+            if raw is not None:
+                self._rev[token] = raw
+        return raw
+
+    def stats(self) -> Dict[str, Any]:
+        if isinstance(self._map, LRUCache):
+            out: Dict[str, Any] = {"mode": "bounded", "map": self._map.snapshot()}
+            if self.cfg.reversible:
+                out["rev"] = self._rev.snapshot()
+            if self._cold is not None:
+                out["cold"] = self._cold.snapshot()
+        else:
+            out = {"mode": "full", "map": {"size": len(self._map)}, "rev": {"size": len(self._rev)}}
+            if self._journal is not None:
+                out["journal"] = dict(self._journal.stats, read_only=self._journal.read_only)
+        out["ip_allow"] = {"networks": len(self._allow) if self._allow is not None else 0, "memo": self._ip_memo.snapshot()}
+        return out
+
+    def flush(self) -> None:
+        """立刻把尚未 commit 的新 token 写盘（正常情况下后台线程每 commit_interval_s 秒做一次）。"""
+        if self._journal is not None:
+            self._journal.commit()
+        if self._cold is not None:
+            self._cold.commit()
+
+    def close(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+        if self._cold is not None:
+            self._cold.close()
 
     # -------------------------
     # internals
     # -------------------------
+    def _scan(self, s: str, meta: Dict[str, int]) -> str:
+        """正则扫描：IP / MAC / secret 一遍从左到右替换，命中计数累加到 meta。"""
+        if not self._may_contain_sensitive(s):
+            return s
+
+        def repl(m: "re.Match[str]") -> str:
+            kind = m.lastgroup
+            if kind == "ip" or kind == "ip6":
+                return self._mask_ip(m.group(0), meta)
+            if kind == "mac":
+                meta["MAC"] = meta.get("MAC", 0) + 1
+                return self._map_value(m.group(0), "MAC")
+            val = m.group("sval")
+            if _TOKEN_RE.fullmatch(val):
+                return m.group(0)
+            meta["SECRET"] = meta.get("SECRET", 0) + 1
+            return m.group("skey") + self._secret_token(val, meta)
+
+        return _SCANNER.sub(repl, s)
+
+    def _secret_token(self, val: str, meta: Dict[str, int]) -> str:
+        """
+        secret 值的 token：值里的 IP / MAC 先换成各自的 token，再对结果算 SECRET token。
+        旧的多遍 re.sub（IP -> MAC -> secret）就是这个顺序：password=10.0.0.1 的 token 是
+        HMAC("<IP:...>") 而不是 HMAC("10.0.0.1")；保持一致，已有的 token 和基于它的 fingerprint 不变。
+        """
+        if self._may_contain_sensitive(val):
+            val = self._secret_addrs(val, meta)
+        return self._map_value(val, "SECRET")
+
+    def _secret_addrs(self, val: str, meta: Dict[str, int]) -> str:
+        """只换 IP / MAC；值里又套了 key=（password=token=...）时旧实现也只在外层算一次 SECRET。"""
+        def repl(m: "re.Match[str]") -> str:
+            kind = m.lastgroup
+            if kind == "ip" or kind == "ip6":
+                return self._mask_ip(m.group(0), meta)
+            if kind == "mac":
+                meta["MAC"] = meta.get("MAC", 0) + 1
+                return self._map_value(m.group(0), "MAC")
+            return m.group("skey") + self._secret_addrs(m.group("sval"), meta)
+
+        return _SCANNER.sub(repl, val)
+
+    def _mask_ip(self, ip: str, meta: Dict[str, int]) -> str:
+        if self._allow is None and ":" not in ip:
+            # 没有保留名单的 IPv4：不用判定，直接 token
+            meta["IP"] = meta.get("IP", 0) + 1
+            return self._map_value(ip, "IP")
+        d = self._ip_memo.get(ip)
+        if d is None:
+            d = self._ip_decide(ip)
+            self._ip_memo.put(ip, d)
+        keep, norm = d
+        if norm is None:
+            return ip  # IPv6 候选其实不是合法地址
+        if keep:
+            meta["IP_KEPT"] = meta.get("IP_KEPT", 0) + 1
+            return ip
+        meta["IP"] = meta.get("IP", 0) + 1
+        return self._map_value(norm, "IP")
+
+    def _ip_decide(self, ip: str) -> Tuple[bool, Optional[str]]:
+        """-> (是否在保留名单里, 用来算 token 的规范写法)；IPv6 统一成压缩小写，同一地址不同写法同一个 token。"""
+        packed = pack_ip(ip)
+        if packed is None:
+            # 999.1.2.3 之类：不是合法地址，IPv4 照旧脱敏（宁可多脱），IPv6 候选放过
+            return False, (None if ":" in ip else ip)
+        norm = ip if len(packed) == 4 else str(ipaddress.IPv6Address(packed))
+        return (self._allow is not None and self._allow.contains_packed(packed)), norm
+
+    def _desensitize_kv(self, line: str, meta: Dict[str, int]) -> str:
+        """kv 行：逐个 key=value 按字段策略处理，pair 之间的文本（syslog 头等）仍走正则扫描。"""
+        actions = self._policy.actions
+        default = self._policy.default
+        out = []
+        pos = 0       # line[:pos] 已经进了 out
+        prev = 0      # 上一个 pair 的结尾
+        for m in KV_RE.finditer(line):
+            start = m.start()
+            # 比最短候选还短的间隔（通常就是一个空格）不可能命中，不扫
+            if start - prev >= _MIN_CANDIDATE:
+                gap = line[prev:start]
+                masked = self._scan(gap, meta)
+                if masked is not gap:
+                    out.append(line[pos:prev])
+                    out.append(masked)
+                    pos = start
+            prev = m.end()
+            key = m.group(1)
+            action = actions.get(key) or actions.get(key.lower(), default)
+            vs, ve = m.span(2)
+            if ve - vs >= 2 and line[vs] == '"' and line[ve - 1] == '"':
+                vs += 1
+                ve -= 1
+            val = line[vs:ve]
+            masked = self._mask_value(action, val, meta)
+            if masked is not val:
+                out.append(line[pos:vs])
+                out.append(masked)
+                pos = ve
+        if len(line) - prev >= _MIN_CANDIDATE:
+            tail = line[prev:]
+            masked = self._scan(tail, meta)
+            if masked is not tail:
+                out.append(line[pos:prev])
+                out.append(masked)
+                pos = len(line)
+        if not out:
+            return line
+        out.append(line[pos:])
+        return "".join(out)
+
+    def _mask_value(self, action: str, value: str, meta: Dict[str, int]) -> str:
+        if not value:
+            return value
+        if action == "keep":
+            # keep 字段也只保留数字 / 时间形状的值；别的（自由文本、被塞了 IP 的）照样扫
+            if KEEP_VALUE.fullmatch(value):
+                return value
+            action = "scan"
+        if action == "scan":
+            # 纯数字（端口、计数、时间戳）不可能命中任何 pattern：不扫
+            return value if value.isdigit() and len(value) < 12 else self._scan(value, meta)
+        if _TOKEN_RE.fullmatch(value):
+            return value
+        if action == "secret":
+            meta["SECRET"] = meta.get("SECRET", 0) + 1
+            return self._secret_token(value, meta)
+        if action == "ip" and _IPV4_FULL.fullmatch(value):
+            return self._mask_ip(value, meta)
+        if action == "mac" and _MAC_FULL.fullmatch(value):
+            meta["MAC"] = meta.get("MAC", 0) + 1
+            return self._map_value(value, "MAC")
+        # 字段名说是 IP / MAC，值却不像（"N/A"、带端口、多个地址……）：退回正则扫描
+        return self._scan(value, meta)
+
+    @staticmethod
+    def _may_contain_sensitive(s: str) -> bool:
+        """廉价预过滤：没有任何候选分隔符、也没有 12 位 hex 串的行直接跳过正则替换。"""
+        if len(s) < _MIN_CANDIDATE:
+            return False
+        if "." in s or "=" in s or ":" in s or "-" in s:
+            return True
+        return len(s) >= 12 and _HEX12.search(s) is not None
+
     def _h(self, s: str) -> str:
-        return hmac.new(
-            self.cfg.secret_key.encode(),
-            s.encode(),
-            hashlib.sha256
-        ).hexdigest()[:10]
+        h = self._hmac.copy()
+        h.update(s.encode())
+        return h.hexdigest()[:10]
 
     def _map_value(self, raw: str, prefix: str) -> str:
-        if raw in self._map:
-            return self._map[raw]
+        token = self._map.get(raw)
+        if token is not None:
+            return token
 
         token = f"<{prefix}:{self._h(raw)}>"
         self._map[raw] = token
         if self.cfg.reversible:
             self._rev[token] = raw
-        self._save_map()
+            if self._cold is not None:
+                self._cold.put(token, raw)
+        if self._journal is not None:
+            self._journal.append(raw, token)
         return token
 
-    def _mask_ip(self, s: str) -> str:
-        def repl(m):
-            ip = m.group(0)
-            if self.cfg.keep_private_ranges and self._is_private_ip(ip):
-                return ip
-            return self._map_value(ip, "IP")
-
-        return re.sub(r"\b\d{1,3}(?:\.\d{1,3}){3}\b", repl, s)
-
-    def _mask_mac(self, s: str) -> str:
-        pattern = (
-            r"\b(?:[0-9A-Fa-f]{2}[:-]){5}[0-9A-Fa-f]{2}\b"  # xx:xx:xx:xx:xx:xx 或 xx-xx-xx-xx-xx-xx
-            r"|(?:[0-9A-Fa-f]{4}-){2}[0-9A-Fa-f]{4}\b"  # xxxx-xxxx-xxxx
-            r"|[0-9A-Fa-f]{12}\b"  # xxxxxxxxxxxx
-        )
-        return re.sub(
-            pattern,
-            lambda m: self._map_value(m.group(0), "MAC"),
-            s,
-        )
-
-    def _mask_secret(self, s: str) -> str:
-        patterns = [
-            r"(password\s*=\s*)(\S+)",
-            r"(token\s*=\s*)(\S+)",
-            r"(secret\s*=\s*)(\S+)",
-        ]
-        for p in patterns:
-            s = re.sub(
-                p,
-                lambda m: m.group(1) + self._map_value(m.group(2), "SECRET"),
-                s,
-                flags=re.IGNORECASE,
-            )
-        return s
-
-    def _is_private_ip(self, ip: str) -> bool:
-        return (
-            ip.startswith("10.")
-            or ip.startswith("192.168.")
-            or ip.startswith("172.")
-        )
+    def _build_allow_list(self) -> Optional[CidrTrie]:
+        cidrs = list(self.cfg.allow_cidrs)
+        if self.cfg.keep_private_ranges:
+            cidrs.extend(PRIVATE_CIDRS)
+        if not cidrs and not self.cfg.allow_cidrs_path:
+            return None
+        trie = CidrTrie.from_file(self.cfg.allow_cidrs_path) if self.cfg.allow_cidrs_path else CidrTrie()
+        for c in cidrs:
+            trie.add(c)
+        return trie
 
     # -------------------------
     # mapping persistence
     # -------------------------
     def _load_map(self):
-        if os.path.exists(self.cfg.mapping_path):
-            try:
-                with open(self.cfg.mapping_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    self._map = data.get("map", {})
-                    self._rev = data.get("rev", {})
-            except Exception:
-                pass
-
-    def _save_map(self):
-        os.makedirs(os.path.dirname(self.cfg.mapping_path), exist_ok=True)
-        try:
-            with open(self.cfg.mapping_path, "w", encoding="utf-8") as f:
-                json.dump(
-                    {"map": self._map, "rev": self._rev},
-                    f,
-                    ensure_ascii=False,
-                    indent=2,
-                )
-        except Exception:
-            pass
\ No newline at end of file
+        self._map, self._rev = self._journal.load()
+
+    def _cold_store_path(self) -> str:
+        return self.cfg.cold_store_path or os.path.splitext(self.cfg.mapping_path)[0] + ".sqlite"
+
+    def _migrate_legacy_map(self):
+        """第一次切到有界模式：把旧的 JSON map（snapshot + journal）导进冷存储，之后不再读它。"""
+        if self._cold.count() or not (
+            os.path.exists(self.cfg.mapping_path) or os.path.exists(self.cfg.mapping_path + ".journal")
+        ):
+            return
+        mp, rev = TokenJournal(self.cfg.mapping_path, reversible=True).load()
+        self._cold.put_many(rev.items() if rev else ((t, r) for r, t in mp.items()))
+        print(f"[desensitizer] migrated {len(rev) or len(mp)} tokens into {self._cold.path}")
@@ -0,0 +1,108 @@
+# tools/kv_fields.py
+"""
+key=value 行解析 + 按字段名脱敏的策略（Desensitizer 的 field-aware 模式用）。
+
+FortiGate 之类的 kv 日志（srcip=… dstip=… srcport=…）和结构化 evidence payload 本身就说明了
+哪个字段是 IP / 密钥：按字段名决定动作，比对每个值跑整套正则便宜，也更准（带引号、带空格的值整体脱敏）。
+
+动作：
+- ip / mac / secret : 值整体换成对应 token（值长得不像 IP / MAC 时退回正则扫描）
+- keep              : 端口、时间、计数之类；值确实是数字 / 时间 / 日期（KEEP_VALUE）才原样保留，
+                      否则（category=10.0.0.5、action="login from 10.0.0.1"）照样走正则扫描
+- scan              : 其余字段（自由文本），走正则扫描
+"""
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Tuple
+
+# key 必须在行首或空白之后；值是双引号串（可含空格、\" 转义）或到下一个空白为止
+KV_RE = re.compile(r'(?<!\S)([A-Za-z_][\w.\-]*)=("(?:[^"\\]|\\.)*"|\S*)')
+# 少于这么多对 key=value 的行不当 kv 行处理（整行正则扫描）
+KV_MIN_PAIRS = 3
+
+# keep 字段的值只有长这样才不扫：整数 / 小数 / 0x 十六进制、日期、时间、ISO 时间戳、时区偏移。
+# 一个点以内的小数才算数字（IPv4 有三个点，落不进来）
+KEEP_VALUE = re.compile(
+    r"[+-]?\d+(?:\.\d+)?"
+    r"|0[xX][0-9A-Fa-f]+"
+    r"|\d{4}[-/]\d{2}[-/]\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:[Zz]|[+-]\d{2}:?\d{2})?)?"
+    r"|\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?"
+)
+
+ACTIONS = ("ip", "mac", "secret", "keep", "scan")
+
+_DEFAULT_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "ip": (
+        "srcip", "dstip", "ip", "src_ip", "dst_ip", "remip", "locip", "tranip", "transip", "nat_ip",
+        "assignip", "client_ip", "server_ip", "host_ip", "ipaddr", "saddr", "daddr",
+    ),
+    "mac": ("mac", "srcmac", "dstmac", "mastersrcmac", "masterdstmac", "src_mac", "dst_mac"),
+    "secret": (
+        "password", "passwd", "pwd", "token", "secret", "api_key", "apikey", "authorization",
+        "cookie", "psk", "private_key",
+    ),
+    # 只放数字 / 时间类字段；文本类（action / service / type / category ...）走默认的 scan
+    "keep": (
+        "srcport", "dstport", "sport", "dport", "port", "tranport", "transport", "proto", "policyid",
+        "sessionid", "duration", "sentbyte", "rcvdbyte", "sentpkt", "rcvdpkt",
+        "date", "time", "eventtime", "tz", "logid", "appid", "count", "pid", "timestamp", "ts",
+    ),
+}
+
+
+def parse_kv(line: str) -> Dict[str, str]:
+    """'a=1 b="x y" c=3' -> {"a": "1", "b": "x y", "c": "3"}（同名 key 后者覆盖前者）。"""
+    return {m.group(1): _unquote(m.group(2)) for m in KV_RE.finditer(line)}
+
+
+def _unquote(v: str) -> str:
+    if len(v) >= 2 and v[0] == '"' and v[-1] == '"':
+        return v[1:-1]
+    return v
+
+
+@dataclass
+class FieldPolicy:
+    """字段名（小写）-> 动作；不在表里的字段按 default 处理。"""
+
+    actions: Dict[str, str] = field(default_factory=dict)
+    default: str = "scan"
+
+    @classmethod
+    def defaults(cls) -> "FieldPolicy":
+        return cls({name: action for action, names in _DEFAULT_FIELDS.items() for name in names})
+
+    @classmethod
+    def load(cls, path: str = "") -> "FieldPolicy":
+        """
+        默认策略，再叠加 path 指向的 JSON（可选）：
+            {"ip": ["peer_addr"], "keep": ["msg_id"], "scan": ["service"], "default": "scan"}
+        """
+        policy = cls.defaults()
+        if not path:
+            return policy
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for action, names in data.items():
+            if action == "default":
+                if names not in ACTIONS:
+                    raise ValueError(f"unknown default action: {names!r}")
+                policy.default = names
+                continue
+            if action not in ACTIONS:
+                raise ValueError(f"unknown field action: {action!r}")
+            policy.update(action, names)
+        return policy
+
+    def update(self, action: str, names: Iterable[str]) -> None:
+        for n in names:
+            self.actions[n.lower()] = action
+
+    def action(self, key: str) -> str:
+        a = self.actions.get(key)
+        if a is None:
+            a = self.actions.get(key.lower(), self.default)
+        return a
@@ -6,6 +6,8 @@ import traceback
 from pathlib import Path
 from typing import Iterator
 
+from tools.kv_fields import parse_kv
+
 
 # ✅ 改成你的真实日志文件路径
 LOG_FILE = Path("/Users/hongyi.ou01/Downloads/ForwardTrafficLog-memory-2025-12-24T19_18_49.841176.log")
@@ -14,6 +16,9 @@ API_URL = "http://127.0.0.1:8000/api/events/ingest"
 REPLAY_LAST_LINES = 200          # 启动时回放最后 N 行
 POLL_INTERVAL = 0.3              # tail 轮询间隔（秒）
 
+# 复用 TCP 连接（keep-alive），避免每行一次握手
+SESSION = requests.Session()
+
 
 def fingerprint(kv: dict) -> str:
     # 聚合指纹：别包含 action / time，避免“看起来一样但聚合不了”
@@ -27,16 +32,6 @@ def fingerprint(kv: dict) -> str:
     return hashlib.sha1(raw.encode()).hexdigest()[:16]
 
 
-def parse_kv(line: str) -> dict:
-    kv = {}
-    for item in line.strip().split():
-        if "=" not in item:
-            continue
-        k, v = item.split("=", 1)
-        kv[k] = v.strip('"')
-    return kv
-
-
 def build_event(line: str) -> dict:
     kv = parse_kv(line)
 
@@ -112,7 +107,7 @@ def iter_tail(path: Path, replay_last: int) -> Iterator[str]:
 
 
 def post_events(batch: list[dict]) -> None:
-    r = requests.post(API_URL, json=batch, timeout=5)
+    r = SESSION.post(API_URL, json=batch, timeout=5)
     print(f"📡 POST {r.status_code} inserted? {r.text[:200]}")
     r.raise_for_status()
 
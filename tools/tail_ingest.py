@@ -5,12 +5,17 @@ import os
 import time
 import json
 import re
+import gzip
 import hashlib
-from dataclasses import dataclass
+import socket
+import zlib
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, Any, List
 
 import requests
+from app.ingest.stream import StreamClient
+from tools.cidr_trie import parse_cidr_list
 from tools.desensitizer import Desensitizer, DesensitizeConfig
 
 # ============================================================
@@ -25,6 +30,10 @@ LOG_PATH = os.environ.get("RSYSLOG_REMOTE_LOG", "/opt/homebrew/var/log/rsyslog-r
 EVENT_API_URL = os.environ.get("OPS_EVENT_API", "http://127.0.0.1:8000/api/ingest/syslog")
 EVIDENCE_API_URL = os.environ.get("OPS_EVIDENCE_API", "http://127.0.0.1:8000/api/evidence/ingest")
 
+# 批量接口（默认在单条接口后加 /batch）
+EVENT_BATCH_API_URL = os.environ.get("OPS_EVENT_BATCH_API", EVENT_API_URL.rstrip("/") + "/batch")
+EVIDENCE_BATCH_API_URL = os.environ.get("OPS_EVIDENCE_BATCH_API", EVIDENCE_API_URL.rstrip("/") + "/batch")
+
 STATE_PATH = os.environ.get("TAIL_STATE_PATH", os.path.join(DATA_DIR, "tail_ingest.state.json"))
 
 # 可选：将“原始明文”仅落本机文件（不进 API/DB）
@@ -39,6 +48,19 @@ DESENSE_SECRET = os.environ.get("OPS_DESENSE_SECRET", "")
 DESENSE_REVERSIBLE = os.environ.get("DESENSITIZE_REVERSIBLE", "0").lower() in ("1", "true", "yes")
 DESENSE_MAP_PATH = os.environ.get("DESENSITIZE_MAP_PATH", os.path.join(DATA_DIR, "desensitize_map.json"))
 KEEP_PRIVATE_RANGES = os.environ.get("KEEP_PRIVATE_RANGES", "0").lower() in ("1", "true", "yes")
+# token map journal：group-commit 间隔（秒，崩溃最多丢这么久的新 token）、多少行后压缩进 snapshot
+DESENSE_COMMIT_INTERVAL = float(os.environ.get("DESENSITIZE_COMMIT_INTERVAL", "1"))
+DESENSE_COMPACT_EVERY = int(os.environ.get("DESENSITIZE_COMPACT_EVERY", "100000"))
+# 有界内存：正向 map 只留 LRU 热数据；reversible 的 token -> raw 落 sqlite 冷存储（0 = 全量常驻 + journal）
+DESENSE_MAP_CACHE = int(os.environ.get("DESENSITIZE_MAP_CACHE", "200000"))
+DESENSE_REV_CACHE = int(os.environ.get("DESENSITIZE_REV_CACHE", "50000"))
+DESENSE_COLD_PATH = os.environ.get("DESENSITIZE_COLD_PATH", "")
+# 按字段名脱敏 kv 行（FortiGate srcip=… 等）；策略文件见 tools/kv_fields.py
+DESENSE_FIELD_AWARE = os.environ.get("DESENSITIZE_FIELD_AWARE", "1").lower() not in ("0", "false", "no")
+DESENSE_FIELD_POLICY = os.environ.get("DESENSITIZE_FIELD_POLICY", "")
+# 保留名单：逗号分隔的 CIDR，和/或一行一个 CIDR 的文件；名单里的地址不脱敏
+DESENSE_ALLOW_CIDRS = parse_cidr_list(os.environ.get("DESENSITIZE_ALLOW_CIDRS", ""))
+DESENSE_ALLOW_CIDRS_FILE = os.environ.get("DESENSITIZE_ALLOW_CIDRS_FILE", "")
 
 # ============================================================
 # Networking (requests)
@@ -47,6 +69,29 @@ HTTP_TIMEOUT = float(os.environ.get("INGEST_HTTP_TIMEOUT", "3"))
 RETRY_MAX = int(os.environ.get("INGEST_RETRY_MAX", "3"))
 RETRY_BACKOFF = float(os.environ.get("INGEST_RETRY_BACKOFF", "0.3"))
 
+# 请求体压缩（跨 WAN 时建议开）：gzip | deflate | 空=不压缩；小于 COMPRESS_MIN 字节的 body 不压
+COMPRESS = os.environ.get("INGEST_COMPRESS", "").lower()
+COMPRESS_MIN = int(os.environ.get("INGEST_COMPRESS_MIN", "1024"))
+COMPRESS_LEVEL = int(os.environ.get("INGEST_COMPRESS_LEVEL", "6"))
+
+# 传输方式：http（默认，batch 接口）| stream（长连接 Unix socket/TCP 帧流，需 API 侧 STREAM_LISTEN）
+TRANSPORT = os.environ.get("INGEST_TRANSPORT", "http").lower()
+STREAM_ADDR = os.environ.get("INGEST_STREAM_ADDR", "unix:" + os.path.join(DATA_DIR, "ingest.sock"))
+STREAM_WINDOW = int(os.environ.get("INGEST_STREAM_WINDOW", "1024"))
+
+# 批量：攒够 BATCH_SIZE 行，或第一行进 batch 起超过 BATCH_MAX_WAIT 秒，就 flush 一次
+# BATCH_SIZE<=1 退回逐行 POST 单条接口（旧行为）
+BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "200"))
+BATCH_MAX_WAIT = float(os.environ.get("INGEST_BATCH_MAX_WAIT", "0.5"))
+
+# bytes 模式：二进制大块读文件、memoryview 切行，解析/脱敏/分类都在 bytes 上做，
+# 只有要发出去的字段（host/msg/title...）才 decode；INGEST_BYTES_MODE=0 退回逐行文本模式
+BYTES_MODE = os.environ.get("INGEST_BYTES_MODE", "1").lower() not in ("0", "false", "no")
+READ_CHUNK = int(os.environ.get("INGEST_READ_CHUNK", str(1024 * 1024)))
+
+# record_key 前缀：区分不同机器上的 ingester（inode 只在单机单文件系统内唯一）
+SOURCE_ID = os.environ.get("INGEST_SOURCE_ID", socket.gethostname())
+
 # ============================================================
 # Regex
 # ============================================================
@@ -69,14 +114,31 @@ MAC_FLAP_RE = re.compile(
     re.IGNORECASE
 )
 
+def _bytes_re(rx: "re.Pattern[str]") -> "re.Pattern[bytes]":
+    return re.compile(rx.pattern.encode(), rx.flags & re.IGNORECASE)
+
+LINE_RE_B = _bytes_re(LINE_RE)
+LINK_RE_B = _bytes_re(LINK_RE)
+MAC_FLAP_RE_B = _bytes_re(MAC_FLAP_RE)
+
 # quick “source” detector for evidence
 FORTI_HINT = ("fortigate", "fg-", "utm", "traffic", "appid", "policyid", "vd=", "srcip=", "dstip=")
 AD_HINT = ("kerberos", "ntlm", "eventid", "4624", "4625", "4768", "4771", "ldap")
 VPN_HINT = ("vpn", "ssl vpn", "ipsec", "ike", "tunnel", "login", "logout")
 UEBA_HINT = ("ueba", "risk", "behavior", "anomaly", "impossible travel")
 
+SOURCE_HINTS_B = [
+    (name, tuple(x.encode() for x in host_hints), tuple(x.encode() for x in msg_hints))
+    for name, host_hints, msg_hints in (
+        ("fortigate", ("forti", "fg", "fortigate"), FORTI_HINT),
+        ("ad", ("ad", "dc", "domain"), AD_HINT),
+        ("vpn", ("vpn", "ssl", "ipsec"), VPN_HINT),
+        ("ueba", ("ueba", "behavior"), UEBA_HINT),
+    )
+]
+
 # ============================================================
-# State (inode + offset)
+# State (inode + offset + generation)
 # ============================================================
 
 @dataclass
@@ -85,6 +147,8 @@ class TailState:
     inode: int
     offset: int
     updated_at: str
+    # 每次 offset 作废重来（inode 变了 / 文件被截短）就 +1；进 record_key，新文件里重复出现的 offset 不会撞上旧行的 key
+    generation: int = 0
 
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
@@ -101,7 +165,7 @@ def _file_size(path: str) -> int:
 def load_state() -> TailState:
     """
     兼容：
-    - 新版 JSON state: {"path":..., "inode":..., "offset":...}
+    - 新版 JSON state: {"path":..., "inode":..., "offset":..., "generation":...}（没有 generation 的按 0）
     - 旧版纯 offset 文件：内容是整数
     """
     if not os.path.exists(STATE_PATH):
@@ -121,6 +185,7 @@ def load_state() -> TailState:
             inode=int(data.get("inode", 0)),
             offset=int(data.get("offset", 0)),
             updated_at=data.get("updated_at", utc_now_iso()),
+            generation=int(data.get("generation", 0)),
         )
     except Exception:
         return TailState(path=LOG_PATH, inode=0, offset=0, updated_at=utc_now_iso())
@@ -153,6 +218,15 @@ def build_desensitizer() -> Optional[Desensitizer]:
         reversible=DESENSE_REVERSIBLE,
         mapping_path=DESENSE_MAP_PATH,
         keep_private_ranges=KEEP_PRIVATE_RANGES,
+        commit_interval_s=DESENSE_COMMIT_INTERVAL,
+        compact_every=DESENSE_COMPACT_EVERY,
+        map_cache_size=DESENSE_MAP_CACHE,
+        rev_cache_size=DESENSE_REV_CACHE,
+        cold_store_path=DESENSE_COLD_PATH,
+        field_aware=DESENSE_FIELD_AWARE,
+        field_policy_path=DESENSE_FIELD_POLICY,
+        allow_cidrs=DESENSE_ALLOW_CIDRS,
+        allow_cidrs_path=DESENSE_ALLOW_CIDRS_FILE,
     )
     print(f"[tail_ingest] desensitize enabled reversible={DESENSE_REVERSIBLE} map={DESENSE_MAP_PATH}")
     return Desensitizer(cfg)
@@ -275,33 +349,335 @@ def classify_as_event(msg_masked: str, host_masked: str) -> Optional[Tuple[str,
     # -----------------------------
     return None
 
+# ============================================================
+# Bytes mode (same rules as above, on undecoded bytes)
+# ============================================================
+
+def parse_syslog_line_bytes(line: Any) -> Tuple[bytes, str, bytes]:
+    """parse_syslog_line 的 bytes 版：(host, program, msg)，program 只有 "syslog"/"rsyslog" 两种，直接给 str。"""
+    # line 可以是 memoryview：不整行复制，用 endpos 去掉行尾换行，只有匹配出的分组才是新 bytes
+    end = len(line)
+    while end and line[end - 1] in (10, 13):
+        end -= 1
+    m = LINE_RE_B.match(line, 0, end)
+    if not m:
+        return b"unknown", "rsyslog", bytes(line[:end])
+    rest = m.group("rest")
+    if b": " in rest:
+        left, right = rest.split(b": ", 1)
+        return left.split()[-1], "syslog", right.strip()
+    return b"unknown", "syslog", rest
+
+def detect_source_bytes(host_masked: bytes, msg_masked: bytes) -> str:
+    h = host_masked.lower()
+    m = msg_masked.lower()
+    for name, host_hints, msg_hints in SOURCE_HINTS_B:
+        if any(x in h for x in host_hints) or any(x in m for x in msg_hints):
+            return name
+    return "syslog"
+
+def classify_as_event_bytes(msg_b: bytes, host: str, msg: str) -> Optional[Tuple[str, str, str]]:
+    """
+    classify_as_event 的 bytes 版：规则匹配在 msg_b 上做，title/fingerprint 用已解码的 host/msg
+    （这两个字段本来就要发出去，解码不是额外开销）。
+    """
+    if b"%%01SHELL/" in msg_b and b"DISPLAY_CMDRECORD" in msg_b:
+        return "SHELL_CMD", f"{host} DISPLAY_CMDRECORD", stable_fingerprint(f"SHELL_CMD|{host}|{msg[:200]}")
+
+    if b"%%10SHELL/" in msg_b:
+        return None
+
+    m = MAC_FLAP_RE_B.search(msg_b)
+    if m:
+        mac, p1, p2 = (m.group(k).decode("utf-8", errors="replace") for k in ("mac", "p1", "p2"))
+        return "L2/MAC_FLAPPING", f"MAC_FLAPPING {mac} {p1}<->{p2}", stable_fingerprint(f"MAC_FLAPPING|{mac}|{p1}|{p2}")
+
+    m = LINK_RE_B.search(msg_b)
+    if m:
+        intf = m.group("intf").decode("utf-8", errors="replace")
+        state = m.group("state").decode("ascii").lower()
+        return "SWITCH_LINK", f"{host} {intf} link {state}", stable_fingerprint(f"LINK|{host}|{intf}|{state}")
+
+    return None
+
 # ============================================================
 # HTTP
 # ============================================================
 
-def post_json(url: str, payload: Dict[str, Any]) -> None:
-    r = requests.post(
-        url,
-        headers={"Content-Type": "application/json"},
-        data=json.dumps(payload, ensure_ascii=False),
-        timeout=HTTP_TIMEOUT,
-    )
+# keep-alive：所有 POST 共用一个连接池
+SESSION = requests.Session()
+
+def encode_body(payload: Any) -> Tuple[bytes, Dict[str, str]]:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if COMPRESS in ("gzip", "deflate") and len(body) >= COMPRESS_MIN:
+        if COMPRESS == "gzip":
+            body = gzip.compress(body, compresslevel=COMPRESS_LEVEL, mtime=0)
+        else:
+            body = zlib.compress(body, COMPRESS_LEVEL)
+        headers["Content-Encoding"] = COMPRESS
+    return body, headers
+
+def post_json(url: str, payload: Any) -> requests.Response:
+    body, headers = encode_body(payload)
+    r = SESSION.post(url, headers=headers, data=body, timeout=HTTP_TIMEOUT)
     r.raise_for_status()
+    return r
+
+def retry_delay(ex: Exception, attempt: int) -> float:
+    # API 队列满时返回 429 + Retry-After：按服务端建议退避
+    resp = getattr(ex, "response", None)
+    if resp is not None and resp.status_code == 429:
+        try:
+            return float(resp.headers.get("Retry-After") or 1)
+        except ValueError:
+            return 1.0
+    return RETRY_BACKOFF * (attempt + 1)
+
+def permanent_status(ex: Exception) -> Optional[int]:
+    """4xx（429 除外）= 这份数据本身被拒，重试多少次结果都一样：返回状态码；可重试的（超时/5xx/429）返回 None。"""
+    resp = getattr(ex, "response", None)
+    code = resp.status_code if resp is not None else None
+    if code is not None and 400 <= code < 500 and code != 429:
+        return code
+    return None
 
 def post_with_retry(url: str, payload: Dict[str, Any]) -> bool:
+    """True = 已送达或永久被拒（打日志丢弃，offset 照常前移）；False = 重试用完仍是传输层失败。"""
     for i in range(RETRY_MAX):
         try:
             post_json(url, payload)
             return True
+        except Exception as ex:
+            code = permanent_status(ex)
+            if code is not None:
+                print(f"[tail_ingest] WARN record rejected by {url} (HTTP {code}), skipped: {ex}")
+                return True
+            time.sleep(retry_delay(ex, i))
+    return False
+
+def post_batch_with_retry(url: str, records: List[Dict[str, Any]]) -> bool:
+    """
+    POST 一批记录到 /batch 接口。
+    只对传输层失败（超时/连接错误/5xx/429）重试；4xx 是这批数据本身的问题，重试也不会好：
+    - 413（body 太大）：对半拆开分别发，拆到单条仍 413 就丢掉这一条
+    - 其余 4xx：打日志丢掉这一批
+    单条记录被拒（坏数据）只打日志。返回 True = 这批已处理完（送达或丢弃），调用方可以前移 offset。
+    """
+    if not records:
+        return True
+    for i in range(RETRY_MAX):
+        try:
+            r = post_json(url, records)
+        except Exception as ex:
+            code = permanent_status(ex)
+            if code == 413 and len(records) > 1:
+                mid = len(records) // 2
+                return post_batch_with_retry(url, records[:mid]) and post_batch_with_retry(url, records[mid:])
+            if code is not None:
+                print(f"[tail_ingest] WARN {len(records)} records rejected by {url} (HTTP {code}), skipped: {ex}")
+                return True
+            time.sleep(retry_delay(ex, i))
+            continue
+        try:
+            rejected = int(r.json().get("rejected") or 0)
         except Exception:
-            time.sleep(RETRY_BACKOFF * (i + 1))
+            rejected = 0
+        if rejected:
+            print(f"[tail_ingest] WARN {rejected}/{len(records)} records rejected by {url}")
+        return True
     return False
 
+# ============================================================
+# Payload / batching
+# ============================================================
+
+def build_payload(des: Optional[Desensitizer], line: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    一行 rsyslog 落盘 -> ("event"|"evidence", payload)
+    payload 结构与单条接口 /api/ingest/syslog、/api/evidence/ingest 一致（batch 接口逐条复用）。
+    """
+    host_raw, program_raw, msg_raw = parse_syslog_line(line)
+
+    # ============
+    # 关键：入口即脱敏
+    # ============
+    host_masked, host_stats = mask_text(des, host_raw)
+    msg_masked, msg_stats = mask_text(des, msg_raw)
+
+    # 合并统计
+    mask_stats: Dict[str, int] = {}
+    for d in (host_stats, msg_stats):
+        for k, v in d.items():
+            mask_stats[k] = mask_stats.get(k, 0) + int(v)
+
+    ts = utc_now_iso()
+
+    ev = classify_as_event(msg_masked, host_masked)
+
+    if ev is not None:
+        category, title, fingerprint = ev
+        return "event", {
+            "timestamp": ts,
+            "host": host_masked,
+            "program": program_raw,  # program 一般不敏感，但你也可以 mask_text
+            "msg": msg_masked,
+            "category": category,
+            "title": title,
+            "fingerprint": fingerprint,
+            "meta": {
+                "masked": bool(des),
+                "mask_stats": mask_stats,
+                "ingest": "tail_ingest",
+            },
+        }
+
+    source = detect_source(host_masked, msg_masked)
+    return "evidence", {
+        "timestamp": ts,
+        "host": host_masked,
+        "source": source,
+        "message": msg_masked,
+        "fields": {
+            "program": program_raw,
+            "masked": bool(des),
+            "mask_stats": mask_stats,
+            "fingerprint": stable_fingerprint(f"{host_masked}|{source}|{msg_masked[:200]}"),
+        },
+    }
+
+def build_payload_bytes(des: Optional[Desensitizer], line: Any) -> Tuple[str, Dict[str, Any]]:
+    """build_payload 的 bytes 版（line 为 bytes / memoryview）：输出的 payload 与文本模式一致。"""
+    host_b, program, msg_b = parse_syslog_line_bytes(line)
+
+    mask_stats: Dict[str, int] = {}
+    if des:
+        host_b, host_stats = des.desensitize_bytes(host_b)
+        msg_b, msg_stats = des.desensitize_bytes(msg_b)
+        for d in (host_stats, msg_stats):
+            for k, v in d.items():
+                mask_stats[k] = mask_stats.get(k, 0) + int(v)
+
+    # 只有要发出去的字段才解码
+    host_masked = host_b.decode("utf-8", errors="replace")
+    msg_masked = msg_b.decode("utf-8", errors="replace")
+    ts = utc_now_iso()
+
+    ev = classify_as_event_bytes(msg_b, host_masked, msg_masked)
+    if ev is not None:
+        category, title, fingerprint = ev
+        return "event", {
+            "timestamp": ts,
+            "host": host_masked,
+            "program": program,
+            "msg": msg_masked,
+            "category": category,
+            "title": title,
+            "fingerprint": fingerprint,
+            "meta": {
+                "masked": bool(des),
+                "mask_stats": mask_stats,
+                "ingest": "tail_ingest",
+            },
+        }
+
+    source = detect_source_bytes(host_b, msg_b)
+    return "evidence", {
+        "timestamp": ts,
+        "host": host_masked,
+        "source": source,
+        "message": msg_masked,
+        "fields": {
+            "program": program,
+            "masked": bool(des),
+            "mask_stats": mask_stats,
+            "fingerprint": stable_fingerprint(f"{host_masked}|{source}|{msg_masked[:200]}"),
+        },
+    }
+
+@dataclass
+class PendingBatch:
+    end_offset: int                     # batch 最后一行结束处的文件 offset
+    started_at: float = 0.0             # batch 第一行进入的时间
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    evidence: List[Dict[str, Any]] = field(default_factory=list)
+
+    def size(self) -> int:
+        return len(self.events) + len(self.evidence)
+
+def flush_batch(batch: PendingBatch, st: TailState) -> None:
+    """
+    发送当前 batch；送达（或被 API 以 4xx 永久拒绝、已打日志丢弃）后才把 state.offset 推进到 batch 末尾。
+    传输层失败则保留 batch 退避重试（不继续读新行），保证不丢、不乱序推进 offset。
+    """
+    backoff = 0.5
+    while True:
+        ok = post_batch_with_retry(EVENT_BATCH_API_URL, batch.events)
+        if ok:
+            batch.events = []
+            ok = post_batch_with_retry(EVIDENCE_BATCH_API_URL, batch.evidence)
+        if ok:
+            batch.evidence = []
+            break
+        print(f"[tail_ingest] batch flush failed, retry in {backoff:.1f}s (pending={batch.size()})")
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 10.0)
+
+    st.offset = batch.end_offset
+    st.updated_at = utc_now_iso()
+
+# ============================================================
+# Line readers
+# ============================================================
+
+class TextLineReader:
+    """旧的逐行文本读取：readline() -> (line, start_offset, end_offset)；EOF 返回 None。"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def readline(self) -> Optional[Tuple[str, int, int]]:
+        start = self.f.tell()
+        line = self.f.readline()
+        if not line:
+            return None
+        return line, start, self.f.tell()
+
+class BytesLineReader:
+    """
+    二进制大块读取（READ_CHUNK），在块里用 find(b"\n") + memoryview 切片切行，不逐行 decode、不调 tell()。
+    只返回完整的行：文件末尾还没写完换行的半行留在缓冲里，等下次追加后再出。
+    """
+
+    def __init__(self, f, offset: int, chunk_size: int = READ_CHUNK):
+        self.f = f
+        self.chunk_size = max(4096, chunk_size)
+        self._base = offset          # self._data[0] 对应的文件 offset
+        self._data = b""
+        self._view = memoryview(self._data)
+        self._pos = 0
+
+    def readline(self) -> Optional[Tuple[memoryview, int, int]]:
+        nl = self._data.find(b"\n", self._pos)
+        while nl < 0:
+            chunk = self.f.read(self.chunk_size)
+            if not chunk:
+                return None
+            rest = len(self._data) - self._pos
+            self._base += self._pos
+            self._data = self._data[self._pos:] + chunk
+            self._view = memoryview(self._data)
+            self._pos = 0
+            nl = self._data.find(b"\n", rest)
+        start = self._pos
+        self._pos = nl + 1
+        return self._view[start:self._pos], self._base + start, self._base + self._pos
+
 # ============================================================
 # RAW tap (optional, local-only)
 # ============================================================
 
-def raw_tap_write(line: str) -> None:
+def raw_tap_write(line: Any) -> None:
     if not RAW_TAP_ENABLE:
         return
     _safe_mkdir(os.path.dirname(RAW_TAP_PATH) or ".")
@@ -315,6 +691,8 @@ def raw_tap_write(line: str) -> None:
                 os.chmod(RAW_TAP_PATH, 0o600)
             except Exception:
                 pass
+        if not isinstance(line, str):
+            line = bytes(line).decode("utf-8", errors="replace")
         with open(RAW_TAP_PATH, "a", encoding="utf-8") as f:
             f.write(line if line.endswith("\n") else (line + "\n"))
     except Exception:
@@ -333,6 +711,9 @@ def main() -> None:
     print(f"[tail_ingest] state={STATE_PATH}")
     print(f"[tail_ingest] event_api={EVENT_API_URL}")
     print(f"[tail_ingest] evidence_api={EVIDENCE_API_URL}")
+    print(f"[tail_ingest] transport={TRANSPORT}" + (f" stream={STREAM_ADDR} window={STREAM_WINDOW}" if TRANSPORT == "stream" else ""))
+    print(f"[tail_ingest] batch_size={BATCH_SIZE} batch_max_wait={BATCH_MAX_WAIT}s")
+    print(f"[tail_ingest] bytes_mode={BYTES_MODE} read_chunk={READ_CHUNK}")
     print(f"[tail_ingest] raw_tap_enable={RAW_TAP_ENABLE} raw_tap_path={RAW_TAP_PATH}")
 
     des = build_desensitizer()
@@ -344,21 +725,30 @@ def main() -> None:
     st = load_state()
 
     # open file and resolve inode
-    with open(LOG_PATH, "r", encoding="utf-8", errors="replace") as f:
+    if BYTES_MODE:
+        f = open(LOG_PATH, "rb")
+    else:
+        f = open(LOG_PATH, "r", encoding="utf-8", errors="replace")
+    with f:
         cur_inode = _file_inode(LOG_PATH)
         st.path = LOG_PATH
 
-        # inode 不一致 => 说明可能 logrotate 或 state 旧，按“从末尾开始”更安全
+        # inode 不一致 => 说明可能 logrotate 或 state 旧，按“从末尾开始”更安全。
+        # offset 作废时 generation + 1：rotate-and-create 后 inode 可能被复用、copytruncate 后 inode 不变，
+        # 新内容会从小 offset 重新编号，不换代的话 record_key 会和窗口内已发过的行撞上、被 API 当重复丢掉
         if st.inode != 0 and st.inode != cur_inode:
             print("[tail_ingest] inode changed (logrotate). Reset offset=0")
             st.offset = 0
+            st.generation += 1
 
         st.inode = cur_inode
 
-        # offset 合法性
+        # offset 合法性：比文件还长 = 被截短过（copytruncate）
         end = f.seek(0, os.SEEK_END)
         if st.offset > end:
+            print("[tail_ingest] file shorter than offset (truncated). Reset offset=0")
             st.offset = 0
+            st.generation += 1
 
         # 默认行为：从 state offset 续读；若 state 是 0 则从末尾开始（避免灌历史）
         if st.offset == 0:
@@ -371,12 +761,30 @@ def main() -> None:
             f.seek(st.offset, os.SEEK_SET)
             print(f"[tail_ingest] resume offset={st.offset}")
 
+        reader = BytesLineReader(f, st.offset) if BYTES_MODE else TextLineReader(f)
+        build = build_payload_bytes if BYTES_MODE else build_payload
+
         last_save = time.time()
         fail_sleep = 0.0
+        batch = PendingBatch(end_offset=st.offset)
+        stream = StreamClient(STREAM_ADDR, window=STREAM_WINDOW, timeout=HTTP_TIMEOUT) if TRANSPORT == "stream" else None
 
         while True:
-            line = f.readline()
-            if not line:
+            item = reader.readline()
+            if item is None:
+                if stream is not None:
+                    # 空闲时收 ACK，按已确认位置推进 offset
+                    stream.poll()
+                    if stream.acked_offset is not None and stream.acked_offset != st.offset:
+                        st.offset = stream.acked_offset
+                        st.updated_at = utc_now_iso()
+                        save_state(st)
+                        last_save = time.time()
+                # 空闲时按时间 flush，保证低流量下也不会一直攒着
+                if batch.size() and time.time() - batch.started_at >= BATCH_MAX_WAIT:
+                    flush_batch(batch, st)
+                    save_state(st)
+                    last_save = time.time()
                 time.sleep(0.1)
                 continue
 
@@ -384,70 +792,47 @@ def main() -> None:
                 time.sleep(fail_sleep)
                 fail_sleep = 0.0
 
+            line, line_start, line_end = item
+
             # 仅本机可选留一份明文（不会进 API）
             raw_tap_write(line)
 
-            host_raw, program_raw, msg_raw = parse_syslog_line(line)
-
-            # ============
-            # 关键：入口即脱敏
-            # ============
-            host_masked, host_stats = mask_text(des, host_raw)
-            msg_masked, msg_stats = mask_text(des, msg_raw)
-
-            # 合并统计
-            mask_stats: Dict[str, int] = {}
-            for d in (host_stats, msg_stats):
-                for k, v in d.items():
-                    mask_stats[k] = mask_stats.get(k, 0) + int(v)
-
-            ts = utc_now_iso()
-
-            ev = classify_as_event(msg_masked, host_masked)
-
-            ok = False
-            if ev is not None:
-                category, title, fingerprint = ev
-                payload = {
-                    "timestamp": ts,
-                    "host": host_masked,
-                    "program": program_raw,  # program 一般不敏感，但你也可以 mask_text
-                    "msg": msg_masked,
-                    "category": category,
-                    "title": title,
-                    "fingerprint": fingerprint,
-                    "meta": {
-                        "masked": bool(des),
-                        "mask_stats": mask_stats,
-                        "ingest": "tail_ingest",
-                    },
-                }
-                ok = post_with_retry(EVENT_API_URL, payload)
-            else:
-                source = detect_source(host_masked, msg_masked)
-                payload = {
-                    "timestamp": ts,
-                    "host": host_masked,
-                    "source": source,
-                    "message": msg_masked,
-                    "fields": {
-                        "program": program_raw,
-                        "masked": bool(des),
-                        "mask_stats": mask_stats,
-                        "fingerprint": stable_fingerprint(f"{host_masked}|{source}|{msg_masked[:200]}"),
-                    },
-                }
-                ok = post_with_retry(EVIDENCE_API_URL, payload)
-
-            if ok:
-                st.offset = f.tell()
-                st.updated_at = utc_now_iso()
+            kind, payload = build(des, line)
+            # 稳定记录 key：同一行无论重试/重发多少次都一样，API 侧据此去重
+            payload["record_key"] = f"{SOURCE_ID}:{st.inode}:{st.generation}:{line_start}"
+
+            if stream is not None:
+                stream.send(kind, payload, line_end)
+                if stream.acked_offset is not None and time.time() - last_save > 1.0:
+                    st.offset = stream.acked_offset
+                    st.updated_at = utc_now_iso()
+                    save_state(st)
+                    last_save = time.time()
+                continue
+
+            if BATCH_SIZE <= 1:
+                url = EVENT_API_URL if kind == "event" else EVIDENCE_API_URL
+                if post_with_retry(url, payload):
+                    st.offset = line_end
+                    st.updated_at = utc_now_iso()
+                    if time.time() - last_save > 1.0:
+                        save_state(st)
+                        last_save = time.time()
+                else:
+                    # 不前移 offset，避免丢；稍微退避
+                    fail_sleep = 0.5
+                continue
+
+            if not batch.events and not batch.evidence:
+                batch.started_at = time.time()
+            (batch.events if kind == "event" else batch.evidence).append(payload)
+            batch.end_offset = line_end
+
+            if batch.size() >= BATCH_SIZE or time.time() - batch.started_at >= BATCH_MAX_WAIT:
+                flush_batch(batch, st)
                 if time.time() - last_save > 1.0:
                     save_state(st)
                     last_save = time.time()
-            else:
-                # 不前移 offset，避免丢；稍微退避
-                fail_sleep = 0.5
 
 
 if __name__ == "__main__":
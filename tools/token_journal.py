@@ -0,0 +1,208 @@
+# tools/token_journal.py
+"""
+Desensitizer token map 的持久化：snapshot + append-only journal。
+
+    <mapping_path>            snapshot，紧凑 JSON：{"map": {raw: token}, "rev": {token: raw}}（兼容旧格式）
+    <mapping_path>.journal    追加日志，每行一个 [raw, token]（JSON 数组）
+
+- 写：append() 只进内存缓冲（O(1)），后台线程每 commit_interval 秒把缓冲一次性写入 + fsync（group commit）
+  -> 崩溃最多丢最后一个 commit 间隔内的新 token（token 由 HMAC 决定，丢了下次再算出来也一样，
+     只影响 reversible 模式下这段时间的 token -> raw 反查）
+- 压缩：journal 超过 compact_every 行时，把 journal 轮转成 .journal.old、写新 snapshot（tmp + fsync + rename）、
+  再删 .journal.old；中途崩溃重启时 .journal.old 会被重放，不丢
+- 读：启动时 load() = snapshot + .journal.old + .journal 依次重放（重放幂等）；最后一行写了一半就跳过
+- 单进程：start() 对 <mapping_path>.lock 加 flock，拿不到（另一个进程已经在写同一个 map）就只读加载、不写盘，
+  避免两个进程互相覆盖 snapshot；多进程共享请用有界模式的 sqlite 存储（tools/token_store.py）
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有 flock，不做多进程保护
+    fcntl = None  # type: ignore
+
+TokenMaps = Tuple[Dict[str, str], Dict[str, str]]
+
+
+class TokenJournal:
+    def __init__(
+        self,
+        snapshot_path: str,
+        *,
+        reversible: bool = False,
+        commit_interval: float = 1.0,
+        compact_every: int = 100_000,
+        snapshot_source: Optional[Callable[[], TokenMaps]] = None,
+    ):
+        self.snapshot_path = snapshot_path
+        self.journal_path = snapshot_path + ".journal"
+        self.old_journal_path = snapshot_path + ".journal.old"
+        self.reversible = reversible
+        self.commit_interval = max(0.01, commit_interval)
+        self.compact_every = max(1, compact_every)
+        # 压缩时取当前全量 map 的回调（由 Desensitizer 提供，返回副本）
+        self.snapshot_source = snapshot_source
+
+        self._buf: List[Tuple[str, str]] = []
+        self._lock = threading.Lock()          # 保护 _buf
+        self._io_lock = threading.Lock()       # 串行化 commit / compact 的文件操作
+        self._journal_lines = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock_file = None
+        self.read_only = False
+
+        self.stats: Dict[str, int] = {"appended": 0, "commits": 0, "compactions": 0, "replayed": 0, "torn_lines": 0}
+
+    # ---------- load ----------
+    def load(self) -> TokenMaps:
+        mp: Dict[str, str] = {}
+        rev: Dict[str, str] = {}
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                mp = data.get("map", {}) or {}
+                rev = data.get("rev", {}) or {}
+            except Exception:
+                pass
+        self._replay(self.old_journal_path, mp, rev)
+        self._journal_lines = self._replay(self.journal_path, mp, rev)
+        self._truncate_torn_tail()
+        return mp, rev
+
+    def _truncate_torn_tail(self) -> None:
+        """崩溃时最后一行可能只写了一半：截掉，否则下一次追加会和它粘成一行。"""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if not size:
+                return
+            f.seek(max(0, size - 65536))
+            tail = f.read()
+            if tail.endswith(b"\n"):
+                return
+            nl = tail.rfind(b"\n")
+            f.truncate(size - len(tail) + nl + 1 if nl >= 0 else 0)
+
+    def _replay(self, path: str, mp: Dict[str, str], rev: Dict[str, str]) -> int:
+        if not os.path.exists(path):
+            return 0
+        n = 0
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                try:
+                    raw, token = json.loads(line)
+                except Exception:
+                    self.stats["torn_lines"] += 1
+                    continue
+                mp[raw] = token
+                if self.reversible:
+                    rev[token] = raw
+                n += 1
+        self.stats["replayed"] += n
+        return n
+
+    # ---------- write ----------
+    def start(self) -> None:
+        d = os.path.dirname(self.snapshot_path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        if not self._acquire_owner_lock():
+            self.read_only = True
+            print(
+                f"[token_journal] WARN {self.snapshot_path} is owned by another process; loaded read-only, "
+                "new tokens will not be persisted (set DESENSITIZE_MAP_CACHE>0 to share a sqlite store instead)"
+            )
+            return
+        self._thread = threading.Thread(target=self._run, name="token-journal", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _acquire_owner_lock(self) -> bool:
+        if fcntl is None:
+            return True
+        f = open(self.snapshot_path + ".lock", "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f  # 进程退出时随文件描述符一起释放
+        return True
+
+    def append(self, raw: str, token: str) -> None:
+        if self.read_only:
+            return
+        with self._lock:
+            self._buf.append((raw, token))
+            self.stats["appended"] += 1
+
+    def commit(self) -> None:
+        """把缓冲写进 journal 并 fsync（后台线程周期调用；close() 时也会调一次）。"""
+        if self.read_only:
+            return
+        with self._lock:
+            buf, self._buf = self._buf, []
+        if not buf:
+            return
+        data = "".join(json.dumps(e, ensure_ascii=False, separators=(",", ":")) + "\n" for e in buf)
+        with self._io_lock:
+            try:
+                with open(self.journal_path, "a", encoding="utf-8") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except Exception as ex:
+                # 写失败：放回缓冲，下个周期重试
+                print(f"[token_journal] commit failed: {ex}")
+                with self._lock:
+                    self._buf[:0] = buf
+                return
+            self._journal_lines += len(buf)
+            self.stats["commits"] += 1
+
+    def compact(self) -> None:
+        if self.snapshot_source is None or self.read_only:
+            return
+        with self._io_lock:
+            # 1) 轮转 journal：之后的 commit 写新文件
+            #    （上次压缩中途崩溃留下的 .journal.old 还没进 snapshot，不能被覆盖：这次先不轮转）
+            if os.path.exists(self.journal_path) and not os.path.exists(self.old_journal_path):
+                os.replace(self.journal_path, self.old_journal_path)
+                self._journal_lines = 0
+            # 2) 全量 map（包含 .journal.old 里的所有条目）写新 snapshot
+            mp, rev = self.snapshot_source()
+            tmp = self.snapshot_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"map": mp, "rev": rev}, f, ensure_ascii=False, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.snapshot_path)
+            # 3) snapshot 落盘后旧 journal 才能删
+            if os.path.exists(self.old_journal_path):
+                os.unlink(self.old_journal_path)
+            self.stats["compactions"] += 1
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.commit_interval + 5)
+        self.commit()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.commit_interval):
+            self.commit()
+            if self._journal_lines >= self.compact_every:
+                try:
+                    self.compact()
+                except Exception as ex:
+                    print(f"[token_journal] compaction failed: {ex}")
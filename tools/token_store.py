@@ -0,0 +1,199 @@
+# tools/token_store.py
+"""
+Desensitizer 的有界内存 token map：热数据 LRU + 冷数据落盘（sqlite）。
+
+token 是 HMAC(raw) 算出来的，正向 raw -> token 不需要持久化：LRU 未命中就重新算一次（~1us）。
+真正需要落盘的只有 reversible 模式下的反向 token -> raw：
+
+- LRUCache        : 带容量上限的 OrderedDict，记 hits / misses / evictions
+- SqliteRevStore  : token -> raw 的冷存储；新 token 先进内存缓冲，后台线程每 commit_interval 秒
+                    一个事务 INSERT OR IGNORE 批量写入（group commit），崩溃最多丢一个间隔
+
+多进程共享：API 和各个 ingester 指向同一个 sqlite 文件即可（WAL：读不阻塞写，写之间靠 busy_timeout 排队）。
+- 同一个 raw 在哪个进程里算出来的 token 都一样（同一个 secret），INSERT OR IGNORE 天然幂等
+- meta 表记录 secret 的指纹：用不同 secret 的进程打开同一个库直接报错，不会写进一套对不上的 token
+- 10 位 hex 的 token 理论上会撞：同一个 token 对应到不同 raw 时计入 collisions 并打印告警（先写入的为准）
+- 别的进程新写的 token 最多晚一个 commit_interval 可见
+"""
+from __future__ import annotations
+
+import atexit
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+class LRUCache:
+    def __init__(self, capacity: int):
+        self.capacity = max(1, int(capacity))
+        self._d: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        v = self._d.get(key)
+        if v is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            self._d.move_to_end(key)
+        except KeyError:
+            # 另一个线程刚好把它淘汰了，值已经拿到，无所谓
+            pass
+        return v
+
+    def __setitem__(self, key: str, value: str) -> None:
+        d = self._d
+        d[key] = value
+        while len(d) > self.capacity:
+            try:
+                d.popitem(last=False)
+            except KeyError:
+                break
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._d)
+
+    def snapshot(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._d),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+        }
+
+
+class SqliteRevStore:
+    def __init__(self, path: str, commit_interval: float = 1.0, key_id: str = "", busy_timeout: float = 10.0):
+        self.path = path
+        self.commit_interval = max(0.01, commit_interval)
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS rev (token TEXT PRIMARY KEY, raw TEXT NOT NULL) WITHOUT ROWID")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT NOT NULL) WITHOUT ROWID")
+        self._db_lock = threading.Lock()
+        if key_id:
+            self._check_key_id(key_id)
+
+        self._pending: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats: Dict[str, int] = {
+            "puts": 0, "commits": 0, "committed_rows": 0, "lookups": 0, "lookup_hits": 0, "collisions": 0,
+        }
+
+    def _check_key_id(self, key_id: str) -> None:
+        """第一个打开库的进程写入 secret 指纹；之后的进程必须一致。"""
+        with self._db_lock:
+            self._conn.execute("INSERT OR IGNORE INTO meta (k, v) VALUES ('key_id', ?)", (key_id,))
+            row = self._conn.execute("SELECT v FROM meta WHERE k = 'key_id'").fetchone()
+        if row and row[0] != key_id:
+            raise ValueError(
+                f"token store {self.path} was written with a different OPS_DESENSE_SECRET; "
+                "all processes sharing it must use the same secret"
+            )
+
+    # ---------- lifecycle ----------
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="token-rev-store", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.commit_interval + 5)
+        self.commit()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.commit_interval):
+            self.commit()
+
+    # ---------- data ----------
+    def put(self, token: str, raw: str) -> None:
+        with self._lock:
+            self._pending[token] = raw
+            self.stats["puts"] += 1
+
+    def get(self, token: str) -> Optional[str]:
+        self.stats["lookups"] += 1
+        raw = self._pending.get(token)
+        if raw is None:
+            with self._db_lock:
+                row = self._conn.execute("SELECT raw FROM rev WHERE token = ?", (token,)).fetchone()
+            raw = row[0] if row else None
+        if raw is not None:
+            self.stats["lookup_hits"] += 1
+        return raw
+
+    def commit(self) -> None:
+        # 换缓冲和写库在同一把 _db_lock 里：get() 不会看到「缓冲里没有、库里也还没有」的中间态
+        with self._db_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                self._insert(pending.items())
+            except sqlite3.Error as ex:
+                # 写失败：放回缓冲，下个周期重试
+                print(f"[token_store] commit failed: {ex}")
+                with self._lock:
+                    pending.update(self._pending)
+                    self._pending = pending
+
+    def put_many(self, pairs: Iterable[Tuple[str, str]]) -> None:
+        """直接批量写入（迁移旧 map 用）。"""
+        with self._db_lock:
+            self._insert(pairs)
+
+    def _insert(self, pairs: Iterable[Tuple[str, str]]) -> None:
+        rows = list(pairs)
+        # BEGIN IMMEDIATE：一开始就拿写锁（多进程时在这里排队），避免读事务中途升级写锁失败
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO rev (token, raw) VALUES (?, ?)", rows)
+            inserted = self._conn.total_changes - before
+            if inserted < len(rows):
+                # 有行已经在库里（通常是别的进程刚写过同一个 raw）：确认不是 token 撞车
+                self._check_collisions(rows)
+        except sqlite3.Error:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+        self.stats["commits"] += 1
+        self.stats["committed_rows"] += inserted
+
+    def _check_collisions(self, rows: list) -> None:
+        for i in range(0, len(rows), 500):
+            chunk = dict(rows[i:i + 500])
+            q = "SELECT token, raw FROM rev WHERE token IN (%s)" % ",".join("?" * len(chunk))
+            for token, raw in self._conn.execute(q, list(chunk)):
+                if chunk[token] != raw:
+                    self.stats["collisions"] += 1
+                    print(f"[token_store] WARN token collision on {token}: keeping the first raw value")
+
+    def count(self) -> int:
+        with self._db_lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM rev").fetchone()[0])
+
+    def snapshot(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = dict(self.stats)
+        out["pending"] = len(self._pending)
+        out["path"] = self.path
+        return out